@@ -0,0 +1,103 @@
+"""Tiempo de arranque en frío: del proceso nuevo a la primera respuesta 200.
+
+Mide por separado:
+  * importación: ``import main`` en un intérprete nuevo,
+  * arranque: ``uvicorn main:app`` desde cero hasta que GET /api/ping
+    responde 200 (incluye el ciclo de vida completo del worker).
+
+Uso:
+    python bench/bench_arranque.py
+    python bench/bench_arranque.py --repeticiones 10 --maximo 2.5
+    python bench/bench_arranque.py --mongo-uri mongodb://localhost:27017
+
+Sin ``--mongo-uri`` no se crean índices y ninguna dependencia es crítica
+para /api/ping, así que se mide solo el arranque de la app. Con
+``--maximo`` el script falla si la mediana del arranque pasa de esos
+segundos; sirve para detectar regresiones en CI.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+API = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def entorno(mongo_uri):
+    env = dict(os.environ)
+    env.setdefault("PUSHER_APP_ID", "1")
+    env.setdefault("PUSHER_KEY", "bench")
+    env.setdefault("PUSHER_SECRET", "bench")
+    env.setdefault("PUSHER_CLUSTER", "mt1")
+    if mongo_uri:
+        env["MONGO_URI"] = mongo_uri
+    else:
+        env["MONGO_URI"] = "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=500"
+        env["MONGO_CREAR_INDICES"] = "0"
+        env["SALUD_CRITICAS"] = ""
+    return env
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def medir_importacion(env):
+    codigo = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=API, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def medir_arranque(env, limite=30.0):
+    puerto = puerto_libre()
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--log-level", "warning"],
+        cwd=API, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=1) as client:
+            while time.perf_counter() - inicio < limite:
+                if proceso.poll() is not None:
+                    raise SystemExit(f"❌ uvicorn terminó con código {proceso.returncode}")
+                try:
+                    if client.get(f"http://127.0.0.1:{puerto}/api/ping").status_code == 200:
+                        return time.perf_counter() - inicio
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise SystemExit(f"❌ Sin respuesta 200 en {limite:g}s")
+    finally:
+        proceso.terminate()
+        proceso.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--maximo", type=float, default=0, help="Segundos máximos (mediana del arranque)")
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+    env = entorno(args.mongo_uri)
+
+    importaciones = [medir_importacion(env) for _ in range(args.repeticiones)]
+    arranques = [medir_arranque(env) for _ in range(args.repeticiones)]
+    for nombre, tiempos in (("importación", importaciones), ("arranque", arranques)):
+        print(f"{nombre:<12} mediana {statistics.median(tiempos) * 1000:7.0f} ms   "
+              f"mín {min(tiempos) * 1000:7.0f} ms   máx {max(tiempos) * 1000:7.0f} ms")
+
+    if args.maximo and statistics.median(arranques) > args.maximo:
+        raise SystemExit(f"❌ El arranque tarda {statistics.median(arranques):.2f}s, más que {args.maximo:g}s")
+
+
+if __name__ == "__main__":
+    main()
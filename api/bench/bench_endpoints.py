@@ -0,0 +1,92 @@
+"""Benchmark de req/s para las rutas de lectura más usadas por la app.
+
+Uso:
+    python bench/bench_endpoints.py                      # en proceso, BD falsa
+    python bench/bench_endpoints.py --url http://localhost:10000 --user-id <id>
+
+En modo en proceso se usa ``crear_base_de_datos_falsa`` (requiere
+``mongomock-motor``) y se siembran un usuario y unos planes de ejemplo.
+Para comparar antes/después se ejecuta el mismo comando en ambos commits
+contra el mismo servidor.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def sembrar_datos():
+    from database import crear_base_de_datos_falsa, usar_base_de_datos
+
+    db = crear_base_de_datos_falsa()
+    usar_base_de_datos(db)
+    await db["plans"].insert_many([
+        {"name": f"P{precio}", "price": float(precio), "data_limit": f"{precio // 10} GB",
+         "validity_days": 30, "benefits": ["Redes sociales ilimitadas"]}
+        for precio in (50, 100, 150, 200, 300)
+    ])
+    resultado = await db["users"].insert_one({
+        "phone": "+525500000000", "password": "x", "name": "Bench",
+        "email": "bench@coppermobile.com", "balance": 0.0, "plan": "P50",
+    })
+    return str(resultado.inserted_id)
+
+
+async def medir(client, ruta, concurrencia, duracion):
+    latencias = []
+    errores = 0
+    fin = time.perf_counter() + duracion
+
+    async def trabajador():
+        nonlocal errores
+        while time.perf_counter() < fin:
+            t0 = time.perf_counter()
+            r = await client.get(ruta)
+            latencias.append(time.perf_counter() - t0)
+            if r.status_code >= 400:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    p99 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]
+    print(f"{ruta:<45} {len(latencias) / total:>10.1f} req/s  "
+          f"p50={statistics.median(latencias) * 1000:.2f}ms  p99={p99 * 1000:.2f}ms  errores={errores}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Servidor a medir; si se omite se usa la app en proceso")
+    parser.add_argument("--user-id", help="user_id existente para /api/auth/profile")
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--duracion", type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.url:
+        user_id = args.user_id
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        user_id = await sembrar_datos()
+        from main import app
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async with client:
+        rutas = ["/api/planes"]
+        if user_id:
+            rutas.append(f"/api/auth/profile/{user_id}")
+        for ruta in rutas:
+            await medir(client, ruta, args.concurrencia, args.duracion)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Latencia y tamaño de respuesta de /api/soporte/{user_id} según la antigüedad de la cuenta.
+
+Siembra N tickets para un mismo usuario y mide la primera página y una
+página profunda (recorriendo el cursor); ambas deberían costar lo mismo sin
+importar N. Al final recorre el historial completo y verifica que no se
+repite ni se pierde ningún ticket.
+
+Uso:
+    python bench/bench_historial.py --tickets 100 10000 50000
+    python bench/bench_historial.py --mongo-uri mongodb://localhost:27017 --tickets 10000 200000
+
+Sin ``--mongo-uri`` se usa mongomock, que no tiene índices y ordena la
+colección completa en cada consulta; para cifras representativas usar un
+Mongo local.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("PUSHER_APP_ID", "1")
+os.environ.setdefault("PUSHER_KEY", "bench")
+os.environ.setdefault("PUSHER_SECRET", "bench")
+os.environ.setdefault("PUSHER_CLUSTER", "mt1")
+
+USUARIO = "000000000000000000000001"
+
+
+async def sembrar(db, n):
+    await db["support_tickets"].delete_many({})
+    inicio = datetime.utcnow() - timedelta(days=365)
+    lote = []
+    for i in range(n):
+        # Varios tickets comparten segundo para ejercitar el desempate por _id
+        creado = (inicio + timedelta(seconds=i // 3)).isoformat()
+        lote.append({"userId": USUARIO, "issue": f"Ticket {i}", "status": "pendiente", "createdAt": creado})
+        if len(lote) == 10_000:
+            await db["support_tickets"].insert_many(lote)
+            lote = []
+    if lote:
+        await db["support_tickets"].insert_many(lote)
+
+
+async def medir(client, params, peticiones):
+    latencias, tamano = [], 0
+    for _ in range(peticiones):
+        t0 = time.perf_counter()
+        r = await client.get(f"/api/soporte/{USUARIO}", params=params)
+        latencias.append(time.perf_counter() - t0)
+        assert r.status_code == 200, r.text
+        tamano = len(r.content)
+    latencias.sort()
+    p99 = latencias[int(len(latencias) * 0.99) - 1]
+    return statistics.median(latencias), p99, tamano
+
+
+async def recorrer(client, limite):
+    vistos, cursor, paginas = set(), None, 0
+    while True:
+        params = {"limit": limite, "campos": "issue"}
+        if cursor:
+            params["cursor"] = cursor
+        r = (await client.get(f"/api/soporte/{USUARIO}", params=params)).json()
+        for t in r["tickets"]:
+            if t["issue"] in vistos:
+                raise SystemExit(f"❌ Ticket repetido: {t['issue']}")
+            vistos.add(t["issue"])
+        paginas += 1
+        cursor = r["next_cursor"]
+        if not cursor:
+            return len(vistos), paginas
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, nargs="+", default=[100, 10_000])
+    parser.add_argument("--limite", type=int, default=20)
+    parser.add_argument("--peticiones", type=int, default=50)
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    from database import crear_base_de_datos_falsa, usar_base_de_datos
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(args.mongo_uri)["CooperMobileBench"]
+    else:
+        db = crear_base_de_datos_falsa()
+    usar_base_de_datos(db)
+
+    from indices import asegurar_indices
+    from main import app
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await asegurar_indices(db)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for n in args.tickets:
+            await sembrar(db, n)
+
+            p50, p99, tamano = await medir(client, {"limit": args.limite}, args.peticiones)
+            print(f"{n:>8} tickets  primera página  p50={p50 * 1000:.2f}ms  p99={p99 * 1000:.2f}ms  {tamano} bytes")
+
+            # Cursor a la mitad del historial
+            cursor = None
+            for _ in range(n // 200):
+                params = {"limit": 100, "campos": "issue"}
+                if cursor:
+                    params["cursor"] = cursor
+                cursor = (await client.get(f"/api/soporte/{USUARIO}", params=params)).json()["next_cursor"]
+            if cursor:
+                p50, p99, tamano = await medir(client, {"limit": args.limite, "cursor": cursor}, args.peticiones)
+                print(f"{'':>8}          página profunda p50={p50 * 1000:.2f}ms  p99={p99 * 1000:.2f}ms  {tamano} bytes")
+
+            total, paginas = await recorrer(client, 100)
+            if total != n:
+                raise SystemExit(f"❌ El recorrido entregó {total} de {n} tickets")
+            print(f"{'':>8}          recorrido completo: {total} tickets en {paginas} páginas")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""Throughput de POST /api/consumo/ingesta (registros por segundo).
+
+Genera registros sintéticos y mide por separado:
+  * validación: validar_lineas / validar_columnas sin tocar la base,
+  * extremo a extremo: la petición completa contra la app (ASGI en proceso).
+
+Uso:
+    python bench/bench_ingesta.py --registros 200000
+    python bench/bench_ingesta.py --mongo-uri mongodb://localhost:27017 --registros 500000 --objetivo 50000
+
+Sin ``--mongo-uri`` se usa mongomock, cuyas inserciones son mucho más lentas
+que las de un Mongo real; la cifra de validación sí es representativa. Con
+``--objetivo`` el script falla si el extremo a extremo queda por debajo.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("PUSHER_APP_ID", "1")
+os.environ.setdefault("PUSHER_KEY", "bench")
+os.environ.setdefault("PUSHER_SECRET", "bench")
+os.environ.setdefault("PUSHER_CLUSTER", "mt1")
+os.environ.setdefault("CONSUMO_INGESTA_TOKEN", "bench")
+
+
+def generar(n, usuarios, semilla=7):
+    rnd = random.Random(semilla)
+    ids = [str(ObjectId()) for _ in range(usuarios)]
+    inicio = datetime(2026, 1, 1)
+    columnas = {"userId": [], "ts": [], "bytes": []}
+    for i in range(n):
+        columnas["userId"].append(rnd.choice(ids))
+        columnas["ts"].append((inicio + timedelta(seconds=i)).isoformat() + "Z")
+        columnas["bytes"].append(rnd.randint(0, 5_000_000))
+    lineas = [
+        json.dumps({"userId": u, "ts": t, "bytes": b}, separators=(",", ":"))
+        for u, t, b in zip(columnas["userId"], columnas["ts"], columnas["bytes"])
+    ]
+    ndjson = ("\n".join(lineas) + "\n").encode()
+    return ndjson, json.dumps(columnas, separators=(",", ":")).encode()
+
+
+def medir_validacion(ndjson, columnar, lote):
+    from ingesta import validar_columnas, validar_lineas
+
+    lineas = ndjson.splitlines()
+    t0 = time.perf_counter()
+    for i in range(0, len(lineas), lote):
+        validar_lineas(lineas[i:i + lote], i)
+    t_ndjson = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    validar_columnas(columnar)
+    t_columnas = time.perf_counter() - t0
+    return len(lineas) / t_ndjson, len(lineas) / t_columnas
+
+
+async def trozos(cuerpo, tamano=64 * 1024):
+    for i in range(0, len(cuerpo), tamano):
+        yield cuerpo[i:i + tamano]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registros", type=int, default=100_000)
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--objetivo", type=float, default=0, help="Registros/s mínimos extremo a extremo")
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    from database import crear_base_de_datos_falsa, usar_base_de_datos
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(args.mongo_uri)["CooperMobileBench"]
+    else:
+        db = crear_base_de_datos_falsa()
+    usar_base_de_datos(db)
+
+    from indices import asegurar_indices
+    from ingesta import CONSUMO_LOTE
+    from main import app
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await db["data_usage_events"].drop()
+    await asegurar_indices(db)
+
+    ndjson, columnar = generar(args.registros, args.usuarios)
+    print(f"{args.registros} registros: NDJSON {len(ndjson) / 1e6:.1f} MB, columnas {len(columnar) / 1e6:.1f} MB")
+
+    por_linea, por_columnas = medir_validacion(ndjson, columnar, CONSUMO_LOTE)
+    print(f"validación   NDJSON {por_linea:>10,.0f} reg/s   columnas {por_columnas:>10,.0f} reg/s")
+
+    peor = None
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        for nombre, cuerpo, tipo in (
+            ("NDJSON", trozos(ndjson), "application/x-ndjson"),
+            ("columnas", columnar, "application/json"),
+        ):
+            t0 = time.perf_counter()
+            r = await client.post("/api/consumo/ingesta", content=cuerpo, headers={"content-type": tipo, "x-ingesta-token": os.environ["CONSUMO_INGESTA_TOKEN"]})
+            duracion = time.perf_counter() - t0
+            resultado = r.json()
+            assert r.status_code == 200 and resultado["insertados"] == args.registros, resultado
+            tasa = args.registros / duracion
+            peor = tasa if peor is None else min(peor, tasa)
+            print(f"extremo a extremo {nombre:<9} {tasa:>10,.0f} reg/s  ({duracion:.2f}s)")
+
+    if args.objetivo and peor < args.objetivo:
+        raise SystemExit(f"❌ {peor:,.0f} reg/s está por debajo del objetivo de {args.objetivo:,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
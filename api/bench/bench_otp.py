@@ -0,0 +1,107 @@
+"""Latencia de /api/auth/send-otp según el número de códigos pendientes.
+
+Siembra N códigos (vencidos y vigentes) en la colección otp y mide
+send-otp; la latencia no debería crecer con N.
+
+Con ``--martillo N`` además lanza N validaciones simultáneas del mismo
+número y código, y falla si más de una resulta exitosa.
+
+Uso:
+    python bench/bench_otp.py --pendientes 0 1000 10000
+    python bench/bench_otp.py --pendientes 0 --martillo 200
+    python bench/bench_otp.py --mongo-uri mongodb://localhost:27017 --pendientes 0 100000 1000000
+
+Sin ``--mongo-uri`` se usa mongomock, que no tiene índices y recorre la
+colección en cada consulta; para cifras representativas usar un Mongo local.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("PUSHER_APP_ID", "1")
+os.environ.setdefault("PUSHER_KEY", "bench")
+os.environ.setdefault("PUSHER_SECRET", "bench")
+os.environ.setdefault("PUSHER_CLUSTER", "mt1")
+
+
+async def sembrar(db, n):
+    await db["otp"].delete_many({})
+    ahora = datetime.utcnow()
+    lote = []
+    for i in range(n):
+        # Mitad vencidos, mitad vigentes
+        expira = ahora + timedelta(minutes=-5 if i % 2 else 2)
+        lote.append({"phone": f"+5299{i:08d}", "code": "000000", "expiresAt": expira})
+        if len(lote) == 10_000:
+            await db["otp"].insert_many(lote)
+            lote = []
+    if lote:
+        await db["otp"].insert_many(lote)
+
+
+async def martillar(client, db, tareas):
+    phone = "+525587654321"
+    r = await client.post("/api/auth/send-otp", json={"phone": phone})
+    assert r.status_code == 200, r.text
+    code = (await db["otp"].find_one({"phone": phone}))["code"]
+
+    respuestas = await asyncio.gather(*(
+        client.post("/api/auth/validate-otp", json={"phone": phone, "code": code})
+        for _ in range(tareas)
+    ))
+    exitosas = sum(r.status_code == 200 for r in respuestas)
+    documentos = await db["otp"].count_documents({"phone": phone})
+    print(f"martillo: {tareas} validaciones simultáneas -> {exitosas} exitosas, {documentos} documento(s)")
+    if exitosas != 1 or documentos != 1:
+        raise SystemExit("❌ El OTP no es atómico bajo concurrencia")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pendientes", type=int, nargs="+", default=[0, 1000, 10000])
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--martillo", type=int, default=0, help="Validaciones simultáneas del mismo número")
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    from database import crear_base_de_datos_falsa, usar_base_de_datos
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(args.mongo_uri)["CooperMobileBench"]
+    else:
+        db = crear_base_de_datos_falsa()
+    usar_base_de_datos(db)
+
+    from indices import asegurar_indices
+    from main import app
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await asegurar_indices(db)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for n in args.pendientes:
+            await sembrar(db, n)
+            latencias = []
+            for i in range(args.peticiones):
+                t0 = time.perf_counter()
+                r = await client.post("/api/auth/send-otp", json={"phone": f"+5255{i:08d}"})
+                latencias.append(time.perf_counter() - t0)
+                assert r.status_code == 200, r.text
+            latencias.sort()
+            p99 = latencias[int(len(latencias) * 0.99) - 1]
+            print(f"{n:>10} pendientes  p50={statistics.median(latencias) * 1000:.2f}ms  p99={p99 * 1000:.2f}ms")
+
+        if args.martillo:
+            await martillar(client, db, args.martillo)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
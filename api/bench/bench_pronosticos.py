@@ -0,0 +1,146 @@
+"""Tiempo del pronóstico de agotamiento para toda la base de usuarios.
+
+Mide por separado:
+  * carga: llenar_matriz() con usuarios × días documentos de rollup
+    generados en memoria (el costo en Python de leer el cursor, sin la red);
+    reporta también el pico de memoria del proceso,
+  * núcleo: pronosticar() sobre una matriz sintética usuarios × días,
+  * extremo a extremo (opcional): calcular_pronosticos() leyendo
+    data_usage_rollups y escribiendo quota_forecasts.
+
+Uso:
+    python bench/bench_pronosticos.py --usuarios 1000000
+    python bench/bench_pronosticos.py --extremo 2000
+    python bench/bench_pronosticos.py --usuarios 1000000 --mongo-uri mongodb://localhost:27017 --objetivo 180
+
+Sin ``--mongo-uri`` el extremo a extremo corre en mongomock, mucho más lento
+que un Mongo real; conviene bajar ``--usuarios``. Con ``--objetivo`` el
+script falla si la carga, el núcleo o el extremo a extremo (si se corrió)
+tarda más de esos segundos.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GB = 1024 ** 3
+
+
+def generar(usuarios, dias, semilla=7):
+    rnd = np.random.default_rng(semilla)
+    base = rnd.gamma(2.0, 0.05 * GB, size=(usuarios, 1)).astype(np.float32)
+    tendencia = rnd.normal(0, 0.002 * GB, size=(usuarios, 1)).astype(np.float32)
+    ruido = rnd.random((usuarios, dias), dtype=np.float32)
+    consumo = np.maximum(base + tendencia * np.arange(dias, dtype=np.float32) + ruido * 0.02 * GB, 0)
+    dia_ciclo = rnd.integers(0, dias, size=usuarios)
+    limites = rnd.choice([2, 5, 10, 20], size=usuarios).astype(np.float64) * GB
+    return consumo, dia_ciclo, limites
+
+
+def _memoria_mb():
+    # ru_maxrss viene en KB en Linux: es el pico del proceso hasta ahora
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _rollups(ids, dias, desde):
+    rnd = np.random.default_rng(7)
+    for u in ids:
+        for d, b in enumerate(rnd.integers(0, GB // 10, dias).tolist()):
+            yield {"userId": u, "inicio": desde + timedelta(days=d), "bytes": b}
+
+
+def medir_carga(usuarios, dias):
+    from pronosticos import llenar_matriz
+
+    desde = datetime(2026, 1, 1)
+    ids = [ObjectId() for _ in range(usuarios)]
+    antes = _memoria_mb()
+    t0 = time.perf_counter()
+    consumo, indice = asyncio.run(llenar_matriz(_rollups(ids, dias, desde), desde, dias))
+    duracion = time.perf_counter() - t0
+    assert consumo.shape == (usuarios, dias) and len(indice) == usuarios
+    print(f"carga        {usuarios * dias:>9,} rollups  {duracion:6.2f}s  "
+          f"({usuarios * dias / duracion:,.0f} docs/s, pico +{_memoria_mb() - antes:,.0f} MB)")
+    return duracion
+
+
+def medir_nucleo(usuarios, dias):
+    from pronosticos import pronosticar
+
+    consumo, dia_ciclo, limites = generar(usuarios, dias)
+    t0 = time.perf_counter()
+    dias_restantes, _, _ = pronosticar(consumo, dia_ciclo, limites)
+    duracion = time.perf_counter() - t0
+    finitos = np.isfinite(dias_restantes)
+    print(f"núcleo       {usuarios:>9,} usuarios × {dias} días  {duracion:6.2f}s  "
+          f"({usuarios / duracion:,.0f} usuarios/s, {finitos.mean():.0%} con fecha)")
+    return duracion
+
+
+async def medir_extremo(usuarios, dias, mongo_uri):
+    from database import crear_base_de_datos_falsa, usar_base_de_datos
+    if mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(mongo_uri)["CooperMobileBench"]
+    else:
+        db = crear_base_de_datos_falsa()
+    usar_base_de_datos(db)
+
+    from pronosticos import calcular_pronosticos
+    for nombre in ("users", "plans", "data_usage_rollups", "quota_forecasts"):
+        await db[nombre].drop()
+
+    hoy = datetime(2026, 3, 1)
+    desde = hoy - timedelta(days=dias)
+    await db["plans"].insert_one({"name": "Bench", "data_limit": "10 GB", "validity_days": 30})
+    consumo, _, _ = generar(usuarios, dias)
+    ids = [ObjectId() for _ in range(usuarios)]
+    for i in range(0, usuarios, 10_000):
+        await db["users"].insert_many([
+            {"_id": u, "plan": "Bench", "createdAt": desde - timedelta(days=j % 30)}
+            for j, u in enumerate(ids[i:i + 10_000], start=i)
+        ])
+        await db["data_usage_rollups"].insert_many([
+            {"userId": u, "granularidad": "dia", "inicio": desde + timedelta(days=d), "bytes": int(consumo[j, d])}
+            for j, u in enumerate(ids[i:i + 10_000], start=i) for d in range(dias)
+        ])
+
+    t0 = time.perf_counter()
+    escritos = await calcular_pronosticos(hoy)
+    duracion = time.perf_counter() - t0
+    assert escritos == usuarios, escritos
+    print(f"extremo a extremo {usuarios:>9,} usuarios  {duracion:6.2f}s  ({usuarios / duracion:,.0f} usuarios/s)")
+    return duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=1_000_000)
+    parser.add_argument("--dias", type=int, default=35)
+    parser.add_argument("--extremo", type=int, default=0, help="Usuarios para el extremo a extremo (0 = omitir)")
+    parser.add_argument("--objetivo", type=float, default=0, help="Segundos máximos")
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # La carga va primero: así el pico de memoria que reporta es solo suyo
+    peor = medir_carga(args.usuarios, args.dias)
+    peor = max(peor, medir_nucleo(args.usuarios, args.dias))
+    if args.extremo or args.mongo_uri:
+        peor = max(peor, asyncio.run(medir_extremo(args.extremo or args.usuarios, args.dias, args.mongo_uri)))
+
+    if args.objetivo and peor > args.objetivo:
+        raise SystemExit(f"❌ {peor:.1f}s supera el objetivo de {args.objetivo:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Prueba de carga de punta a punta con el recorrido real de la app móvil.
+
+Cada usuario virtual hace lo mismo que la app Ionic al registrarse y pagar:
+
+    users/existe → auth/send-otp → (SMS) → auth/validate-otp → POST users/
+    → auth/login → planes → auth/profile → pago/mercadopago → soporte
+
+La app corre en este mismo proceso (ASGI, con su ciclo de vida completo)
+contra mongomock o un Mongo local (``--mongo-uri``, base CooperMobileBench).
+Vonage, Pusher y MercadoPago se sustituyen por los servidores falsos de
+fakes.py en 127.0.0.1; del falso de Vonage se leen los códigos OTP que la
+app "envía" por SMS.
+
+Reporta throughput y p50/p95/p99 por ruta. Con ``--guardar-base`` guarda
+esas cifras como línea base. Con ``--base`` compara contra ella y termina
+con código 1 si alguna ruta empeora más que ``--tolerancia`` o si hubo
+errores.
+
+Uso:
+    python bench/bench_recorrido.py --recorridos 200 --usuarios 20
+    python bench/bench_recorrido.py --guardar-base bench/base_recorrido.json
+    python bench/bench_recorrido.py --base bench/base_recorrido.json --tolerancia 0.3
+    python bench/bench_recorrido.py --mongo-uri mongodb://localhost:27017 --latencia-externa 80
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import crear_fake_mercadopago, crear_fake_pusher, crear_fake_vonage, puerto_libre, servidor_local
+
+PLAN = {"name": "Bench", "price": 199.0, "data_limit": "10 GB", "validity_days": 30,
+        "benefits": ["Redes sociales ilimitadas"]}
+# Diferencia mínima (ms) para considerar una regresión: evita falsos
+# positivos en rutas de menos de un milisegundo
+MARGEN_ABSOLUTO_MS = 5.0
+_CODIGO = re.compile(r"(\d{6})")
+
+
+# 🎭 Proveedores externos falsos (ver fakes.py)
+class Proveedores:
+    """Vonage, Pusher y MercadoPago falsos, con puertos elegidos de antemano."""
+
+    def __init__(self, latencia_ms: float = 0):
+        latencia = latencia_ms / 1000
+        self.vonage = crear_fake_vonage(latencia)
+        self.pusher = crear_fake_pusher(latencia)
+        self.mercadopago = crear_fake_mercadopago(latencia)
+        self.puertos = {nombre: puerto_libre() for nombre in ("vonage", "pusher", "mercadopago")}
+        self._leidos = 0
+        self._codigos = {}
+
+    def url(self, nombre: str) -> str:
+        return f"http://127.0.0.1:{self.puertos[nombre]}"
+
+    @contextlib.asynccontextmanager
+    async def levantar(self):
+        async with contextlib.AsyncExitStack() as pila:
+            for nombre, puerto in self.puertos.items():
+                await pila.enter_async_context(servidor_local(getattr(self, nombre), puerto))
+            yield self
+
+    async def esperar_codigo(self, phone: str, limite: float = 15.0) -> str:
+        """Código OTP del último SMS que la app mandó a ``phone``."""
+        fin = time.perf_counter() + limite
+        while time.perf_counter() < fin:
+            recibidos = self.vonage.state.recibidos
+            for sms in recibidos[self._leidos:]:
+                self._codigos[sms["to"]] = _CODIGO.search(sms["text"]).group(1)
+            self._leidos = len(recibidos)
+            codigo = self._codigos.pop(phone, None)
+            if codigo:
+                return codigo
+            await asyncio.sleep(0.005)
+        raise TimeoutError(f"No llegó el SMS para {phone}")
+
+
+def configurar_entorno(proveedores: Proveedores, args):
+    """Variables que la app lee al importarse: deben fijarse antes de importar main."""
+    os.environ.update({
+        "VONAGE_SMS_URL": f"{proveedores.url('vonage')}/sms/json",
+        "VONAGE_API_KEY": "bench", "VONAGE_API_SECRET": "bench",
+        "PUSHER_APP_ID": "1", "PUSHER_KEY": "bench", "PUSHER_SECRET": "bench",
+        "PUSHER_HOST": "127.0.0.1", "PUSHER_PORT": str(proveedores.puertos["pusher"]), "PUSHER_SSL": "0",
+        "MP_ENV": "sandbox", "MP_API_URL": proveedores.url("mercadopago"), "MP_ACCESS_TOKEN_SANDBOX": "bench",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rondas),
+        # Todos los usuarios virtuales salen de la misma IP y del mismo bloque de números
+        "LIMITE_OTP_TELEFONO": "1000/60", "LIMITE_OTP_IP": "100000000/60", "LIMITE_OTP_PREFIJO": "100000000/60",
+        "LIMITE_LOGIN_TELEFONO": "1000/60", "LIMITE_LOGIN_IP": "100000000/60",
+    })
+    os.environ.pop("MP_NOTIFICATION_URL", None)
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+        os.environ["MONGO_DB"] = "CooperMobileBench"
+
+
+# 🧭 Recorrido de un usuario
+class Medidor:
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.detalle_errores = []
+
+    async def pedir(self, client, nombre, metodo, url, valido=None, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            r = await client.request(metodo, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.error(nombre, str(e))
+            raise
+        finally:
+            self.latencias[nombre].append(time.perf_counter() - inicio)
+        if r.status_code >= 400 or (valido is not None and not valido(r.json())):
+            self.error(nombre, f"HTTP {r.status_code}: {r.text[:200]}")
+            raise RuntimeError(nombre)
+        return r.json()
+
+    def error(self, nombre, detalle):
+        self.errores[nombre] += 1
+        if len(self.detalle_errores) < 10:
+            self.detalle_errores.append(f"{nombre}: {detalle}")
+
+
+async def recorrido(client, medidor: Medidor, proveedores: Proveedores, phone: str):
+    password = "Bench-" + phone[-6:]
+    await medidor.pedir(client, "GET /api/users/existe", "GET", "/api/users/existe", params={"phone": phone},
+                        valido=lambda d: d["registrado"] is False)
+    await medidor.pedir(client, "POST /api/auth/send-otp", "POST", "/api/auth/send-otp", json={"phone": phone})
+
+    inicio = time.perf_counter()
+    codigo = await proveedores.esperar_codigo(phone)
+    medidor.latencias["(entrega del SMS)"].append(time.perf_counter() - inicio)
+
+    await medidor.pedir(client, "POST /api/auth/validate-otp", "POST", "/api/auth/validate-otp",
+                        json={"phone": phone, "code": codigo})
+    usuario = await medidor.pedir(client, "POST /api/users/", "POST", "/api/users/", json={
+        "phone": phone, "password": password, "name": f"Bench {phone[-4:]}",
+        "email": f"bench{phone[1:]}@example.com", "plan": PLAN["name"],
+    })
+    await medidor.pedir(client, "POST /api/auth/login", "POST", "/api/auth/login",
+                        json={"phone": phone, "password": password})
+    await medidor.pedir(client, "GET /api/planes", "GET", "/api/planes")
+    await medidor.pedir(client, "GET /api/auth/profile/{id}", "GET", f"/api/auth/profile/{usuario['user_id']}")
+    await medidor.pedir(client, "POST /api/pago/mercadopago", "POST", "/api/pago/mercadopago",
+                        json={"user_id": usuario["user_id"], "plan": PLAN}, valido=lambda d: "init_point" in d)
+    await medidor.pedir(client, "POST /api/soporte", "POST", "/api/soporte",
+                        json={"userId": usuario["user_id"], "issue": "No tengo datos"},
+                        valido=lambda d: "error" not in d)
+
+
+# 📊 Reporte y línea base
+def percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados))) - 1))]
+
+
+def resumir(medidor: Medidor, duracion: float, completos: int):
+    rutas = {}
+    for nombre, valores in medidor.latencias.items():
+        ordenados = sorted(valores)
+        rutas[nombre] = {
+            "peticiones": len(ordenados),
+            "errores": medidor.errores.get(nombre, 0),
+            "por_segundo": round(len(ordenados) / duracion, 1),
+            **{f"p{p}": round(percentil(ordenados, p) * 1000, 2) for p in (50, 95, 99)},
+        }
+    return {"recorridos": completos, "fallidos": medidor.errores.get("(recorrido)", 0),
+            "recorridos_por_segundo": round(completos / duracion, 2),
+            "duracion_s": round(duracion, 2), "rutas": rutas}
+
+
+def imprimir(resumen):
+    print(f"\n{'ruta':<32} {'pet':>6} {'err':>4} {'pet/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for nombre, r in resumen["rutas"].items():
+        print(f"{nombre:<32} {r['peticiones']:>6} {r['errores']:>4} {r['por_segundo']:>8.1f} "
+              f"{r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f}")
+    print(f"\n{resumen['recorridos']} recorridos completos en {resumen['duracion_s']}s "
+          f"({resumen['recorridos_por_segundo']} recorridos/s)")
+
+
+def comparar(resumen, base, tolerancia):
+    """Lista de regresiones respecto a la línea base (vacía si no hay)."""
+    problemas = []
+    if resumen["fallidos"]:
+        problemas.append(f"{resumen['fallidos']} recorridos no terminaron")
+    for nombre, actual in resumen["rutas"].items():
+        if actual["errores"]:
+            problemas.append(f"{nombre}: {actual['errores']} errores")
+        anterior = base["rutas"].get(nombre)
+        if not anterior:
+            continue
+        for p in ("p95", "p99"):
+            limite = anterior[p] * (1 + tolerancia)
+            if actual[p] > limite and actual[p] - anterior[p] > MARGEN_ABSOLUTO_MS:
+                problemas.append(f"{nombre}: {p} {actual[p]:.1f} ms > {limite:.1f} ms (base {anterior[p]:.1f} ms)")
+    minimo = base["recorridos_por_segundo"] * (1 - tolerancia)
+    if resumen["recorridos_por_segundo"] < minimo:
+        problemas.append(f"throughput {resumen['recorridos_por_segundo']} recorridos/s < {minimo:.2f}")
+    return problemas
+
+
+async def correr(args, proveedores: Proveedores):
+    from database import crear_base_de_datos_falsa, plans_collection, usar_base_de_datos
+    if not args.mongo_uri:
+        usar_base_de_datos(crear_base_de_datos_falsa())
+    import main
+
+    await plans_collection.delete_many({"name": PLAN["name"]})
+    await plans_collection.insert_one(dict(PLAN))
+
+    medidor = Medidor()
+    # Números únicos por corrida: no chocan con corridas anteriores en un Mongo real
+    base = random.Random(args.semilla).randrange(10 ** 9, 9 * 10 ** 9) * 10
+    pendientes = iter(range(args.recorridos))
+    completos = 0
+
+    async def usuario_virtual(client):
+        nonlocal completos
+        for i in pendientes:
+            try:
+                await recorrido(client, medidor, proveedores, f"+52{base + i:010d}")
+                completos += 1
+            except Exception as e:
+                medidor.error("(recorrido)", repr(e))
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with proveedores.levantar(), main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as client:
+            inicio = time.perf_counter()
+            await asyncio.gather(*(usuario_virtual(client) for _ in range(args.usuarios)))
+            duracion = time.perf_counter() - inicio
+    return medidor, duracion, completos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recorridos", type=int, default=100, help="Recorridos completos a ejecutar")
+    parser.add_argument("--usuarios", type=int, default=10, help="Usuarios virtuales concurrentes")
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--latencia-externa", type=float, default=0, help="ms de latencia de Vonage/Pusher/MP")
+    parser.add_argument("--bcrypt-rondas", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--guardar-base", help="Guarda el resultado como línea base (JSON)")
+    parser.add_argument("--base", help="Línea base contra la que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Empeoramiento permitido (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    proveedores = Proveedores(args.latencia_externa)
+    configurar_entorno(proveedores, args)
+    medidor, duracion, completos = asyncio.run(correr(args, proveedores))
+    logging.disable(logging.CRITICAL)
+
+    resumen = resumir(medidor, duracion, completos)
+    imprimir(resumen)
+    for detalle in medidor.detalle_errores:
+        print("  ❌", detalle)
+
+    if args.guardar_base:
+        with open(args.guardar_base, "w") as f:
+            json.dump(resumen, f, indent=2, ensure_ascii=False)
+        print(f"💾 Línea base guardada en {args.guardar_base}")
+    if args.base:
+        with open(args.base) as f:
+            problemas = comparar(resumen, json.load(f), args.tolerancia)
+        if problemas:
+            print("\n❌ Regresiones respecto a la línea base:")
+            for p in problemas:
+                print("  -", p)
+            sys.exit(1)
+        print("✅ Sin regresiones respecto a la línea base")
+    elif sum(medidor.errores.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
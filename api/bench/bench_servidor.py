@@ -0,0 +1,172 @@
+"""Throughput de servidor.py con un worker contra varios, sobre rutas reales.
+
+Levanta ``python servidor.py`` con ``--workers 1`` y luego con
+``--workers N`` y en cada caso genera carga desde procesos aparte durante
+``--duracion`` segundos. Reporta peticiones por segundo, p50 y p99.
+
+Uso:
+    python bench/bench_servidor.py
+    python bench/bench_servidor.py --workers 4 --mongo-uri mongodb://localhost:27017
+
+Sin ``--mongo-uri`` solo se pueden usar las rutas que no leen la base
+(/api/ping, /metrics). Con ``--mongo-uri`` se siembra un plan y un usuario
+en la base CooperMobileBench y se agregan /api/planes, el perfil y el
+login (bcrypt), que es donde más se nota tener varios procesos.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+API = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API)
+
+TELEFONO = "+525500000001"
+CONTRASENA = "bench-contrasena"
+
+
+def entorno(mongo_uri):
+    env = dict(os.environ)
+    env.setdefault("PUSHER_APP_ID", "1")
+    env.setdefault("PUSHER_KEY", "bench")
+    env.setdefault("PUSHER_SECRET", "bench")
+    env.setdefault("PUSHER_CLUSTER", "mt1")
+    env["MONGO_DB"] = "CooperMobileBench"
+    # La carga sale de una sola IP y un solo teléfono
+    env["LIMITE_LOGIN_TELEFONO"] = env["LIMITE_LOGIN_IP"] = "100000000/60"
+    if mongo_uri:
+        env["MONGO_URI"] = mongo_uri
+    else:
+        env["MONGO_URI"] = "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=500"
+        env["MONGO_CREAR_INDICES"] = "0"
+        env["SALUD_CRITICAS"] = ""
+        env["SMS_WORKERS"] = "0"
+    return env
+
+
+def sembrar(mongo_uri):
+    """Plan y usuario de prueba; regresa las rutas a medir."""
+    from pymongo import MongoClient
+    from hashing import obtener_contexto
+
+    db = MongoClient(mongo_uri)["CooperMobileBench"]
+    db.plans.delete_many({"name": "Bench"})
+    plan_id = db.plans.insert_one({
+        "name": "Bench", "price": 100, "data_limit": "10 GB", "validity_days": 30,
+        "description": "Plan de prueba", "features": [],
+    }).inserted_id
+    db.users.delete_many({"phone": TELEFONO})
+    user_id = db.users.insert_one({
+        "name": "Bench", "phone": TELEFONO, "email": None, "balance": 0, "plan": str(plan_id),
+        "password": obtener_contexto().hash(CONTRASENA),
+    }).inserted_id
+    return [
+        ("GET", "/api/ping", None),
+        ("GET", "/api/planes", None),
+        ("GET", f"/api/planes/{user_id}", None),
+        ("GET", f"/api/auth/profile/{user_id}", None),
+        ("POST", "/api/auth/login", {"phone": TELEFONO, "password": CONTRASENA}),
+    ]
+
+
+async def _cargar(url, rutas, concurrencia, duracion):
+    latencias, errores = [], 0
+    fin = time.perf_counter() + duracion
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=30) as client:
+        async def usuario(i):
+            nonlocal errores
+            while time.perf_counter() < fin:
+                metodo, ruta, cuerpo = rutas[i % len(rutas)]
+                i += 1
+                inicio = time.perf_counter()
+                try:
+                    r = await client.request(metodo, ruta, json=cuerpo)
+                    if r.status_code >= 400:
+                        errores += 1
+                except httpx.HTTPError:
+                    errores += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        await asyncio.gather(*(usuario(i) for i in range(concurrencia)))
+    return latencias, errores
+
+
+def _cliente(args):
+    return asyncio.run(_cargar(*args))
+
+
+def esperar(url, proceso, limite=60):
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < limite:
+        if proceso.poll() is not None:
+            raise SystemExit(f"❌ servidor.py terminó con código {proceso.returncode}")
+        try:
+            if httpx.get(url + "/api/ping", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit("❌ servidor.py no respondió")
+
+
+def medir(workers, args, env, rutas):
+    puerto = 18000 + workers
+    url = f"http://127.0.0.1:{puerto}"
+    proceso = subprocess.Popen(
+        [sys.executable, "servidor.py", "--workers", str(workers), "--puerto", str(puerto),
+         "--host", "127.0.0.1", "--sin-access-log"],
+        cwd=API, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        esperar(url, proceso)
+        por_cliente = max(1, args.concurrencia // args.clientes)
+        with multiprocessing.Pool(args.clientes) as pool:
+            resultados = pool.map(_cliente, [(url, rutas, por_cliente, args.duracion)] * args.clientes)
+    finally:
+        proceso.send_signal(signal.SIGINT)
+        proceso.wait(30)
+
+    latencias = sorted(l for lat, _ in resultados for l in lat)
+    errores = sum(e for _, e in resultados)
+    p99 = latencias[int(len(latencias) * 0.99) - 1] if latencias else 0
+    rps = len(latencias) / args.duracion
+    print(f"{workers:>2} worker(s)  {rps:>9,.0f} pet/s   p50 {statistics.median(latencias) * 1000:7.1f} ms   "
+          f"p99 {p99 * 1000:7.1f} ms   errores {errores}")
+    return rps
+
+
+def main():
+    from servidor import nucleos_disponibles
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=max(2, nucleos_disponibles()))
+    parser.add_argument("--duracion", type=float, default=10)
+    parser.add_argument("--concurrencia", type=int, default=64)
+    parser.add_argument("--clientes", type=int, default=2, help="Procesos generando carga")
+    parser.add_argument("--mongo-uri")
+    args = parser.parse_args()
+
+    env = entorno(args.mongo_uri)
+    rutas = sembrar(args.mongo_uri) if args.mongo_uri else [
+        ("GET", "/api/ping", None),
+        ("GET", "/metrics", None),
+    ]
+    print(f"{len(rutas)} rutas, {args.concurrencia} conexiones, {args.duracion:g}s por corrida, "
+          f"{nucleos_disponibles()} núcleos disponibles")
+
+    uno = medir(1, args, env, rutas)
+    varios = medir(args.workers, args, env, rutas)
+    print(f"aceleración con {args.workers} workers: {varios / uno:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
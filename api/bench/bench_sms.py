@@ -0,0 +1,61 @@
+"""Throughput del despachador de SMS contra un Vonage falso local.
+
+Uso:
+    python bench/bench_sms.py --mensajes 2000 --workers 8 --latencia 0.05
+    python bench/bench_sms.py --mongo-uri mongodb://localhost:27017
+
+Sin ``--mongo-uri`` la outbox vive en mongomock, que recorre la colección
+en cada reclamo; para cifras representativas usar un Mongo local.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import crear_base_de_datos_falsa
+from fakes import crear_fake_vonage, servidor_local
+from sms import DespachadorSMS
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mensajes", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latencia", type=float, default=0.05, help="Segundos que tarda el Vonage falso")
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--mongo-uri", help="Mongo local para la outbox (se usa la BD CooperMobileBench)")
+    args = parser.parse_args()
+
+    fake = crear_fake_vonage(latencia=args.latencia, tasa_error=args.tasa_error)
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        outbox = AsyncIOMotorClient(args.mongo_uri)["CooperMobileBench"]["sms_outbox"]
+        await outbox.delete_many({})
+    else:
+        outbox = crear_base_de_datos_falsa()["sms_outbox"]
+
+    async with servidor_local(fake) as url:
+        despachador = DespachadorSMS(outbox, url=f"{url}/sms/json", workers=args.workers,
+                                     max_outbox=args.mensajes)
+        await despachador.iniciar()
+
+        inicio = time.perf_counter()
+        for i in range(args.mensajes):
+            await despachador.encolar(f"+5255{i:08d}", "Tu código Copper Mobil es: 123456")
+        encolado = time.perf_counter() - inicio
+
+        while await despachador.contar_pendientes():
+            await asyncio.sleep(0.01)
+        total = time.perf_counter() - inicio
+        await despachador.cerrar()
+
+    print(f"encolar: {args.mensajes / encolado:>10.1f} msg/s")
+    print(f"enviar:  {args.mensajes / total:>10.1f} msg/s  ({len(fake.state.recibidos)} recibidos por Vonage)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
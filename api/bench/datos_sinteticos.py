@@ -0,0 +1,369 @@
+"""Datos sintéticos a escala para pruebas de capacidad de índices y consultas.
+
+Genera, con la forma de models.py y de los documentos que escribe la API:
+
+  * plans: el catálogo (6 planes, _id fijos),
+  * users: teléfonos únicos con lada válida (+52, +1, +57), altas que crecen
+    hacia el presente a lo largo de ``--anios``,
+  * data_usage_events: un registro diario por usuario durante ``--dias``
+    (consumo medio log-normal por usuario, más alto en fin de semana),
+    y su total en data_usage (bytesTotal, eventos),
+  * transactions: pagos mensuales según la retención de cada usuario,
+  * support_tickets y chip_requests: distribuciones sesgadas; la mayoría no
+    tiene ninguno y unos pocos acumulan cientos (Zipf).
+
+Todo depende solo de ``--semilla``, ``--hasta`` y del tamaño de tramo. Cada
+tramo de usuarios tiene su propio generador y los ObjectId se derivan de la
+fecha y un contador, así que el resultado es el mismo sin importar cuántos
+procesos carguen. Los procesos generan e insertan en paralelo con
+``insert_many(ordered=False)`` en lotes de ``--lote``. Los índices se crean
+al final (``--indices despues``), que es lo más rápido para cargas grandes.
+data_usage_rollups y quota_forecasts no se generan: salen de rollups.py y
+pronosticos.py sobre estos datos.
+
+Uso:
+    python bench/datos_sinteticos.py --mongo-uri mongodb://localhost:27017 --usuarios 100000
+    python bench/datos_sinteticos.py --mongo-uri mongodb://localhost:27017 --limpiar \\
+        --usuarios 2000000 --dias 730 --procesos 8
+    python bench/datos_sinteticos.py --seco --usuarios 20000    # solo mide la generación
+
+La contraseña de todos los usuarios es ``--contrasena`` (un solo hash bcrypt).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime
+
+import numpy as np
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLECCIONES = ("plans", "users", "data_usage_events", "data_usage", "transactions",
+               "support_tickets", "chip_requests")
+# Derivadas de las anteriores: se vacían con --limpiar para no quedar desfasadas
+DERIVADAS = ("data_usage_rollups", "rollup_marks", "quota_forecasts")
+
+# Prefijo de los ObjectId de cada colección (ver _oids)
+_CODIGO = {"plans": 1, "users": 2, "transactions": 3, "support_tickets": 4, "chip_requests": 5, "data_usage": 6}
+
+PLANES = [
+    # (nombre, precio, data_limit, vigencia, peso en la base de usuarios)
+    ("Cobre 5", 99.0, "5 GB", 30, 0.30),
+    ("Cobre 10", 149.0, "10 GB", 30, 0.25),
+    ("Cobre 20", 199.0, "20 GB", 30, 0.18),
+    ("Cobre 40", 299.0, "40 GB", 30, 0.12),
+    ("Cobre Semanal", 49.0, "2 GB", 7, 0.10),
+    ("Cobre Ilimitado", 449.0, "Ilimitado", 30, 0.05),
+]
+LADAS = (("+52", 0.85), ("+1", 0.10), ("+57", 0.05))
+NOMBRES = ("Ana", "Luis", "Maria", "Jose", "Sofia", "Carlos", "Fernanda", "Jorge", "Valeria", "Miguel",
+           "Daniela", "Juan", "Camila", "Diego", "Paola", "Alejandro", "Lucia", "Ricardo", "Andrea", "Pedro")
+APELLIDOS = ("Garcia", "Hernandez", "Lopez", "Martinez", "Gonzalez", "Perez", "Rodriguez", "Sanchez",
+             "Ramirez", "Cruz", "Flores", "Gomez", "Morales", "Vazquez", "Reyes", "Jimenez", "Torres", "Diaz")
+DOMINIOS = ("gmail.com", "hotmail.com", "outlook.com", "yahoo.com.mx", "icloud.com")
+PROBLEMAS = ("No tengo datos", "No puedo hacer llamadas", "Mi recarga no se aplicó", "Sin señal en mi zona",
+             "Quiero cambiar de plan", "Cobro duplicado", "No llega el SMS de verificación", "Portabilidad atrasada")
+CALLES = ("Av. Reforma", "Calle Hidalgo", "Av. Juárez", "Calle Morelos", "Av. Insurgentes", "Calle Allende")
+CIUDADES = ("CDMX", "Guadalajara", "Monterrey", "Puebla", "Querétaro", "Mérida", "Tijuana", "León")
+METODOS = (("mercadopago", 0.80), ("oxxo", 0.10), ("paypal", 0.05), ("efectivo", 0.05))
+ESTADOS_PAGO = (("approved", 0.90), ("rejected", 0.05), ("pending", 0.04), ("error", 0.01))
+
+MB = 1024 ** 2
+_CATALOGO_DESDE = 1_704_067_200  # 2024-01-01 UTC, fecha de los _id del catálogo
+# Multiplicador coprimo con 10^9: permuta los índices para que los teléfonos no sean consecutivos
+_PERMUTACION = 618_033_989
+
+
+# 🧱 Utilidades
+def _oids(coleccion: str, segundos, contadores) -> list:
+    """ObjectId deterministas: 4 bytes de fecha, 1 de colección y 7 de contador."""
+    prefijo = _CODIGO[coleccion] << 56
+    return [ObjectId(((s << 64) | prefijo | n).to_bytes(12, "big"))
+            for s, n in zip(np.asarray(segundos).tolist(), np.asarray(contadores).tolist())]
+
+
+def _elegir(rng, opciones, n):
+    valores, pesos = zip(*opciones)
+    return np.array(valores, dtype=object)[rng.choice(len(valores), size=n, p=pesos)]
+
+
+def _fechas(rng, desde_ms, hasta_ms):
+    """Un instante uniforme entre cada par ``desde_ms``/``hasta_ms`` (epoch en ms)."""
+    return (desde_ms + rng.random(len(desde_ms)) * (hasta_ms - desde_ms)).astype("datetime64[ms]")
+
+
+def _segundos(fechas):
+    return fechas.astype("datetime64[s]").astype(np.int64)
+
+
+def _contadores(tramo: int, n: int):
+    return (tramo << 32) + np.arange(n, dtype=np.int64)
+
+
+def catalogo():
+    return [
+        {"_id": _oids("plans", [_CATALOGO_DESDE], [i])[0], "name": nombre, "price": precio, "data_limit": limite,
+         "validity_days": vigencia, "benefits": ["Redes sociales ilimitadas", "Llamadas y SMS ilimitados"]}
+        for i, (nombre, precio, limite, vigencia, _) in enumerate(PLANES)
+    ]
+
+
+# 🎲 Generación de un tramo de usuarios
+def generar_tramo(tramo: int, inicio: int, fin: int, opciones: dict) -> dict:
+    """Columnas de cada colección para los usuarios ``inicio..fin-1``.
+
+    Regresa ``{colección: {campo: lista}}``; las listas de una colección
+    tienen la misma longitud. Solo depende de la semilla y del tramo.
+    """
+    rng = np.random.default_rng([opciones["semilla"], tramo])
+    n = fin - inicio
+    hasta = np.datetime64(opciones["hasta"], "ms")
+    hasta_ms = hasta.astype(np.int64)
+    dia_ms = 86_400_000
+    planes = catalogo()
+
+    # 👤 Usuarios: más altas recientes (densidad creciente hacia ``hasta``)
+    antiguedad = (1 - np.sqrt(rng.random(n))) * opciones["anios"] * 365 * dia_ms
+    creado = (hasta_ms - antiguedad).astype("datetime64[ms]")
+    indices = np.arange(inicio, fin, dtype=np.int64)
+    user_ids = _oids("users", _segundos(creado), indices)
+    permutados = (indices * _PERMUTACION) % 10 ** 9
+    ladas = _elegir(rng, LADAS, n)
+    telefonos = [f"{lada}{d}{p:09d}" for lada, d, p in zip(ladas, rng.integers(1, 10, n).tolist(), permutados.tolist())]
+    nombre = rng.integers(0, len(NOMBRES), n)
+    apellido = rng.integers(0, len(APELLIDOS), n)
+    nombres = [f"{NOMBRES[a]} {APELLIDOS[b]}" for a, b in zip(nombre.tolist(), apellido.tolist())]
+    con_email = rng.random(n) < 0.7
+    dominios = rng.integers(0, len(DOMINIOS), n)
+    emails = [
+        f"{NOMBRES[a].lower()}.{APELLIDOS[b].lower()}{i}@{DOMINIOS[d]}" if e else None
+        for a, b, i, d, e in zip(nombre.tolist(), apellido.tolist(), indices.tolist(), dominios.tolist(), con_email.tolist())
+    ]
+    plan = rng.choice(len(planes), size=n, p=[p[4] for p in PLANES])
+    saldo = np.where(rng.random(n) < 0.8, 0.0, np.round(rng.gamma(2, 50, n), 2))
+    creado_py = creado.tolist()
+    usuarios = {
+        "_id": user_ids, "phone": telefonos, "name": nombres, "email": emails,
+        "balance": saldo.tolist(), "plan": [str(planes[p]["_id"]) for p in plan.tolist()],
+        "transactions": [[] for _ in range(n)], "password": [opciones["hash"]] * n,
+        "createdAt": creado_py, "updatedAt": creado_py,
+    }
+    user_str = [str(u) for u in user_ids]
+
+    # 📶 Consumo diario: un registro por día desde el alta (máximo ``dias``), 5 % de días sin datos
+    primer_dia = np.maximum(creado.astype("datetime64[D]"), (hasta - np.timedelta64(opciones["dias"], "D")).astype("datetime64[D]"))
+    n_dias = np.maximum(0, (hasta.astype("datetime64[D]") - primer_dia).astype(np.int64))
+    fila = np.repeat(np.arange(n), n_dias)
+    desplazamiento = np.arange(len(fila)) - np.repeat(np.cumsum(n_dias) - n_dias, n_dias)
+    dia = primer_dia[fila] + desplazamiento
+    media = rng.lognormal(np.log(300 * MB), 0.8, n)
+    fin_de_semana = np.where(((dia.astype(np.int64) + 3) % 7) >= 5, 1.3, 1.0)
+    cantidad = (media[fila] * rng.gamma(2.0, 0.5, len(fila)) * fin_de_semana).astype(np.int64)
+    conservar = rng.random(len(fila)) >= 0.05
+    fila, dia, cantidad = fila[conservar], dia[conservar], cantidad[conservar]
+    ts = dia.astype("datetime64[ms]") + rng.integers(0, dia_ms, len(fila)).astype("timedelta64[ms]")
+    eventos = {"userId": [user_ids[f] for f in fila.tolist()], "ts": ts.tolist(), "bytes": cantidad.tolist()}
+
+    con_consumo = np.flatnonzero(np.bincount(fila, minlength=n))
+    totales = np.bincount(fila, weights=cantidad, minlength=n).astype(np.int64)
+    conteos = np.bincount(fila, minlength=n)
+    actualizado = datetime.fromisoformat(opciones["hasta"])
+    resumen = {
+        "_id": _oids("data_usage", _segundos(creado[con_consumo]), indices[con_consumo]),
+        "userId": [user_ids[u] for u in con_consumo.tolist()],
+        "bytesTotal": totales[con_consumo].tolist(), "eventos": conteos[con_consumo].tolist(),
+        "actualizadoEn": [actualizado] * len(con_consumo),
+    }
+
+    # 💳 Pagos: uno por mes activo con la probabilidad de retención del usuario
+    meses = (hasta_ms - creado.astype(np.int64)) // (30 * dia_ms) + 1
+    pagos = rng.binomial(meses, rng.beta(5, 2, n))
+    fila = np.repeat(np.arange(n), pagos)
+    fecha = _fechas(rng, creado.astype(np.int64)[fila], np.full(len(fila), hasta_ms))
+    recarga = rng.random(len(fila)) < 0.1
+    precios = np.array([p["price"] for p in planes])
+    monto = np.where(recarga, rng.choice([50.0, 100.0, 200.0], len(fila)), precios[plan[fila]])
+    metodo = _elegir(rng, METODOS, len(fila))
+    id_pago = rng.integers(10 ** 10, 10 ** 11, len(fila))
+    transacciones = {
+        "_id": _oids("transactions", _segundos(fecha), _contadores(tramo, len(fila))),
+        "userId": [user_str[f] for f in fila.tolist()],
+        "type": np.where(recarga, "recarga", "pago").tolist(),
+        "amount": monto.tolist(), "paymentMethod": metodo.tolist(),
+        "status": _elegir(rng, ESTADOS_PAGO, len(fila)).tolist(),
+        "paymentId": [str(p) if m == "mercadopago" else None for p, m in zip(id_pago.tolist(), metodo)],
+        "reference": [f"OXXO-{p}" if m == "oxxo" else None for p, m in zip(id_pago.tolist(), metodo)],
+        "date": fecha.tolist(),
+    }
+
+    # 🎫 Tickets: Zipf, la mayoría sin ninguno; createdAt en ISO como lo guarda la API
+    por_usuario = np.minimum(rng.zipf(opciones["tickets_zipf"], n) - 1, opciones["tickets_maximo"])
+    fila = np.repeat(np.arange(n), por_usuario)
+    fecha = _fechas(rng, creado.astype(np.int64)[fila], np.full(len(fila), hasta_ms))
+    resuelto = (fecha < hasta - np.timedelta64(14, "D")) & (rng.random(len(fila)) < 0.85)
+    tickets = {
+        "_id": _oids("support_tickets", _segundos(fecha), _contadores(tramo, len(fila))),
+        "userId": [user_str[f] for f in fila.tolist()],
+        "issue": np.array(PROBLEMAS, dtype=object)[rng.integers(0, len(PROBLEMAS), len(fila))].tolist(),
+        "status": np.where(resuelto, "resuelto", "pendiente").tolist(),
+        "createdAt": [f.isoformat() for f in fecha.tolist()],
+    }
+
+    # 📦 Chips: 10 % de los usuarios pide alguno; pocos piden varios
+    por_usuario = np.where(rng.random(n) < 0.1, rng.geometric(0.6, n), 0)
+    fila = np.repeat(np.arange(n), por_usuario)
+    fecha = _fechas(rng, creado.astype(np.int64)[fila], np.full(len(fila), hasta_ms))
+    portabilidad = rng.random(len(fila)) < 0.25
+    procesado = (fecha < hasta - np.timedelta64(7, "D")) & (rng.random(len(fila)) < 0.95)
+    numero = rng.integers(10 ** 9, 10 ** 10, len(fila))
+    calle = rng.integers(0, len(CALLES), len(fila))
+    ciudad = rng.integers(0, len(CIUDADES), len(fila))
+    chips = {
+        "_id": _oids("chip_requests", _segundos(fecha), _contadores(tramo, len(fila))),
+        "userId": [user_str[f] for f in fila.tolist()],
+        "nombre": [nombres[f] for f in fila.tolist()],
+        "direccion": [f"{CALLES[c]} {num % 900 + 10}, {CIUDADES[d]}"
+                      for c, num, d in zip(calle.tolist(), numero.tolist(), ciudad.tolist())],
+        "tipo": np.where(portabilidad, "portabilidad", "nueva").tolist(),
+        "telefono": [f"+52{num}" if p else None for num, p in zip(numero.tolist(), portabilidad.tolist())],
+        "status": np.where(procesado, "procesado", "pendiente").tolist(),
+        "createdAt": fecha.tolist(),
+    }
+
+    return {"users": usuarios, "data_usage_events": eventos, "data_usage": resumen,
+            "transactions": transacciones, "support_tickets": tickets, "chip_requests": chips}
+
+
+def documentos(columnas: dict, lote: int):
+    """Convierte columnas en listas de documentos de a lo más ``lote``."""
+    campos = list(columnas)
+    total = len(columnas[campos[0]])
+    for a in range(0, total, lote):
+        valores = [columnas[c][a:a + lote] for c in campos]
+        yield [dict(zip(campos, fila)) for fila in zip(*valores)]
+
+
+# 🚚 Carga en paralelo: cada proceso genera e inserta sus tramos
+_db = None
+_opciones = None
+
+
+def _iniciar_proceso(mongo_uri, base, opciones):
+    global _db, _opciones
+    _opciones = opciones
+    if mongo_uri:
+        from pymongo import MongoClient
+        _db = MongoClient(mongo_uri)[base]
+
+
+def _cargar_tramo(tramo_rango):
+    tramo, inicio, fin = tramo_rango
+    conteo = Counter()
+    for coleccion, columnas in generar_tramo(tramo, inicio, fin, _opciones).items():
+        for docs in documentos(columnas, _opciones["lote"]):
+            if _db is not None:
+                _db[coleccion].insert_many(docs, ordered=False)
+            conteo[coleccion] += len(docs)
+    return conteo
+
+
+async def _preparar(args, db_sync):
+    """Borra lo anterior (--limpiar) y crea lo que debe existir antes de insertar."""
+    from database import cerrar_cliente, get_db
+    from indices import asegurar_indices, asegurar_series
+
+    db = get_db()
+    if args.limpiar:
+        for coleccion in COLECCIONES + DERIVADAS:
+            await db[coleccion].drop()
+    elif await db["users"].estimated_document_count():
+        raise SystemExit(f"❌ {args.base} ya tiene usuarios; usa --limpiar para regenerar")
+    if args.indices == "antes":
+        await asegurar_indices(db)
+    else:
+        # Las colecciones time-series tienen que existir antes del primer insert
+        await asegurar_series(db)
+    db_sync["plans"].insert_many(catalogo())
+    cerrar_cliente()
+
+
+async def _indexar():
+    from database import cerrar_cliente
+    from indices import asegurar_indices
+    await asegurar_indices()
+    cerrar_cliente()
+
+
+def main():
+    from servidor import nucleos_disponibles
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=100_000)
+    parser.add_argument("--dias", type=int, default=365, help="Días de historial de consumo")
+    parser.add_argument("--anios", type=float, default=2, help="Años sobre los que se reparten las altas")
+    parser.add_argument("--hasta", default=date.today().isoformat(), help="Fecha final de los datos (ISO)")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--tickets-zipf", type=float, default=2.2, help="Exponente de tickets por usuario")
+    parser.add_argument("--tickets-maximo", type=int, default=500)
+    parser.add_argument("--tramo", type=int, default=500, help="Usuarios por unidad de trabajo")
+    parser.add_argument("--lote", type=int, default=10_000, help="Documentos por insert_many")
+    parser.add_argument("--procesos", type=int, default=max(2, nucleos_disponibles()))
+    parser.add_argument("--mongo-uri")
+    parser.add_argument("--base", default="CooperMobileBench")
+    parser.add_argument("--limpiar", action="store_true", help="Borra las colecciones antes de cargar")
+    parser.add_argument("--indices", choices=("antes", "despues", "no"), default="despues")
+    parser.add_argument("--contrasena", default="Bench-1234")
+    parser.add_argument("--seco", action="store_true", help="Genera sin insertar (mide la generación)")
+    args = parser.parse_args()
+
+    if not args.seco and not args.mongo_uri:
+        parser.error("--mongo-uri es obligatorio (o --seco para solo generar)")
+    if args.base == "CooperMobile":
+        parser.error("no se generan datos sintéticos en la base de producción")
+
+    from hashing import obtener_contexto
+    opciones = {
+        "semilla": args.semilla, "hasta": datetime.fromisoformat(args.hasta).isoformat(),
+        "dias": args.dias, "anios": args.anios, "lote": args.lote,
+        "tickets_zipf": args.tickets_zipf, "tickets_maximo": args.tickets_maximo,
+        "hash": obtener_contexto().hash(args.contrasena),
+    }
+
+    if not args.seco:
+        from pymongo import MongoClient
+        os.environ["MONGO_URI"] = args.mongo_uri
+        os.environ["MONGO_DB"] = args.base
+        with MongoClient(args.mongo_uri) as cliente:
+            asyncio.run(_preparar(args, cliente[args.base]))
+
+    tramos = [(t, a, min(a + args.tramo, args.usuarios)) for t, a in enumerate(range(0, args.usuarios, args.tramo))]
+    total, inicio, reporte = Counter({"plans": len(PLANES)}), time.perf_counter(), time.perf_counter()
+    print(f"🎲 {args.usuarios:,} usuarios, {args.dias} días, {len(tramos)} tramos, {args.procesos} procesos"
+          f"{' (en seco)' if args.seco else ''}")
+    contexto = multiprocessing.get_context("spawn")
+    with contexto.Pool(args.procesos, _iniciar_proceso, (None if args.seco else args.mongo_uri, args.base, opciones)) as pool:
+        for hechos, conteo in enumerate(pool.imap_unordered(_cargar_tramo, tramos), 1):
+            total.update(conteo)
+            if time.perf_counter() - reporte > 5:
+                reporte = time.perf_counter()
+                print(f"  {hechos}/{len(tramos)} tramos, {sum(total.values()) / (reporte - inicio):,.0f} docs/s")
+    duracion = time.perf_counter() - inicio
+
+    for coleccion in COLECCIONES:
+        print(f"{coleccion:<20} {total[coleccion]:>14,}")
+    print(f"{'total':<20} {sum(total.values()):>14,} docs en {duracion:.1f}s "
+          f"({sum(total.values()) / duracion:,.0f} docs/s)")
+
+    if not args.seco and args.indices == "despues":
+        inicio = time.perf_counter()
+        asyncio.run(_indexar())
+        print(f"📇 Índices creados en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
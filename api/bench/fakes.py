@@ -0,0 +1,135 @@
+"""Servidores locales que imitan a los proveedores externos.
+
+Sirven para medir la API sin salir a internet. Cada fake es una app ASGI
+que se levanta con ``servidor_local`` en un puerto libre.
+"""
+import asyncio
+import contextlib
+import random
+import socket
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def crear_fake_vonage(latencia: float = 0.0, tasa_error: float = 0.0):
+    """Imita ``POST /sms/json`` de Vonage.
+
+    ``tasa_error`` es la fracción de peticiones que responde con status 1
+    (throttled) para ejercitar los reintentos.
+    """
+    app = FastAPI()
+    app.state.recibidos = []
+
+    @app.post("/sms/json")
+    async def sms(request: Request):
+        form = await request.form()
+        if latencia:
+            await asyncio.sleep(latencia)
+        if random.random() < tasa_error:
+            return {"message-count": "1", "messages": [{"status": "1", "error-text": "Throttled"}]}
+        app.state.recibidos.append(dict(form))
+        return {"message-count": "1", "messages": [{"to": form.get("to"), "status": "0"}]}
+
+    return app
+
+
+def crear_fake_pusher(latencia: float = 0.0):
+    """Imita ``POST /apps/{app_id}/events`` y ``/batch_events`` de Pusher.
+
+    No valida la firma; guarda los eventos recibidos en ``app.state.eventos``.
+    """
+    app = FastAPI()
+    app.state.eventos = []
+    app.state.peticiones = 0
+
+    @app.post("/apps/{app_id}/events")
+    async def evento(app_id: str, request: Request):
+        app.state.peticiones += 1
+        if latencia:
+            await asyncio.sleep(latencia)
+        app.state.eventos.append(await request.json())
+        return {}
+
+    @app.post("/apps/{app_id}/batch_events")
+    async def lote(app_id: str, request: Request):
+        app.state.peticiones += 1
+        if latencia:
+            await asyncio.sleep(latencia)
+        cuerpo = await request.json()
+        if len(cuerpo.get("batch", [])) > 10:
+            return JSONResponse(status_code=400, content={"error": "Batch too large"})
+        app.state.eventos.extend(cuerpo["batch"])
+        return {"batch": [{} for _ in cuerpo["batch"]]}
+
+    @app.get("/apps/{app_id}/channels")
+    async def canales(app_id: str):
+        return {"channels": {}}
+
+    return app
+
+
+def crear_fake_mercadopago(latencia: float = 0.0, status_pago: str = "approved"):
+    """Imita las rutas de MercadoPago que usa la API.
+
+    ``POST /checkout/preferences``, ``GET /v1/payments/{id}`` y
+    ``GET /v1/payment_methods`` (revisión de salud); cuenta las
+    llamadas en ``app.state.llamadas`` para verificar cachés.
+    """
+    app = FastAPI()
+    app.state.llamadas = {"preferencias": 0, "pagos": 0}
+    app.state.status_pago = status_pago
+
+    @app.post("/checkout/preferences")
+    async def preferencia(request: Request):
+        app.state.llamadas["preferencias"] += 1
+        if latencia:
+            await asyncio.sleep(latencia)
+        data = await request.json()
+        pref_id = f"pref-{app.state.llamadas['preferencias']}"
+        return JSONResponse(status_code=201, content={
+            "id": pref_id,
+            "init_point": f"https://www.mercadopago.com.mx/checkout/v1/redirect?pref_id={pref_id}",
+            "sandbox_init_point": f"https://sandbox.mercadopago.com.mx/checkout/v1/redirect?pref_id={pref_id}",
+            "external_reference": data.get("external_reference"),
+        })
+
+    @app.get("/v1/payments/{payment_id}")
+    async def pago(payment_id: str):
+        app.state.llamadas["pagos"] += 1
+        if latencia:
+            await asyncio.sleep(latencia)
+        return {
+            "id": int(payment_id) if payment_id.isdigit() else payment_id,
+            "status": app.state.status_pago,
+            "status_detail": "accredited" if app.state.status_pago == "approved" else "pending_contingency",
+            "transaction_amount": 100.0,
+        }
+
+    @app.get("/v1/payment_methods")
+    async def metodos_de_pago():
+        return []
+
+    return app
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def servidor_local(app, puerto: int = None):
+    """Levanta ``app`` con uvicorn en 127.0.0.1 y devuelve su URL base."""
+    puerto = puerto or puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning"))
+    tarea = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{puerto}"
+    finally:
+        servidor.should_exit = True
+        await tarea
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+
+
+class VueloUnico:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola.
+
+    Mientras ``await fn()`` está en curso, las demás llamadas con esa clave
+    esperan el mismo resultado en vez de repetir el trabajo.
+    """
+
+    def __init__(self):
+        self._vuelos = {}
+
+    def __len__(self):
+        return len(self._vuelos)
+
+    async def hacer(self, clave, fn):
+        tarea = self._vuelos.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(fn())
+            self._vuelos[clave] = tarea
+            tarea.add_done_callback(lambda f: self._vuelos.get(clave) is f and self._vuelos.pop(clave))
+        return await asyncio.shield(tarea)
+
+    def olvidar(self, clave=None):
+        """Las siguientes llamadas con ``clave`` (o con cualquiera) empiezan otro vuelo.
+
+        Quien ya espera el vuelo anterior recibe su resultado igual.
+        """
+        if clave is None:
+            self._vuelos.clear()
+        else:
+            self._vuelos.pop(clave, None)
+
+
+class CacheTTL:
+    """Caché en memoria por worker con expiración e invalidación por clave.
+
+    - Las entradas caducan ``ttl`` segundos después de guardarse.
+    - Se expulsan las menos usadas cuando se supera ``max_entradas`` o
+      ``max_bytes`` (el tamaño de cada entrada lo indica quien la guarda).
+    - Invalidar una clave descarta la carga en curso de esa clave (no llega a
+      guardarse, así nunca se reinstala un dato viejo) sin tocar las cargas
+      de las demás.
+    """
+
+    def __init__(self, ttl: float, max_entradas: int = 1024, max_bytes: int = None):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._cargas = VueloUnico()
+        # Clave → marca de la carga en curso; invalidar la borra
+        self._en_curso = {}
+
+    def __len__(self):
+        return len(self._datos)
+
+    def get(self, clave):
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            self.fallos += 1
+            return None
+        expira, valor, _ = entrada
+        if expira < time.monotonic():
+            self._quitar(clave)
+            self.fallos += 1
+            return None
+        self._datos.move_to_end(clave)
+        self.aciertos += 1
+        return valor
+
+    def set(self, clave, valor, tamano: int = 0):
+        if clave in self._datos:
+            self._quitar(clave)
+        self._datos[clave] = (time.monotonic() + self.ttl, valor, tamano)
+        self._bytes += tamano
+        while self._datos and (
+            len(self._datos) > self.max_entradas
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._quitar(next(iter(self._datos)))
+
+    def invalidar(self, clave=None):
+        """Borra una clave o, sin argumentos, toda la caché."""
+        self._cargas.olvidar(clave)
+        if clave is None:
+            self._en_curso.clear()
+            self._datos.clear()
+            self._bytes = 0
+            return
+        self._en_curso.pop(clave, None)
+        if clave in self._datos:
+            self._quitar(clave)
+
+    async def obtener_o_cargar(self, clave, cargador, tamano=None):
+        """Devuelve la entrada o la carga con ``await cargador()``.
+
+        Las peticiones concurrentes por la misma clave comparten una sola
+        carga. ``tamano(valor)`` calcula los bytes que ocupa el resultado.
+        """
+        valor = self.get(clave)
+        if valor is not None:
+            return valor
+
+        return await self._cargas.hacer(clave, lambda: self._cargar(clave, cargador, tamano))
+
+    async def _cargar(self, clave, cargador, tamano):
+        marca = self._en_curso[clave] = object()
+        try:
+            valor = await cargador()
+        finally:
+            vigente = self._en_curso.get(clave) is marca
+            if vigente:
+                del self._en_curso[clave]
+        if valor is not None and vigente:
+            self.set(clave, valor, tamano(valor) if tamano else 0)
+        return valor
+
+    def _quitar(self, clave):
+        _, _, tamano = self._datos.pop(clave)
+        self._bytes -= tamano
+
+
+class VersionCompartida:
+    """Número de versión en Mongo para invalidar una caché en todos los workers.
+
+    Quien modifica el dato llama ``subir()``; cada worker revisa la versión
+    cada ``intervalo`` segundos y llama ``al_cambiar()`` cuando difiere de la
+    última que vio. La primera revisión siempre invalida: lo cargado antes de
+    conocer la versión pudo quedar viejo.
+    """
+
+    def __init__(self, coleccion, clave: str, al_cambiar, intervalo: float):
+        self.coleccion = coleccion
+        self.clave = clave
+        self.al_cambiar = al_cambiar
+        self.intervalo = intervalo
+        self._vista = None
+        self._tarea = None
+
+    async def subir(self):
+        """Publica un cambio para todos los workers e invalida el de este."""
+        doc = await self.coleccion.find_one_and_update(
+            {"_id": self.clave}, {"$inc": {"version": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        self._vista = doc["version"]
+        self.al_cambiar()
+
+    async def revisar(self) -> bool:
+        """Lee la versión; ``True`` si cambió (y ya se llamó ``al_cambiar``)."""
+        doc = await self.coleccion.find_one({"_id": self.clave})
+        version = doc["version"] if doc else 0
+        if version == self._vista:
+            return False
+        self._vista = version
+        self.al_cambiar()
+        return True
+
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            try:
+                await self.revisar()
+            except Exception:
+                logging.exception("❌ Error al revisar la versión de %s", self.clave)
+            await asyncio.sleep(self.intervalo)
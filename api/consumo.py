@@ -0,0 +1,113 @@
+"""Consumo de datos por usuario como serie de tiempo.
+
+Cada registro es un documento ``{"userId": ObjectId, "ts": datetime, "bytes": int}``
+en la colección data_usage_events (colección time-series de MongoDB, ver
+indices.py). Los resúmenes por día/semana/mes se calculan con NumPy sobre
+los registros del rango pedido, así que el costo depende del rango y no de
+la antigüedad de la cuenta.
+
+Uso:
+    python consumo.py --migrar    # pasa los daily_usage de data_usage a la serie
+"""
+import argparse
+import asyncio
+import sys
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+from database import get_db, usage_events_collection
+
+MAX_DIAS_RANGO = 731
+
+# Factores de las unidades que usa daily_usage (ver DataUsageModel)
+BYTES_POR_UNIDAD = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def _inicio_de_periodo(dias: np.ndarray, periodo: str) -> np.ndarray:
+    """Trunca fechas ``datetime64[D]`` al inicio de su día, semana (lunes) o mes."""
+    if periodo == "dia":
+        return dias
+    if periodo == "semana":
+        # 1970-01-01 fue jueves: (d + 3) % 7 es la distancia al lunes anterior
+        return dias - (dias.astype(np.int64) + 3) % 7
+    return dias.astype("datetime64[M]").astype("datetime64[D]")
+
+
+def agrupar(ts: np.ndarray, cantidades: np.ndarray, desde: date, hasta: date, periodo: str):
+    """Suma ``cantidades`` por periodo entre ``desde`` y ``hasta`` (inclusive).
+
+    Regresa ``(inicios, totales)``; los periodos sin consumo quedan en cero.
+    """
+    calendario = np.arange(np.datetime64(desde, "D"), np.datetime64(hasta, "D") + 1)
+    inicios = np.unique(_inicio_de_periodo(calendario, periodo))
+    claves = _inicio_de_periodo(ts.astype("datetime64[D]"), periodo)
+    posiciones = np.searchsorted(inicios, claves)
+    totales = np.bincount(posiciones, weights=cantidades, minlength=len(inicios))
+    return inicios, totales.astype(np.int64)
+
+
+async def leer_rango(user_id: ObjectId, desde: date, hasta: date):
+    """Registros del usuario en el rango como arreglos ``(ts, bytes)``."""
+    filtro = {
+        "userId": user_id,
+        "ts": {"$gte": datetime.combine(desde, time.min), "$lt": datetime.combine(hasta + timedelta(days=1), time.min)},
+    }
+    marcas, cantidades = [], []
+    async for doc in usage_events_collection.find(filtro, {"_id": 0, "ts": 1, "bytes": 1}):
+        marcas.append(doc["ts"])
+        cantidades.append(doc["bytes"])
+    return np.array(marcas, dtype="datetime64[ms]"), np.array(cantidades, dtype=np.float64)
+
+
+async def resumen_consumo(user_id: ObjectId, desde: date, hasta: date, periodo: str) -> dict:
+    ts, cantidades = await leer_rango(user_id, desde, hasta)
+    inicios, totales = agrupar(ts, cantidades, desde, hasta, periodo)
+    return {
+        "user_id": str(user_id),
+        "periodo": periodo,
+        "desde": desde.isoformat(),
+        "hasta": hasta.isoformat(),
+        "total_bytes": int(totales.sum()),
+        "puntos": [
+            {"inicio": inicio, "bytes": total}
+            for inicio, total in zip(np.datetime_as_string(inicios).tolist(), totales.tolist())
+        ],
+    }
+
+
+# 📦 Migración del formato anterior (un documento con daily_usage por usuario)
+async def migrar_historial(db=None) -> int:
+    db = db if db is not None else get_db()
+    migrados = 0
+    async for doc in db["data_usage"].find({"migradoEn": {"$exists": False}}):
+        registros = [
+            {
+                "userId": doc["userId"],
+                "ts": dia["date"],
+                "bytes": int(dia["dataUsed"] * BYTES_POR_UNIDAD.get(str(dia.get("unit", "GB")).upper(), 1024 ** 3)),
+            }
+            for dia in doc.get("daily_usage", [])
+        ]
+        if registros:
+            await db["data_usage_events"].insert_many(registros, ordered=False)
+        await db["data_usage"].update_one({"_id": doc["_id"]}, {"$set": {"migradoEn": datetime.utcnow()}})
+        migrados += len(registros)
+    return migrados
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Consumo de datos de Copper Mobil")
+    parser.add_argument("--migrar", action="store_true", help="Copia daily_usage a data_usage_events")
+    args = parser.parse_args()
+
+    if args.migrar:
+        from indices import asegurar_indices
+        await asegurar_indices()
+        print(f"✅ {await migrar_historial()} registros migrados")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
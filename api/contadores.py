@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import data_usage_collection
+from metricas import Counter, Gauge, Histogram
+
+# 🧮 Totales de consumo por usuario con escritura diferida
+# Cada registro de consumo suma en memoria (un dict por usuario) y una tarea
+# vuelca los acumulados cada CONSUMO_FLUSH_MS como un solo bulk_write de
+# $inc por usuario, en data_usage (bytesTotal, eventos). Si el volcado falla
+# los montos regresan al acumulador y se reintentan; al apagar se vacía todo.
+# Los registros crudos de data_usage_events siguen siendo la fuente de verdad.
+
+CONSUMO_FLUSH_MS = float(os.getenv("CONSUMO_FLUSH_MS", "500"))
+CONSUMO_MAX_PENDIENTES = int(os.getenv("CONSUMO_MAX_PENDIENTES", "50000"))
+
+acumulador_usuarios = Gauge("consumo_acumulador_usuarios", "Usuarios con consumo sin volcar")
+acumulador_retraso = Gauge("consumo_acumulador_retraso_segundos", "Antigüedad del consumo más viejo sin volcar")
+acumulador_volcado = Histogram("consumo_acumulador_volcado_segundos", "Duración de cada volcado de $inc")
+acumulador_fallos = Counter("consumo_acumulador_fallos_total", "Operaciones de $inc que se reintentarán")
+
+
+class AcumuladorConsumo:
+    def __init__(self, coleccion=data_usage_collection, intervalo_ms: float = CONSUMO_FLUSH_MS,
+                 max_pendientes: int = CONSUMO_MAX_PENDIENTES):
+        self.coleccion = coleccion
+        self.intervalo = intervalo_ms / 1000
+        self.max_pendientes = max_pendientes
+        self._bytes = {}
+        self._eventos = {}
+        self._desde = None
+        self._lleno = asyncio.Event()
+        self._volcando = asyncio.Lock()
+        self._tarea = None
+
+    def sumar(self, user_id, cantidad: int, eventos: int = 1):
+        self._bytes[user_id] = self._bytes.get(user_id, 0) + cantidad
+        self._eventos[user_id] = self._eventos.get(user_id, 0) + eventos
+        if self._desde is None:
+            self._desde = time.monotonic()
+        acumulador_usuarios.set(len(self._bytes))
+        if len(self._bytes) >= self.max_pendientes:
+            self._lleno.set()
+
+    def sumar_documentos(self, docs):
+        """Suma registros ``{"userId", "bytes"}`` ya insertados en data_usage_events."""
+        for doc in docs:
+            self.sumar(doc["userId"], doc["bytes"])
+
+    def pendiente(self, user_id) -> int:
+        """Bytes de este worker que todavía no llegan a Mongo."""
+        return self._bytes.get(user_id, 0)
+
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self, intentos: int = 3):
+        """Detiene la tarea y vuelca todo lo pendiente antes de apagar."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+        for _ in range(intentos):
+            await self.volcar()
+            if not self._bytes:
+                return
+            await asyncio.sleep(0.5)
+        logging.error("❌ Se perdieron los totales de consumo de %d usuarios al apagar", len(self._bytes))
+
+    async def _bucle(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._lleno.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._lleno.clear()
+            try:
+                await self.volcar()
+            except Exception:
+                logging.exception("❌ Error al volcar los totales de consumo")
+
+    async def volcar(self):
+        async with self._volcando:
+            acumulador_retraso.set(time.monotonic() - self._desde if self._desde is not None else 0)
+            if not self._bytes:
+                return
+            bytes_, eventos, desde = self._bytes, self._eventos, self._desde
+            self._bytes, self._eventos, self._desde = {}, {}, None
+            acumulador_usuarios.set(0)
+
+            ahora = datetime.utcnow()
+            usuarios = list(bytes_)
+            operaciones = [
+                UpdateOne(
+                    {"userId": u},
+                    {"$inc": {"bytesTotal": bytes_[u], "eventos": eventos[u]}, "$set": {"actualizadoEn": ahora}},
+                    upsert=True,
+                )
+                for u in usuarios
+            ]
+            fallidos = []
+            with acumulador_volcado.tiempo():
+                try:
+                    await self.coleccion.bulk_write(operaciones, ordered=False)
+                except BulkWriteError as e:
+                    # Con ordered=False solo fallan las operaciones listadas
+                    fallidos = [usuarios[w["index"]] for w in e.details.get("writeErrors", [])]
+                except Exception as e:
+                    logging.warning("❌ No se pudieron volcar los totales de consumo: %s", e)
+                    fallidos = usuarios
+
+            if fallidos:
+                acumulador_fallos.inc(len(fallidos))
+                for u in fallidos:
+                    self.sumar(u, bytes_[u], eventos[u])
+                # El retraso se sigue midiendo desde el consumo original
+                self._desde = min(self._desde, desde)
+            acumulador_usuarios.set(len(self._bytes))
@@ -1,21 +1,103 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
+from metricas import crear_monitor_mongo
+
 # Cargar variables del entorno
 load_dotenv()
 
 # Usar la URI de la variable de entorno
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+DB_NAME = os.getenv("MONGO_DB", "CooperMobile")
+
+# Tamaño del pool de conexiones por worker
+MONGO_MAX_POOL = int(os.getenv("MONGO_MAX_POOL", "50"))
+MONGO_MIN_POOL = int(os.getenv("MONGO_MIN_POOL", "0"))
+
+# 🔌 Cliente asíncrono, uno por proceso (cada worker de uvicorn crea el suyo)
+_client = None
+_client_pid = None
+_db = None
+
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL,
+            minPoolSize=MONGO_MIN_POOL,
+            event_listeners=[crear_monitor_mongo()],
+        )
+        _client_pid = os.getpid()
+    return _client
+
+
+def cerrar_cliente():
+    """Cierra el pool de conexiones de este proceso (al apagar el worker)."""
+    global _client
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+    _client = None
+
+
+def get_db():
+    if _db is not None:
+        return _db
+    return get_client()[DB_NAME]
+
+
+def usar_base_de_datos(db):
+    """Sustituye la base de datos del proceso (p. ej. por una falsa en pruebas).
+
+    Con ``None`` se vuelve al cliente real de MongoDB.
+    """
+    global _db
+    _db = db
+
+
+def crear_base_de_datos_falsa():
+    """Base de datos en memoria con la misma API asíncrona que Motor.
+
+    Requiere ``mongomock-motor`` (requirements-dev.txt); solo se importa al usarse.
+    """
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()[DB_NAME]
+
+
+class ColeccionAsync:
+    """Referencia perezosa a una colección.
+
+    Cada acceso resuelve la colección en la base de datos activa, así los
+    módulos pueden importarla una sola vez aunque se cambie de cliente.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.nombre], attr)
+
+    def __repr__(self):
+        return f"ColeccionAsync({self.nombre!r})"
+
 
 # Base de datos
-db = client["CooperMobile"]
-users_collection = db["users"]
-transactions_collection = db["transactions"]
-plans_collection = db["plans"]
-data_usage_collection = db["data_usage"]
-support_tickets_collection = db["support_tickets"]
-faq_collection = db["faq"]
-chip_requests_collection = db["chip_requests"]
-otp_collection = db ["otp"]
\ No newline at end of file
+users_collection = ColeccionAsync("users")
+transactions_collection = ColeccionAsync("transactions")
+plans_collection = ColeccionAsync("plans")
+data_usage_collection = ColeccionAsync("data_usage")
+usage_events_collection = ColeccionAsync("data_usage_events")
+usage_rollups_collection = ColeccionAsync("data_usage_rollups")
+rollup_marks_collection = ColeccionAsync("rollup_marks")
+forecasts_collection = ColeccionAsync("quota_forecasts")
+support_tickets_collection = ColeccionAsync("support_tickets")
+faq_collection = ColeccionAsync("faq")
+chip_requests_collection = ColeccionAsync("chip_requests")
+otp_collection = ColeccionAsync("otp")
+sms_outbox_collection = ColeccionAsync("sms_outbox")
+payments_collection = ColeccionAsync("payments")
+rate_limits_collection = ColeccionAsync("rate_limits")
+api_status_collection = ColeccionAsync("api_status")
+cache_versions_collection = ColeccionAsync("cache_versions")
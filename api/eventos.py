@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from metricas import Counter, Gauge, llamadas_salida
+
+# 📡 Publicación de eventos de Pusher en segundo plano
+# Los handlers solo llaman a publicar(), que nunca bloquea: el evento queda en
+# un buffer y una tarea lo envía con la API batch_events de Pusher. Dentro de
+# la misma ventana, eventos repetidos (mismo canal y nombre) se fusionan y se
+# envía solo el último.
+
+PUSHER_VENTANA = float(os.getenv("PUSHER_VENTANA", "0.25"))
+PUSHER_MAX_PENDIENTES = int(os.getenv("PUSHER_MAX_PENDIENTES", "100"))
+PUSHER_TIMEOUT = float(os.getenv("PUSHER_TIMEOUT", "5"))
+MAX_EVENTOS_POR_LOTE = 10  # límite de la API batch_events
+
+pusher_eventos = Counter("pusher_eventos_total", "Eventos de Pusher por resultado", etiquetas=("resultado",))
+pusher_pendientes = Gauge("pusher_pendientes", "Eventos esperando a ser publicados")
+pusher_latencia = llamadas_salida.labels("pusher", "batch_events")
+pusher_salud = llamadas_salida.labels("pusher", "salud")
+
+_publicados = pusher_eventos.labels("publicado")
+_fusionados = pusher_eventos.labels("fusionado")
+_descartados = pusher_eventos.labels("descartado")
+_fallidos = pusher_eventos.labels("fallido")
+
+
+def crear_cliente_pusher():
+    """Cliente de Pusher solo para firmar peticiones; el envío lo hace httpx.
+
+    ``PUSHER_HOST``/``PUSHER_PORT``/``PUSHER_SSL`` permiten apuntar a un
+    servidor local en pruebas.
+    """
+    from pusher.pusher_client import PusherClient
+
+    opciones = {}
+    if os.getenv("PUSHER_HOST"):
+        opciones["host"] = os.getenv("PUSHER_HOST")
+        opciones["port"] = int(os.getenv("PUSHER_PORT", "80"))
+        opciones["ssl"] = os.getenv("PUSHER_SSL", "0") == "1"
+    else:
+        opciones["cluster"] = os.getenv("PUSHER_CLUSTER")
+        opciones["ssl"] = True
+    return PusherClient(
+        app_id=os.getenv("PUSHER_APP_ID"),
+        key=os.getenv("PUSHER_KEY"),
+        secret=os.getenv("PUSHER_SECRET"),
+        **opciones
+    )
+
+
+class PublicadorPusher:
+    def __init__(self, cliente=None, ventana: float = PUSHER_VENTANA,
+                 max_pendientes: int = PUSHER_MAX_PENDIENTES, timeout: float = PUSHER_TIMEOUT):
+        self.cliente = cliente
+        self.ventana = ventana
+        self.max_pendientes = max_pendientes
+        self.timeout = timeout
+        self._pendientes = {}
+        self._hay_eventos = asyncio.Event()
+        self._http = None
+        self._tarea = None
+
+    async def iniciar(self):
+        """Crea los clientes de este worker; sin ``cliente`` se usa crear_cliente_pusher()."""
+        if self.cliente is None:
+            self.cliente = crear_cliente_pusher()
+        self._http = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+        )
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self):
+        """Detiene la tarea y publica lo que quede pendiente."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+        if self._http is not None:
+            await self._vaciar()
+            await self._http.aclose()
+            self._http = None
+
+    async def verificar(self):
+        """Lista los canales de la app: comprueba red y credenciales (ver salud.py)."""
+        peticion = self.cliente.channels_info.make_request()
+        with pusher_salud.tiempo():
+            r = await self._http.get(peticion.url, headers=peticion.headers)
+        r.raise_for_status()
+
+    def publicar(self, canal: str, evento: str, datos: dict):
+        clave = (canal, evento)
+        if clave in self._pendientes:
+            _fusionados.inc()
+        elif len(self._pendientes) >= self.max_pendientes:
+            _descartados.inc()
+            return
+        self._pendientes[clave] = datos
+        pusher_pendientes.set(len(self._pendientes))
+        self._hay_eventos.set()
+
+    async def _bucle(self):
+        while True:
+            await self._hay_eventos.wait()
+            await asyncio.sleep(self.ventana)
+            self._hay_eventos.clear()
+            await self._vaciar()
+
+    async def _vaciar(self):
+        if not self._pendientes:
+            return
+        lote = [{"channel": c, "name": e, "data": d} for (c, e), d in self._pendientes.items()]
+        self._pendientes = {}
+        pusher_pendientes.set(0)
+
+        for i in range(0, len(lote), MAX_EVENTOS_POR_LOTE):
+            parte = lote[i:i + MAX_EVENTOS_POR_LOTE]
+            inicio = time.perf_counter()
+            try:
+                peticion = self.cliente.trigger_batch.make_request(parte)
+                r = await self._http.post(peticion.url, content=peticion.body, headers=peticion.headers)
+                r.raise_for_status()
+                _publicados.inc(len(parte))
+            except Exception as e:
+                _fallidos.inc(len(parte))
+                logging.warning("❌ Error al publicar en Pusher (%d eventos): %s", len(parte), e)
+            finally:
+                pusher_latencia.observe(time.perf_counter() - inicio)
@@ -0,0 +1,139 @@
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import Counter, Gauge, Histogram
+
+# 🧱 Hashing de contraseñas fuera del event loop
+# bcrypt libera el GIL, así que un pool de hilos acotado basta para que un
+# pico de logins no bloquee al resto de rutas del worker. passlib y el pool
+# se crean al primer uso, uno por proceso: ni alargan el arranque ni se
+# heredan hilos del proceso padre tras un fork.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_MAX_COLA = int(os.getenv("HASH_MAX_COLA", "32"))
+
+# Rondas de bcrypt para hashes nuevos. Con HASH_REHASH=1 los hashes con otro
+# costo se recalculan en el siguiente login exitoso (hacia arriba o abajo).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_REHASH = os.getenv("HASH_REHASH", "0") == "1"
+
+_pwd_context = None
+
+
+def obtener_contexto():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        if HASH_REHASH:
+            _pwd_context = CryptContext(
+                schemes=["bcrypt"], deprecated="auto",
+                bcrypt__rounds=BCRYPT_ROUNDS,
+                bcrypt__min_rounds=BCRYPT_ROUNDS,
+                bcrypt__max_rounds=BCRYPT_ROUNDS,
+            )
+        else:
+            _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+hash_duracion = Histogram(
+    "hash_duracion_segundos", "Tiempo de bcrypt en el pool, sin contar la espera",
+    etiquetas=("operacion",),
+)
+hash_espera = Histogram("hash_espera_segundos", "Tiempo en cola antes de entrar al pool de bcrypt")
+hash_cola = Gauge("hash_cola", "Operaciones de bcrypt esperando un hilo libre")
+hash_rechazos = Counter("hash_rechazos_total", "Operaciones rechazadas por pool saturado")
+
+_duracion_hash = hash_duracion.labels("hash")
+_duracion_verify = hash_duracion.labels("verify")
+
+
+class PoolSaturado(Exception):
+    """El pool de hashing no admite más trabajo; el cliente debe reintentar."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Pool de hashing saturado")
+        self.retry_after = retry_after
+
+
+class PoolHash:
+    def __init__(self, workers: int = HASH_WORKERS, max_cola: int = HASH_MAX_COLA):
+        self.workers = workers
+        self.max_cola = max_cola
+        self.pendientes = 0
+        self._promedio = 0.25  # segundos por operación, se ajusta con EWMA
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.pendientes / self.workers * self._promedio))
+
+    async def ejecutar(self, fn, *args, metrica=None):
+        if self.pendientes >= self.workers + self.max_cola:
+            hash_rechazos.inc()
+            raise PoolSaturado(self._retry_after())
+
+        self.pendientes += 1
+        hash_cola.set(max(0, self.pendientes - self.workers))
+        encolado = time.perf_counter()
+
+        def tarea():
+            inicio = time.perf_counter()
+            resultado = fn(*args)
+            return resultado, inicio, time.perf_counter()
+
+        try:
+            resultado, inicio, fin = await asyncio.get_running_loop().run_in_executor(self._executor, tarea)
+        finally:
+            self.pendientes -= 1
+            hash_cola.set(max(0, self.pendientes - self.workers))
+
+        hash_espera.observe(inicio - encolado)
+        if metrica is not None:
+            metrica.observe(fin - inicio)
+        self._promedio = 0.8 * self._promedio + 0.2 * (fin - inicio)
+        return resultado
+
+    def cerrar(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_pid = None
+
+
+def obtener_pool() -> PoolHash:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool, _pool_pid = PoolHash(), os.getpid()
+    return _pool
+
+
+def cerrar_pool():
+    """Espera a que terminen los hashes en curso y libera los hilos."""
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.cerrar()
+    _pool = None
+
+
+async def hash_password(password: str) -> str:
+    return await obtener_pool().ejecutar(obtener_contexto().hash, password, metrica=_duracion_hash)
+
+
+async def verify_password(plain, hashed) -> bool:
+    return await obtener_pool().ejecutar(obtener_contexto().verify, plain, hashed, metrica=_duracion_verify)
+
+
+async def verify_and_update_password(plain, hashed):
+    """Verifica y, si el hash usa otros parámetros, devuelve uno nuevo.
+
+    Regresa ``(valido, nuevo_hash)``; ``nuevo_hash`` es ``None`` si no hace
+    falta rehashear o si HASH_REHASH está desactivado.
+    """
+    if not HASH_REHASH:
+        return await verify_password(plain, hashed), None
+    return await obtener_pool().ejecutar(
+        obtener_contexto().verify_and_update, plain, hashed, metrica=_duracion_verify
+    )
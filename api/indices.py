@@ -0,0 +1,197 @@
+"""Índices de MongoDB que necesitan las rutas y auditoría de sus planes.
+
+Uso:
+    python indices.py --crear      # crea los índices declarados (idempotente)
+    python indices.py --auditar    # explain() de cada consulta; falla si hay COLLSCAN
+
+Al arrancar, main.py llama a ``asegurar_indices`` (MONGO_CREAR_INDICES=0 lo
+desactiva).
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from database import get_db
+from paginacion import ORDEN
+
+# 📇 Índices por colección
+INDICES = {
+    "users": [
+        IndexModel([("phone", ASCENDING)], name="phone_unico", unique=True),
+        # Hay usuarios con email null: solo los emails de verdad deben ser únicos
+        IndexModel([("email", ASCENDING)], name="email_unico", unique=True,
+                   partialFilterExpression={"email": {"$type": "string"}}),
+        # Sondeo de cambios de la caché de perfiles (ver perfiles.py)
+        IndexModel([("updatedAt", ASCENDING)], name="updatedAt", sparse=True),
+    ],
+    "otp": [
+        # Un documento por teléfono (ver otp.py)
+        IndexModel([("phone", ASCENDING)], name="phone_unico", unique=True),
+        # Mongo borra los códigos al llegar a expiresAt
+        IndexModel([("expiresAt", ASCENDING)], name="expiresAt_ttl", expireAfterSeconds=0),
+    ],
+    "rate_limits": [
+        # Conteos compartidos de limites.py; se borran al vencer su ventana
+        IndexModel([("expiraEn", ASCENDING)], name="expiraEn_ttl", expireAfterSeconds=0),
+    ],
+    "support_tickets": [
+        # Paginación por cursor (ver paginacion.py)
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+                   name="userId_createdAt_id"),
+    ],
+    "chip_requests": [
+        # Paginación por cursor (ver paginacion.py)
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+                   name="userId_createdAt_id"),
+    ],
+    "data_usage": [
+        # Un documento por usuario: los $inc de contadores.py hacen upsert por userId
+        IndexModel([("userId", ASCENDING)], name="userId_unico", unique=True),
+    ],
+    "data_usage_events": [
+        IndexModel([("userId", ASCENDING), ("ts", ASCENDING)], name="userId_ts"),
+        # Ventanas de rollups.py por orden de llegada; sin él la colección
+        # normal de respaldo se recorre completa en cada pasada
+        IndexModel([("recibidoEn", ASCENDING)], name="recibidoEn"),
+        # Reconstrucciones de rollups.py y registros anteriores a recibidoEn
+        IndexModel([("ts", ASCENDING)], name="ts"),
+    ],
+    "data_usage_rollups": [
+        # Un acumulado por usuario, granularidad e inicio (ver rollups.py)
+        IndexModel([("userId", ASCENDING), ("granularidad", ASCENDING), ("inicio", ASCENDING)],
+                   name="userId_granularidad_inicio", unique=True),
+    ],
+    "sms_outbox": [
+        IndexModel([("status", ASCENDING), ("proximoIntento", ASCENDING)], name="status_proximoIntento"),
+        IndexModel([("status", ASCENDING), ("bloqueadoHasta", ASCENDING)], name="status_bloqueadoHasta"),
+    ],
+}
+
+# ⏱️ Colecciones time-series: se crean antes que sus índices
+SERIES_DE_TIEMPO = {
+    # Registros de consumo (ver consumo.py); Mongo los agrupa en buckets por usuario
+    "data_usage_events": {"timeField": "ts", "metaField": "userId", "granularity": "hours"},
+}
+
+# 🔍 Consultas representativas de cada ruta: (ruta, colección, filtro, orden)
+# plans y faq se leen completos a propósito y no se auditan.
+_ID = ObjectId()
+_AHORA = datetime.utcnow()
+CONSULTAS_AUDITADAS = [
+    ("POST /api/users/", "users", {"phone": "+520000000000"}, None),
+    ("POST /api/users/", "users", {"email": "auditoria@coppermobile.com"}, None),
+    ("PATCH /api/auth/update-profile", "users",
+     {"email": "auditoria@coppermobile.com", "_id": {"$ne": _ID}}, None),
+    ("GET /api/auth/profile/{user_id}", "users", {"_id": _ID}, None),
+    ("caché de perfiles", "users", {"updatedAt": {"$gt": _AHORA}}, [("updatedAt", ASCENDING)]),
+    ("POST /api/auth/send-otp", "otp", {"phone": "+520000000000"}, None),
+    ("POST /api/users/", "otp", {"phone": "+520000000000", "verified": True}, None),
+    ("GET /api/soporte/{user_id}", "support_tickets", {"userId": str(_ID)}, ORDEN),
+    ("GET /api/soporte/{user_id}?cursor=", "support_tickets",
+     {"userId": str(_ID), "$or": [{"createdAt": {"$lt": _AHORA.isoformat()}},
+                                  {"createdAt": _AHORA.isoformat(), "_id": {"$lt": _ID}}]}, ORDEN),
+    ("GET /api/chips/{user_id}", "chip_requests", {"userId": str(_ID)}, ORDEN),
+    ("GET /api/chips/{user_id}?cursor=", "chip_requests",
+     {"userId": str(_ID), "$or": [{"createdAt": {"$lt": _AHORA}},
+                                  {"createdAt": _AHORA, "_id": {"$lt": _ID}}]}, ORDEN),
+    ("GET /api/consumo/{user_id}", "data_usage", {"userId": _ID}, None),
+    ("GET /api/consumo/{user_id}?granularity=", "data_usage_rollups",
+     {"userId": _ID, "granularidad": "dia", "inicio": {"$gte": _AHORA, "$lt": _AHORA}}, [("inicio", ASCENDING)]),
+    ("GET /api/consumo/{user_id}/resumen", "data_usage_events",
+     {"userId": _ID, "ts": {"$gte": _AHORA, "$lt": _AHORA}}, None),
+    ("rollups.py", "data_usage_events", {"recibidoEn": {"$gt": _AHORA, "$lte": _AHORA}}, None),
+    ("rollups.py", "data_usage_events",
+     {"recibidoEn": {"$exists": False}, "ts": {"$gt": _AHORA, "$lte": _AHORA}}, None),
+    ("outbox de SMS", "sms_outbox", {"status": "pendiente", "proximoIntento": {"$lte": _AHORA}},
+     [("proximoIntento", ASCENDING)]),
+    ("outbox de SMS", "sms_outbox", {"status": "enviando", "bloqueadoHasta": {"$lt": _AHORA}}, None),
+]
+
+
+async def asegurar_series(db):
+    existentes = set(await db.list_collection_names())
+    for coleccion, opciones in SERIES_DE_TIEMPO.items():
+        if coleccion in existentes:
+            continue
+        try:
+            await db.create_collection(coleccion, timeseries=opciones)
+        except (OperationFailure, NotImplementedError) as e:
+            # Mongo < 5.0 o mongomock: queda como colección normal con los mismos índices
+            logging.warning("⚠️ %s se usará como colección normal: %s", coleccion, e)
+
+
+async def asegurar_indices(db=None):
+    """Crea las colecciones time-series y los índices declarados; lo existente no se toca."""
+    db = db if db is not None else get_db()
+    await asegurar_series(db)
+    for coleccion, modelos in INDICES.items():
+        try:
+            await db[coleccion].create_indexes(modelos)
+        except OperationFailure as e:
+            # Un índice con el mismo nombre pero otras opciones: hay que migrarlo a mano
+            logging.warning("⚠️ No se pudieron crear los índices de %s: %s", coleccion, e)
+
+
+# Planes que el optimizador descartó: un COLLSCAN ahí no se ejecuta
+_DESCARTADOS = {"rejectedPlans", "allPlansExecution"}
+
+
+def _etapas(plan):
+    """Etapas de todo el árbol de explain().
+
+    Recorre cualquier anidamiento: queryPlanner.winningPlan.queryPlan en
+    colecciones time-series, ``shards`` en clusters, executionStats, etc.
+    """
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for clave, valor in plan.items():
+            if clave not in _DESCARTADOS:
+                yield from _etapas(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas(valor)
+
+
+async def auditar_consultas(db=None):
+    """Regresa ``(ruta, colección, filtro)`` de cada consulta que usa COLLSCAN."""
+    db = db if db is not None else get_db()
+    fallas = []
+    for ruta, coleccion, filtro, orden in CONSULTAS_AUDITADAS:
+        cursor = db[coleccion].find(filtro)
+        if orden:
+            cursor = cursor.sort(orden)
+        explicacion = await cursor.explain()
+        if "COLLSCAN" in set(_etapas(explicacion)):
+            fallas.append((ruta, coleccion, filtro))
+    return fallas
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Índices de MongoDB de Copper Mobil")
+    parser.add_argument("--crear", action="store_true", help="Crea los índices declarados")
+    parser.add_argument("--auditar", action="store_true", help="Falla si alguna consulta hace COLLSCAN")
+    args = parser.parse_args()
+
+    if args.crear:
+        await asegurar_indices()
+        print("✅ Índices verificados")
+
+    if args.auditar:
+        fallas = await auditar_consultas()
+        for ruta, coleccion, filtro in fallas:
+            print(f"❌ COLLSCAN en {coleccion} ({ruta}): {filtro}")
+        if fallas:
+            return 1
+        print(f"✅ {len(CONSULTAS_AUDITADAS)} consultas usan índice")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
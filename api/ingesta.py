@@ -0,0 +1,203 @@
+import asyncio
+import hmac
+import json
+import os
+from bisect import bisect_left
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from pydantic import TypeAdapter, ValidationError
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database import usage_events_collection
+from metricas import Counter
+from models import UsageColumns, UsageRecord
+
+# 📥 Ingesta masiva de registros de consumo
+# La red envía miles de registros por petición, en NDJSON (uno por línea) o
+# en columnas ({"userId": [...], "ts": [...], "bytes": [...]}). Se validan
+# por lotes con pydantic y cada lote se escribe con un bulk_write no
+# ordenado mientras se valida el siguiente. Un registro inválido no tumba
+# su lote: se reporta con su número (posición en el cuerpo, desde 0).
+
+CONSUMO_LOTE = int(os.getenv("CONSUMO_LOTE", "5000"))
+CONSUMO_INGESTA_TOKEN = os.getenv("CONSUMO_INGESTA_TOKEN")
+MAX_ERRORES_POR_LOTE = 20
+
+ingesta_registros = Counter("consumo_ingesta_registros_total", "Registros de consumo recibidos", etiquetas=("resultado",))
+_insertados = ingesta_registros.labels("insertado")
+_rechazados = ingesta_registros.labels("rechazado")
+
+_lista_registros = TypeAdapter(List[UsageRecord])
+COLUMNAS = ("userId", "ts", "bytes")
+
+
+def token_valido(recibido) -> bool:
+    """Compara la cabecera X-Ingesta-Token en tiempo constante; sin token configurado nada pasa."""
+    if not CONSUMO_INGESTA_TOKEN or not recibido:
+        return False
+    return hmac.compare_digest(recibido.encode(), CONSUMO_INGESTA_TOKEN.encode())
+
+
+def _error(numero, mensaje):
+    return {"registro": numero, "error": mensaje}
+
+
+def _mensaje(error: dict) -> str:
+    campo = ".".join(str(p) for p in error["loc"] if not isinstance(p, int))
+    return f"{campo}: {error['msg']}" if campo else error["msg"]
+
+
+def _documento(user_id, ts, cantidad):
+    return {"userId": ObjectId(user_id), "ts": ts, "bytes": cantidad}
+
+
+def validar_lineas(lineas: List[bytes], primero: int):
+    """Valida líneas NDJSON; regresa ``(documentos, numeros, errores)``.
+
+    Primero se valida el lote completo de una sola vez; solo si algo falla se
+    repite línea por línea para separar las buenas de las malas.
+    """
+    try:
+        registros = _lista_registros.validate_json(b"[" + b",".join(lineas) + b"]")
+        # Una línea con dos objetos descuadraría la numeración
+        if len(registros) == len(lineas):
+            docs = [_documento(r.userId, r.ts, r.bytes) for r in registros]
+            return docs, range(primero, primero + len(lineas)), []
+    except ValidationError:
+        pass
+
+    docs, numeros, errores = [], [], []
+    for i, linea in enumerate(lineas, start=primero):
+        try:
+            r = UsageRecord.model_validate_json(linea)
+        except ValidationError as e:
+            errores.append(_error(i, _mensaje(e.errors()[0])))
+        else:
+            docs.append(_documento(r.userId, r.ts, r.bytes))
+            numeros.append(i)
+    return docs, numeros, errores
+
+
+def validar_columnas(cuerpo: bytes):
+    """Valida el cuerpo en columnas; regresa ``(datos, total, filas_malas)``.
+
+    Lanza ValueError si el cuerpo no sirve como conjunto (no es JSON, falta
+    una columna o las longitudes no coinciden).
+    """
+    try:
+        datos = UsageColumns.model_validate_json(cuerpo)
+        malos = {}
+    except ValidationError as e:
+        malos = {}
+        for error in e.errors():
+            loc = error["loc"]
+            if len(loc) < 2 or not isinstance(loc[1], int):
+                raise ValueError(_mensaje(error))
+            malos.setdefault(loc[1], _mensaje(error))
+        crudo = json.loads(cuerpo)
+        if len({len(crudo[c]) for c in COLUMNAS}) != 1:
+            raise ValueError("Las columnas userId, ts y bytes deben tener la misma longitud")
+        datos = UsageColumns.model_validate(
+            {c: [v for i, v in enumerate(crudo[c]) if i not in malos] for c in COLUMNAS}
+        )
+
+    total = len(datos.userId) + len(malos)
+    if len({len(datos.userId), len(datos.ts), len(datos.bytes)}) != 1:
+        raise ValueError("Las columnas userId, ts y bytes deben tener la misma longitud")
+    return datos, total, malos
+
+
+class Ingesta:
+    def __init__(self, tamano_lote: int = CONSUMO_LOTE, acumulador=None):
+        self.tamano_lote = tamano_lote
+        self.acumulador = acumulador
+        self.recibidos = 0
+        self.insertados = 0
+        self.lotes_con_errores = []
+        self._lotes = 0
+        self._escritura = None
+
+    async def ndjson(self, trozos):
+        """Consume un flujo de bytes NDJSON sin cargar el cuerpo completo."""
+        pendientes, resto = [], b""
+        async for trozo in trozos:
+            lineas = (resto + trozo).split(b"\n")
+            resto = lineas.pop()
+            pendientes.extend(l for l in lineas if l.strip())
+            while len(pendientes) >= self.tamano_lote:
+                lote, pendientes = pendientes[:self.tamano_lote], pendientes[self.tamano_lote:]
+                await self._enviar(*validar_lineas(lote, self.recibidos))
+        if resto.strip():
+            pendientes.append(resto)
+        if pendientes:
+            await self._enviar(*validar_lineas(pendientes, self.recibidos))
+
+    async def columnas(self, cuerpo: bytes):
+        datos, total, malos = validar_columnas(cuerpo)
+        buenos = [i for i in range(total) if i not in malos] if malos else range(total)
+
+        # Los lotes se cortan sobre la numeración original del cuerpo
+        for inicio in range(0, total, self.tamano_lote):
+            fin = min(total, inicio + self.tamano_lote)
+            a, b = bisect_left(buenos, inicio), bisect_left(buenos, fin)
+            docs = [_documento(*fila) for fila in zip(datos.userId[a:b], datos.ts[a:b], datos.bytes[a:b])]
+            errores = [_error(i, malos[i]) for i in range(inicio, fin) if i in malos] if malos else []
+            await self._enviar(docs, buenos[a:b], errores)
+
+    async def terminar(self) -> dict:
+        if self._escritura is not None:
+            await self._escritura
+            self._escritura = None
+        return {
+            "recibidos": self.recibidos,
+            "insertados": self.insertados,
+            "rechazados": self.recibidos - self.insertados,
+            "lotes_con_errores": self.lotes_con_errores,
+        }
+
+    async def _enviar(self, docs, numeros, errores):
+        lote = {"lote": self._lotes, "primero": self.recibidos}
+        self._lotes += 1
+        self.recibidos += len(docs) + len(errores)
+        # Solo una escritura en vuelo: el siguiente lote se valida mientras tanto
+        if self._escritura is not None:
+            await self._escritura
+        self._escritura = asyncio.create_task(self._escribir(lote, docs, numeros, errores))
+
+    async def _escribir(self, lote, docs, numeros, errores):
+        insertados, invalidos = 0, len(errores)
+        if docs:
+            # Orden de llegada para la marca de agua de rollups.py
+            recibido = datetime.utcnow()
+            for doc in docs:
+                doc["recibidoEn"] = recibido
+            escritos = docs
+            try:
+                resultado = await usage_events_collection.bulk_write([InsertOne(d) for d in docs], ordered=False)
+                insertados = resultado.inserted_count
+            except BulkWriteError as e:
+                insertados = e.details.get("nInserted", 0)
+                fallidos = {w["index"] for w in e.details.get("writeErrors", [])}
+                escritos = [d for i, d in enumerate(docs) if i not in fallidos]
+                errores = errores + [_error(numeros[w["index"]], w["errmsg"]) for w in e.details.get("writeErrors", [])]
+            except PyMongoError as e:
+                escritos = []
+                errores = errores + [_error(None, f"Lote no escrito: {e}")]
+            if self.acumulador is not None:
+                # Totales por usuario para el saldo de datos en tiempo real (ver contadores.py)
+                self.acumulador.sumar_documentos(escritos)
+
+        rechazados = invalidos + len(docs) - insertados
+        self.insertados += insertados
+        _insertados.inc(insertados)
+        _rechazados.inc(rechazados)
+        if errores:
+            self.lotes_con_errores.append({
+                **lote,
+                "insertados": insertados,
+                "rechazados": rechazados,
+                "errores": errores[:MAX_ERRORES_POR_LOTE],
+            })
@@ -0,0 +1,170 @@
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from database import rate_limits_collection
+from metricas import Counter, Gauge
+
+# 🚦 Límites de peticiones con ventana deslizante
+# Cada regla cuenta intentos por clave (teléfono, IP o prefijo del número)
+# en dos ventanas fijas: la actual y la anterior. El conteo deslizante es
+#     anterior · (fracción de la ventana anterior que sigue dentro) + actual
+# así que cada clave ocupa unos pocos números sin importar cuántos intentos
+# haga. Cada regla guarda a lo más LIMITES_MAX_CLAVES claves (LRU).
+#
+# La verificación es síncrona y en memoria: se hace antes de cualquier
+# consulta a Mongo, envío de SMS o bcrypt. Con LIMITES_BACKEND=mongo, lo que
+# pasa el filtro local se cuenta además en rate_limits para que todos los
+# workers vean los mismos totales. Si Mongo falla se confía en el local.
+
+LIMITES_BACKEND = os.getenv("LIMITES_BACKEND", "memoria")
+LIMITES_MAX_CLAVES = int(os.getenv("LIMITES_MAX_CLAVES", "50000"))
+# Proxies confiables delante de la app (Render = 1); 0 usa la IP del socket
+LIMITES_SALTOS_PROXY = int(os.getenv("LIMITES_SALTOS_PROXY", "0"))
+
+limites_rechazos = Counter("limites_rechazos_total", "Peticiones rechazadas por límite", etiquetas=("regla",))
+limites_claves = Gauge("limites_claves", "Claves en memoria por regla", etiquetas=("regla",))
+limites_fallos_mongo = Counter("limites_fallos_mongo_total", "Consultas a rate_limits que fallaron")
+
+
+def _regla_env(nombre: str, por_defecto: str):
+    """``"5/600"`` → ``(5, 600.0)``: intentos permitidos por ventana de segundos."""
+    limite, ventana = os.getenv(nombre, por_defecto).split("/")
+    return int(limite), float(ventana)
+
+
+class LimiteExcedido(Exception):
+    """Demasiados intentos; el cliente debe esperar ``retry_after`` segundos."""
+
+    def __init__(self, regla: str, retry_after: int):
+        super().__init__(f"Límite excedido: {regla}")
+        self.regla = regla
+        self.retry_after = retry_after
+
+
+class Regla:
+    def __init__(self, nombre: str, limite: int, ventana: float, max_claves: int = LIMITES_MAX_CLAVES):
+        self.nombre = nombre
+        self.limite = limite
+        self.ventana = ventana
+        self.max_claves = max_claves
+        # clave → [índice de ventana, intentos en la actual, intentos en la anterior]
+        self._claves = OrderedDict()
+        self._rechazos = limites_rechazos.labels(nombre)
+        self._gauge = limites_claves.labels(nombre)
+
+    def _estado(self, clave: str, ahora: float):
+        indice = int(ahora // self.ventana)
+        estado = self._claves.get(clave)
+        if estado is None:
+            estado = self._claves[clave] = [indice, 0, 0]
+            if len(self._claves) > self.max_claves:
+                self._claves.popitem(last=False)
+            self._gauge.set(len(self._claves))
+        else:
+            self._claves.move_to_end(clave)
+            if estado[0] != indice:
+                # Una ventana después la actual pasa a ser la anterior; más tarde ya no cuenta
+                estado[2] = estado[1] if estado[0] == indice - 1 else 0
+                estado[0], estado[1] = indice, 0
+        return estado
+
+    def _peso_anterior(self, ahora: float) -> float:
+        return 1 - (ahora % self.ventana) / self.ventana
+
+    def conteo(self, actual: int, anterior: int, ahora: float) -> float:
+        return anterior * self._peso_anterior(ahora) + actual
+
+    def espera(self, actual: int, anterior: int, ahora: float) -> int:
+        """Segundos hasta que el conteo baje del límite (aproximado hacia arriba)."""
+        transcurrido = ahora % self.ventana
+        if actual >= self.limite or anterior == 0:
+            return max(1, math.ceil(self.ventana - transcurrido))
+        # anterior · (1 - t/V) + actual + 1 <= limite  →  t >= V · (1 - (limite - actual - 1) / anterior)
+        t = self.ventana * (1 - (self.limite - actual - 1) / anterior)
+        return max(1, math.ceil(t - transcurrido))
+
+    def revisar(self, clave: str, ahora: float):
+        """Regresa el estado de la clave o lanza LimiteExcedido, sin contar el intento."""
+        estado = self._estado(clave, ahora)
+        if self.conteo(estado[1], estado[2], ahora) + 1 > self.limite:
+            self._rechazos.inc()
+            raise LimiteExcedido(self.nombre, self.espera(estado[1], estado[2], ahora))
+        return estado
+
+
+class LimitadorMongo:
+    """Conteo compartido: un documento por regla, clave y ventana en rate_limits.
+
+    Los documentos vencen con el índice TTL de expiraEn (ver indices.py).
+    """
+
+    def __init__(self, coleccion=rate_limits_collection):
+        self.coleccion = coleccion
+
+    async def revisar(self, intentos, ahora: float):
+        for regla, clave in intentos:
+            indice = int(ahora // regla.ventana)
+            base = f"{regla.nombre}|{clave}|"
+            try:
+                doc = await self.coleccion.find_one_and_update(
+                    {"_id": base + str(indice)},
+                    {"$inc": {"n": 1},
+                     "$setOnInsert": {"expiraEn": datetime.utcnow() + timedelta(seconds=2 * regla.ventana)}},
+                    upsert=True, return_document=ReturnDocument.AFTER,
+                )
+                anterior = await self.coleccion.find_one({"_id": base + str(indice - 1)}, {"n": 1})
+            except PyMongoError as e:
+                limites_fallos_mongo.inc()
+                logging.warning("❌ rate_limits no disponible, se usa el conteo local: %s", e)
+                return
+            actual, previo = doc["n"] - 1, (anterior or {}).get("n", 0)
+            if regla.conteo(actual, previo, ahora) + 1 > regla.limite:
+                regla._rechazos.inc()
+                raise LimiteExcedido(regla.nombre, regla.espera(actual, previo, ahora))
+
+
+class Limitador:
+    def __init__(self, backend: str = LIMITES_BACKEND):
+        self.compartido = LimitadorMongo() if backend == "mongo" else None
+
+    def revisar_local(self, intentos):
+        """``intentos``: pares ``(regla, clave)``. Cuenta el intento solo si todas lo permiten."""
+        ahora = time.time()
+        estados = [regla.revisar(clave, ahora) for regla, clave in intentos if clave]
+        for estado in estados:
+            estado[1] += 1
+
+    async def revisar(self, intentos):
+        intentos = [(regla, clave) for regla, clave in intentos if clave]
+        self.revisar_local(intentos)
+        if self.compartido is not None:
+            await self.compartido.revisar(intentos, time.time())
+
+
+def ip_cliente(request) -> str:
+    """IP del cliente; detrás de N proxies confiables se toma de X-Forwarded-For."""
+    if LIMITES_SALTOS_PROXY > 0:
+        saltos = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if len(saltos) >= LIMITES_SALTOS_PROXY:
+            return saltos[-LIMITES_SALTOS_PROXY]
+    return request.client.host if request.client else ""
+
+
+def prefijo(phone: str) -> str:
+    """Bloque de 10,000 números al que pertenece el teléfono (sin los últimos 4 dígitos)."""
+    return phone[:-4] if len(phone) > 4 else ""
+
+
+# 📋 Reglas por ruta ("intentos/segundos", configurables por entorno)
+OTP_POR_TELEFONO = Regla("otp_telefono", *_regla_env("LIMITE_OTP_TELEFONO", "3/600"))
+OTP_POR_IP = Regla("otp_ip", *_regla_env("LIMITE_OTP_IP", "20/600"))
+OTP_POR_PREFIJO = Regla("otp_prefijo", *_regla_env("LIMITE_OTP_PREFIJO", "30/600"))
+LOGIN_POR_TELEFONO = Regla("login_telefono", *_regla_env("LIMITE_LOGIN_TELEFONO", "10/900"))
+LOGIN_POR_IP = Regla("login_ip", *_regla_env("LIMITE_LOGIN_IP", "50/900"))
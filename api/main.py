@@ -1,35 +1,85 @@
-from fastapi import APIRouter, FastAPI, HTTPException, Body, Request, Path, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, HTTPException, Body, Request, Path, Query, status
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from bson import ObjectId
-from typing import List, Optional
-from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import List, Literal, Optional
+from datetime import date, datetime, timedelta, timezone
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
 import os
-from dotenv import load_dotenv
-import pusher
-import mercadopago
-from passlib.context import CryptContext
 from random import randint
-import requests
 import logging
+import hashlib
+import json
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 logging.basicConfig(level=logging.INFO)
-mp_sdk = mercadopago.SDK("APP_USR-6750690243481661-070418-e929368f48abae356c72c4e855776f62-2531088887")
 
+# ⚙️ database.py carga el .env: va primero porque varios módulos leen su
+# configuración al importarse
+from database import (
+    users_collection, plans_collection, support_tickets_collection,
+    data_usage_collection, transactions_collection, faq_collection,
+    chip_requests_collection, sms_outbox_collection, payments_collection, api_status_collection,
+    cache_versions_collection, cerrar_cliente, get_db
+)
 from models import (
     UserModel, PlanModel, UserInput, UserResponse, TransactionModel, 
     DataUsageModel, SupportTicketModel, TicketDB, TicketInput, 
     FAQModel, ChipRequest, ProfileUpdate, PaymentRequest
 )
-from database import (
-    users_collection, plans_collection, support_tickets_collection,
-    data_usage_collection, transactions_collection, faq_collection,
-    chip_requests_collection, otp_collection
+from cache import CacheTTL, VersionCompartida
+from hashing import PoolSaturado, cerrar_pool, hash_password, verify_and_update_password
+from metricas import Histogram, MiddlewareMetricas, exponer
+from sms import DespachadorSMS, OutboxLlena
+from eventos import PublicadorPusher
+from indices import asegurar_indices
+from pagos import MP_WEBHOOK_SECRET, RegistroPagos, cerrar_pasarelas, firma_webhook_valida, obtener_pasarela
+from contadores import AcumuladorConsumo
+from rollups import MotorRollups, consultar as consultar_rollups
+from ingesta import CONSUMO_INGESTA_TOKEN, Ingesta, token_valido
+from limites import (
+    LOGIN_POR_IP, LOGIN_POR_TELEFONO, OTP_POR_IP, OTP_POR_PREFIJO, OTP_POR_TELEFONO,
+    LimiteExcedido, Limitador, ip_cliente, prefijo
+)
+from salud import OFFLINE, ONLINE, MonitorSalud, RegistroEstado
+from paginacion import LIMITE_MAXIMO, LIMITE_POR_DEFECTO, paginar
+from perfiles import PROYECCION_PERFIL, CachePerfiles
+from otp import (
+    BarridoOTP, emitir_codigo, verificar_codigo, consumir_verificacion,
+    restaurar_verificacion, EXPIRADO, INCORRECTO, NO_ENCONTRADO
 )
 
+# 🔄 Ciclo de vida de cada worker
+# Los clientes y tareas de fondo se crean aquí, ya dentro del proceso del
+# worker (después del fork), y se cierran en orden inverso al apagar: primero
+# se vacían los buffers (consumo, SMS, eventos de Pusher) y al final se
+# cierran los pools de MercadoPago, bcrypt y MongoDB.
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    async with AsyncExitStack() as pila:
+        pila.callback(cerrar_cliente)
+        pila.callback(cerrar_pool)
+        pila.push_async_callback(cerrar_pasarelas)
+
+        # El evento online/offline inicial lo emite el monitor de salud en su primera revisión
+        await publicador_pusher.iniciar()
+        pila.push_async_callback(publicador_pusher.cerrar)
+
+        await crear_indices()
+
+        for servicio in (monitor_salud, barrido_otp, perfiles, version_planes, acumulador_consumo, motor_rollups):
+            servicio.iniciar()
+            pila.push_async_callback(servicio.cerrar)
+        await despachador_sms.iniciar()
+        pila.push_async_callback(despachador_sms.cerrar)
+        yield
+
 # 🚦 Inicializar FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=ciclo_de_vida)
 
 # 🌐 CORS
 origins = [
@@ -47,101 +97,127 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-load_dotenv(dotenv_path="./api/.env")
+# 📈 Latencia por ruta y peticiones en curso (ver metricas.py)
+app.add_middleware(MiddlewareMetricas)
 
 router = APIRouter(prefix="/api/pago", tags=["Pago"])
 
-# 📡 Inicializar Pusher
-pusher_client = pusher.Pusher(
-    app_id=os.getenv("PUSHER_APP_ID"),
-    key=os.getenv("PUSHER_KEY"),
-    secret=os.getenv("PUSHER_SECRET"),
-    cluster=os.getenv("PUSHER_CLUSTER"),
-    ssl=True
-)
+# 📡 Inicializar Pusher (ver eventos.py): los eventos se publican en segundo plano
+publicador_pusher = PublicadorPusher()
 
-def notificar_api_offline(error_msg=""):
-    try:
-        pusher_client.trigger("estado-api", "offline", {
-            "status": "fail",
-            "timestamp": str(datetime.utcnow()),
-            "error": error_msg
-        })
-    except Exception as e:
-        print("Error al emitir evento OFFLINE:", e)
+def notificar_estado_api(estado, error_msg=""):
+    datos = {"status": "ok" if estado == ONLINE else "fail", "timestamp": str(datetime.utcnow())}
+    if estado != ONLINE:
+        datos["error"] = error_msg
+    publicador_pusher.publicar("estado-api", estado, datos)
 
 def notificar_planes_actualizados():
-    try:
-        pusher_client.trigger("planes-channel", "planes_actualizados", {"mensaje": "Planes actualizados"})
-    except Exception as e:
-        print("❌ Error al notificar con Pusher:", e)
+    publicador_pusher.publicar("planes-channel", "planes_actualizados", {"mensaje": "Planes actualizados"})
+
+# 📇 Índices de MongoDB (ver indices.py)
+async def crear_indices():
+    if os.getenv("MONGO_CREAR_INDICES", "1") == "1":
+        try:
+            await asegurar_indices()
+        except Exception as e:
+            print("❌ Error al crear índices:", e)
+
+# 📈 Métricas en formato Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(exponer(), media_type="text/plain; version=0.0.4")
+
+# 🩺 Salud (ver salud.py): un monitor por worker revisa las dependencias en
+# segundo plano; / y /api/ping solo devuelven el último estado ya serializado
+async def verificar_mongo():
+    await get_db().command("ping")
+
+async def verificar_mercadopago():
+    await obtener_pasarela().verificar()
+
+monitor_salud = MonitorSalud(
+    {"mongo": verificar_mongo, "pusher": publicador_pusher.verificar, "mercadopago": verificar_mercadopago},
+    al_cambiar=notificar_estado_api,
+    registro=RegistroEstado(api_status_collection),
+)
 
-@app.on_event("startup")
-async def notificar_api_encendida():
-    try:
-        pusher_client.trigger("estado-api", "online", {
-            "status": "ok",
-            "timestamp": str(datetime.utcnow())
-        })
-    except Exception as e:
-        print("❌ Error al notificar estado ONLINE:", e)
+def _respuesta_salud(cuerpo: bytes, ok: bool):
+    return Response(content=cuerpo, media_type="application/json", status_code=200 if ok else 503,
+                    headers={"Cache-Control": "no-store"})
 
-# 🩺 Salud
 @app.get("/")
-def health_check():
-    return {"status": "online"}
+async def health_check():
+    return _respuesta_salud(monitor_salud.ping, monitor_salud.estado != OFFLINE)
 
 @app.get("/api/ping")
-def ping():
-    return {"status": "ok", "timestamp": datetime.utcnow()}
+async def ping():
+    return _respuesta_salud(monitor_salud.ping, monitor_salud.estado != OFFLINE)
+
+@app.get("/api/ready")
+async def ready():
+    return _respuesta_salud(monitor_salud.ready, monitor_salud.ready_ok)
+
+# 📤 SMS (ver sms.py): los OTP se encolan en la outbox y se envían en segundo plano
+despachador_sms = DespachadorSMS(sms_outbox_collection)
+
+# 🧹 Los OTP vencidos los borra el índice TTL; el barrido es opcional (ver otp.py)
+barrido_otp = BarridoOTP()
+
+# 🧱 Hashing (ver hashing.py): si el pool está saturado se responde 503
+@app.exception_handler(PoolSaturado)
+async def pool_saturado_handler(request: Request, exc: PoolSaturado):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servicio ocupado, intenta de nuevo"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
-def enviar_sms(destino: str, mensaje: str):
-    try:
-        r = requests.post("https://rest.nexmo.com/sms/json", data={
-            "api_key": os.getenv("VONAGE_API_KEY"),
-            "api_secret": os.getenv("VONAGE_API_SECRET"),
-            "to": destino,
-            "from": "CopperMobil",
-            "text": mensaje
-        })
-        print("📤 Vonage SMS enviado a:", destino)
-        print("📦 Respuesta Vonage:", r.json())
-        return r.status_code
-    except Exception as e:
-        print("❌ Error al enviar con Vonage:", e)
-        return None
-    
-def limpiar_codigos_expirados():
-    resultado = otp_collection.delete_many({"expiresAt": {"$lt": datetime.utcnow()}, "verified": {"$ne": True}})
-    print(f"🧹 OTPs vencidos eliminados: {resultado.deleted_count}")
+# 🚦 Límites por teléfono, IP y prefijo (ver limites.py): se revisan antes de
+# tocar Mongo, enviar SMS o correr bcrypt
+limitador = Limitador()
+
+@app.exception_handler(LimiteExcedido)
+async def limite_excedido_handler(request: Request, exc: LimiteExcedido):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Demasiados intentos, espera un momento"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
-# 🧱 Hashing
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# 👤 Caché de perfiles por worker (ver perfiles.py)
+perfiles = CachePerfiles()
 
-def verify_password(plain, hashed) -> bool:
-    return pwd_context.verify(plain, hashed)
+login_duracion = Histogram("login_duracion_segundos", "Latencia de /api/auth/login", etiquetas=("resultado",))
 
 @app.post("/api/users/", response_model=UserResponse)
-def create_user(user: UserInput):
-    if users_collection.find_one({"phone": user.phone}):
+async def create_user(user: UserInput):
+    if await users_collection.find_one({"phone": user.phone}):
         return JSONResponse(status_code=400, content={"detail": "Teléfono ya registrado"})
 
-    if user.email and users_collection.find_one({"email": user.email}):
+    if user.email and await users_collection.find_one({"email": user.email}):
         return JSONResponse(status_code=400, content={"detail": "Correo ya registrado"})
 
-    verificado = otp_collection.find_one({"phone": user.phone, "verified": True})
-    if not verificado:
+    # 🔐 Consumir la verificación de forma atómica: una verificación, un registro
+    if not await consumir_verificacion(user.phone):
         raise HTTPException(status_code=403, detail="Número aún no verificado")
 
-    user_data = user.dict()
-    user_data["password"] = hash_password(user.password)
-    user_data["createdAt"] = datetime.utcnow()
-
-    inserted_user = users_collection.insert_one(user_data)
+    try:
+        user_data = user.dict()
+        user_data["password"] = await hash_password(user.password)
+        user_data["createdAt"] = user_data["updatedAt"] = datetime.utcnow()
+
+        inserted_user = await users_collection.insert_one(user_data)
+    except DuplicateKeyError:
+        # Otra petición ganó entre la validación y el insert
+        await restaurar_verificacion(user.phone)
+        if await users_collection.find_one({"phone": user.phone}, projection={"_id": 1}):
+            return JSONResponse(status_code=400, content={"detail": "Teléfono ya registrado"})
+        return JSONResponse(status_code=400, content={"detail": "Correo ya registrado"})
+    except Exception:
+        await restaurar_verificacion(user.phone)
+        raise
 
-    # �� Limpieza del estado de verificación
-    otp_collection.delete_many({"phone": user.phone})
+    perfiles.guardar(user_data)
 
     return UserResponse(
         user_id=str(inserted_user.inserted_id),
@@ -155,22 +231,34 @@ def create_user(user: UserInput):
 
 # 🔐 Login con verificación de hash
 @app.post("/api/auth/login")
-def login_user(data: dict = Body(...)):
+async def login_user(request: Request, data: dict = Body(...)):
     phone = data.get("phone")
     password = data.get("password")
 
     if not phone or not password:
         raise HTTPException(status_code=400, detail="Faltan datos")
 
+    await limitador.revisar([(LOGIN_POR_TELEFONO, str(phone)), (LOGIN_POR_IP, ip_cliente(request))])
+
+    inicio = time.perf_counter()
+
     # 1) Usuario no existe
-    user = users_collection.find_one({"phone": phone})
+    user = await users_collection.find_one({"phone": phone})
     if not user:
         raise HTTPException(status_code=404, detail="Cuenta no encontrada")
 
     # 2) Contraseña incorrecta
-    if not verify_password(password, user.get("password", "")):
+    valido, nuevo_hash = await verify_and_update_password(password, user.get("password", ""))
+    if not valido:
+        login_duracion.labels("fallido").observe(time.perf_counter() - inicio)
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
+    # 🔁 Rehash a los parámetros actuales de bcrypt (HASH_REHASH=1)
+    if nuevo_hash:
+        await users_collection.update_one({"_id": user["_id"]}, {"$set": {"password": nuevo_hash}})
+
+    login_duracion.labels("exitoso").observe(time.perf_counter() - inicio)
+
     # Verificar campos obligatorios
     for campo in ["name", "plan", "balance"]:
         if campo not in user:
@@ -184,24 +272,21 @@ def login_user(data: dict = Body(...)):
     }
 
 @app.get("/api/auth/profile/{user_id}", response_model=UserResponse)
-def get_profile(user_id: str):
-    user = users_collection.find_one({ "_id": ObjectId(user_id) })
-    if not user:
+async def get_profile(user_id: str, request: Request):
+    entrada = await perfiles.obtener(user_id)
+    if not entrada:
         raise HTTPException(404, "Usuario no encontrado")
 
-    return UserResponse(
-        user_id = str(user["_id"]),
-        name    = user["name"],
-        phone   = user["phone"],
-        email   = user.get("email"),
-        balance = user["balance"],
-        plan    = user["plan"]
-    )
+    _, cuerpo, etag = entrada
+    cabeceras = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
 
 @app.patch("/api/auth/update-profile")
-def update_profile(data: ProfileUpdate = Body(...)):
+async def update_profile(data: ProfileUpdate = Body(...)):
     # 1) Buscamos usuario
-    user = users_collection.find_one({ "_id": ObjectId(data.user_id) })
+    user = await users_collection.find_one({ "_id": ObjectId(data.user_id) })
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
@@ -212,7 +297,7 @@ def update_profile(data: ProfileUpdate = Body(...)):
 
     if data.email is not None:
         # Validar duplicados
-        exists = users_collection.find_one({
+        exists = await users_collection.find_one({
             "email": data.email,
             "_id":    {"$ne": user["_id"]}
         })
@@ -223,11 +308,21 @@ def update_profile(data: ProfileUpdate = Body(...)):
     if not update_fields:
         raise HTTPException(status_code=400, detail="Nada para actualizar")
 
-    # 3) Aplicamos el $set
-    users_collection.update_one(
-        { "_id": ObjectId(data.user_id) },
-        { "$set": update_fields }
-    )
+    # 3) Aplicamos el $set y refrescamos la caché con el documento resultante
+    update_fields["updatedAt"] = datetime.utcnow()
+    try:
+        actualizado = await users_collection.find_one_and_update(
+            { "_id": ObjectId(data.user_id) },
+            { "$set": update_fields },
+            projection=PROYECCION_PERFIL,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # El índice email_unico atrapa a quien tomó el correo después de validarlo
+        raise HTTPException(status_code=409, detail="Correo ya está en uso")
+    if actualizado:
+        perfiles.guardar(actualizado)
+    update_fields.pop("updatedAt")
 
     return {
         "message": "Perfil actualizado",
@@ -237,15 +332,19 @@ def update_profile(data: ProfileUpdate = Body(...)):
 VALID_LADAS = ["+52", "+1", "+57"]  # México, USA, Colombia...
 
 @app.post("/api/auth/send-otp")
-def enviar_otp(data: dict = Body(...)):
-    limpiar_codigos_expirados()
-
+async def enviar_otp(request: Request, data: dict = Body(...)):
     phone = data.get("phone")
     if not phone:
         raise HTTPException(status_code=400, detail="Falta el número")
 
+    await limitador.revisar([
+        (OTP_POR_TELEFONO, str(phone)),
+        (OTP_POR_IP, ip_cliente(request)),
+        (OTP_POR_PREFIJO, prefijo(str(phone))),
+    ])
+
     # ─── BLOQUEO NÚMERO YA REGISTRADO ───────────────────
-    if users_collection.find_one({"phone": phone}):
+    if await users_collection.find_one({"phone": phone}):
         raise HTTPException(
             status_code=409,
             detail="El número ya está registrado. Por favor inicia sesión."
@@ -273,65 +372,55 @@ def enviar_otp(data: dict = Body(...)):
     code = str(randint(100000, 999999))
     mensaje_sms = f"Tu código Copper Mobil es: {code}"
 
-    otp_collection.delete_many({"phone": phone})
-    otp_collection.insert_one({
-        "phone": phone,
-        "code": code,
-        "expiresAt": datetime.utcnow() + timedelta(minutes=2)
-    })
+    await emitir_codigo(phone, code)
 
-    status_envio = enviar_sms(phone, mensaje_sms)
-    if status_envio != 200:
-        raise HTTPException(status_code=500, detail="Error al enviar el código por SMS")
+    try:
+        await despachador_sms.encolar(phone, mensaje_sms)
+    except OutboxLlena:
+        raise HTTPException(
+            status_code=503,
+            detail="Demasiados envíos pendientes, intenta de nuevo",
+            headers={"Retry-After": "5"}
+        )
 
     return {"message": "Código enviado correctamente"}
 
 
 # Validar código OTP
 @app.post("/api/auth/validate-otp")
-def validar_otp(data: dict = Body(...)):
+async def validar_otp(data: dict = Body(...)):
     phone = data.get("phone")
     code = data.get("code")
 
     if not phone or not code:
         raise HTTPException(status_code=400, detail="Faltan datos")
 
-    # 🧹 Limpiar códigos vencidos antes de verificar
-    otp_collection.delete_many({"expiresAt": {"$lt": datetime.utcnow()}})
+    # ✅ Verificar y guardar estado "verificado" en una sola operación
+    resultado = await verificar_codigo(phone, code)
 
-    registro = otp_collection.find_one({"phone": phone})
-    if not registro:
+    if resultado == NO_ENCONTRADO:
         raise HTTPException(status_code=404, detail="No se encontró código para ese número")
 
-    if registro["code"] != code:
-        raise HTTPException(status_code=401, detail="Código incorrecto")
-
-    if registro["expiresAt"] < datetime.utcnow():
-        otp_collection.delete_many({"phone": phone})
+    if resultado == EXPIRADO:
         raise HTTPException(status_code=410, detail="Código expirado")
 
-    # ✅ Guardar estado "verificado"
-    otp_collection.delete_many({"phone": phone})
-    otp_collection.insert_one({
-        "phone": phone,
-        "verified": True,
-        "verifiedAt": datetime.utcnow()
-    })
+    if resultado == INCORRECTO:
+        raise HTTPException(status_code=401, detail="Código incorrecto")
 
     return {"message": "Código válido"}
 
 @app.get("/api/users/existe")
-def existe(phone: str):
-    existe = users_collection.find_one({"phone": phone})
+async def existe(phone: str):
+    existe = await users_collection.find_one({"phone": phone})
     return {"registrado": bool(existe)}
 
 # Crear nuevo plan y notificar con Pusher
 @app.post("/api/planes")
-def crear_plan(plan: PlanModel):
+async def crear_plan(plan: PlanModel):
     try:
         plan_data = plan.dict()
-        plans_collection.insert_one(plan_data)
-        notificar_planes_actualizados()
+        await plans_collection.insert_one(dict(plan_data))
+        await invalidar_catalogo_planes()
         return {
             "message": "Plan creado exitosamente",
             "plan": plan_data
@@ -339,25 +428,60 @@ def crear_plan(plan: PlanModel):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al guardar el plan: {e}")
 
+# 🗂️ Caché del catálogo de planes (por worker)
+# Se guarda ya serializado junto con su ETag. Cualquier mutación de planes
+# debe llamar a invalidar_catalogo_planes(): sube la versión en
+# cache_versions, que los demás workers revisan cada PLANES_POLL_INTERVALO
+# segundos, y avisa por Pusher cuando ya todos la vieron.
+PLANES_CACHE_TTL = float(os.getenv("PLANES_CACHE_TTL", "60"))
+PLANES_POLL_INTERVALO = float(os.getenv("PLANES_POLL_INTERVALO", "2"))
+catalogo_planes_cache = CacheTTL(ttl=PLANES_CACHE_TTL, max_entradas=1, max_bytes=1_000_000)
+version_planes = VersionCompartida(
+    cache_versions_collection, "planes", catalogo_planes_cache.invalidar, PLANES_POLL_INTERVALO
+)
+
+async def invalidar_catalogo_planes():
+    await version_planes.subir()
+    # Si la app recargara antes de que los otros workers vean la versión
+    # nueva, alguno le respondería con el catálogo viejo
+    asyncio.get_running_loop().call_later(PLANES_POLL_INTERVALO, notificar_planes_actualizados)
+
+async def cargar_catalogo_planes():
+    planes = [PlanModel(**p) for p in await plans_collection.find({}, {"_id": 0}).to_list(None)]
+    contenido = jsonable_encoder(planes)
+    cuerpo = json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+    return cuerpo, etag, {p.name: p for p in planes}
+
+async def obtener_catalogo_planes():
+    """Regresa ``(cuerpo_json, etag, planes_por_nombre)`` desde la caché."""
+    return await catalogo_planes_cache.obtener_o_cargar(
+        "catalogo", cargar_catalogo_planes, tamano=lambda v: len(v[0])
+    )
+
 # Obtener todos los planes
 @app.get("/api/planes", response_model=List[PlanModel])
-def obtener_planes():
+async def obtener_planes(request: Request):
     try:
-        planes = list(plans_collection.find({}, {"_id": 0}))
-        return planes
+        cuerpo, etag, _ = await obtener_catalogo_planes()
+        cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=cabeceras)
+        return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
     except Exception as e:
-        notificar_api_offline(f"Error al obtener planes: {str(e)}")
+        print("❌ Error al obtener planes:", e)
+        monitor_salud.revisar_pronto()
         raise HTTPException(status_code=500, detail="Error interno al obtener los planes")
 
 # Obtener plan de un usuario
 @app.get("/api/planes/{user_id}")
-def get_user_plan(user_id: str):
+async def get_user_plan(user_id: str):
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if not user:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         plan_id = user.get("plan")
-        plan = plans_collection.find_one({"_id": ObjectId(plan_id)}, {"_id": 0})
+        plan = await plans_collection.find_one({"_id": ObjectId(plan_id)}, {"_id": 0})
         if not plan:
             raise HTTPException(status_code=404, detail="Plan no encontrado")
         return plan
@@ -365,25 +489,105 @@ def get_user_plan(user_id: str):
         raise HTTPException(status_code=400, detail="ID inválido o error de formato")
 
 # Obtener consumo de datos
+# Con ?granularity=hora|dia|mes responde desde los acumulados (ver rollups.py)
+RANGO_POR_DEFECTO = {"hora": timedelta(days=1), "dia": timedelta(days=30), "mes": timedelta(days=365)}
+
 @app.get("/api/consumo/{user_id}")
-def get_data_usage(user_id: str):
-    try:
-        usage = data_usage_collection.find_one({"userId": ObjectId(user_id)}, {"_id": 0})
-        if not usage:
-            raise HTTPException(status_code=404, detail="Sin historial de consumo")
-        return usage
-    except:
+async def get_data_usage(
+    user_id: str,
+    granularity: Optional[Literal["hora", "dia", "mes"]] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None
+):
+    # consumo y pronosticos cargan NumPy: se importan al primer uso, no al arrancar
+    from consumo import MAX_DIAS_RANGO
+    from pronosticos import obtener_pronostico
+    if granularity:
+        if not ObjectId.is_valid(user_id):
+            raise HTTPException(status_code=400, detail="ID inválido")
+        fin = datetime.combine(hasta or datetime.utcnow().date(), datetime.min.time()) + timedelta(days=1)
+        inicio = datetime.combine(desde, datetime.min.time()) if desde else fin - RANGO_POR_DEFECTO[granularity]
+        if inicio >= fin or (fin - inicio).days > MAX_DIAS_RANGO:
+            raise HTTPException(status_code=400, detail="Rango inválido")
+        puntos, marca = await consultar_rollups(ObjectId(user_id), granularity, inicio, fin)
+        return {
+            "user_id": user_id, "granularity": granularity, "puntos": puntos, "actualizado_hasta": marca,
+            "pronostico": await obtener_pronostico(ObjectId(user_id))
+        }
+
+    if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="ID inválido o error de formato")
+    usage = await data_usage_collection.find_one({"userId": ObjectId(user_id)}, {"_id": 0})
+    if not usage:
+        raise HTTPException(status_code=404, detail="Sin historial de consumo")
+    # userId es ObjectId en la base; la respuesta lo lleva como texto
+    usage["userId"] = user_id
+    # 🔮 Fecha estimada de agotamiento, precalculada por pronosticos.py
+    usage["pronostico"] = await obtener_pronostico(ObjectId(user_id))
+    return usage
+
+# 🧮 Totales de consumo en tiempo real con escritura diferida (ver contadores.py)
+acumulador_consumo = AcumuladorConsumo()
+
+@app.get("/api/consumo/{user_id}/total")
+async def total_de_consumo(user_id: str):
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+    oid = ObjectId(user_id)
+    doc = await data_usage_collection.find_one({"userId": oid}, {"_id": 0, "bytesTotal": 1, "actualizadoEn": 1}) or {}
+    return {
+        "user_id": user_id,
+        # Lo que este worker aún no vuelca también cuenta para el saldo
+        "bytes_total": doc.get("bytesTotal", 0) + acumulador_consumo.pendiente(oid),
+        "actualizado_en": doc.get("actualizadoEn")
+    }
+
+# 📚 Acumulados por hora/día/mes; solo un worker a la vez los avanza
+motor_rollups = MotorRollups()
 
-#  Middleware para encabezados de depuración
-@app.middleware("http")
-async def log_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["X-Debug-Origin"] = request.headers.get("origin", "no-origin")
-    return response
+# 📥 Ingesta masiva desde la red: NDJSON o columnas (ver ingesta.py)
+@app.post("/api/consumo/ingesta")
+async def ingerir_consumo(request: Request):
+    # Sin token configurado la ingesta queda cerrada
+    if not CONSUMO_INGESTA_TOKEN:
+        raise HTTPException(status_code=503, detail="Ingesta deshabilitada: falta CONSUMO_INGESTA_TOKEN")
+    if not token_valido(request.headers.get("x-ingesta-token")):
+        raise HTTPException(status_code=401, detail="Token de ingesta inválido")
+
+    tipo = request.headers.get("content-type", "")
+    ingesta = Ingesta(acumulador=acumulador_consumo)
+    try:
+        if "ndjson" in tipo:
+            await ingesta.ndjson(request.stream())
+        elif "json" in tipo:
+            await ingesta.columnas(await request.body())
+        else:
+            raise HTTPException(status_code=415, detail="Usa application/x-ndjson o application/json")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        resultado = await ingesta.terminar()
+    return resultado
+
+# 📊 Consumo agregado por día/semana/mes desde la serie de tiempo (ver consumo.py)
+@app.get("/api/consumo/{user_id}/resumen")
+async def resumen_de_consumo(
+    user_id: str,
+    desde: date,
+    hasta: date,
+    periodo: Literal["dia", "semana", "mes"] = "dia"
+):
+    from consumo import MAX_DIAS_RANGO, resumen_consumo
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="El rango está invertido")
+    if (hasta - desde).days >= MAX_DIAS_RANGO:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {MAX_DIAS_RANGO} días")
+    return await resumen_consumo(ObjectId(user_id), desde, hasta, periodo)
 
 @app.post("/api/recargas")
-def registrar_recarga(datos: dict = Body(...)):
+async def registrar_recarga(datos: dict = Body(...)):
     try:
         # Aquí se podrían guardar en MongoDB si lo deseas
         print(" Recarga simulada:", datos)
@@ -393,31 +597,61 @@ def registrar_recarga(datos: dict = Body(...)):
 
 
 # MERCADOPAGO
+# 🛒 Caché de preferencias: los toques repetidos de "recargar" con el mismo
+# (usuario, plan, precio) reutilizan el init_point mientras la preferencia
+# siga vigente en MercadoPago. Se reutiliza solo durante la primera mitad de
+# su vigencia: un link servido desde la caché siempre deja al menos la otra
+# mitad para pagar, por corta que sea MP_PREFERENCIA_MINUTOS.
+MP_PREFERENCIA_MINUTOS = float(os.getenv("MP_PREFERENCIA_MINUTOS", "30"))
+preferencias_cache = CacheTTL(ttl=MP_PREFERENCIA_MINUTOS * 60 / 2, max_entradas=10_000)
+
 @router.post("/mercadopago")
 async def crear_preferencia_pago(pago: PaymentRequest):
-    # 🔁 Detecta entorno (sandbox o producción)
-    env = os.getenv("MP_ENV", "sandbox").lower()
-    token = os.getenv("MP_ACCESS_TOKEN_PROD") if env == "production" else os.getenv("MP_ACCESS_TOKEN_SANDBOX")
-    sdk = mercadopago.SDK(token)
-
-    # 🔍 Busca al usuario
-    usuario = users_collection.find_one({"_id": ObjectId(pago.user_id)})
-    if not usuario or "email" not in usuario:
+    # 🔁 Pasarela del entorno configurado (sandbox o producción)
+    pasarela = obtener_pasarela()
+
+    # 📋 El plan se toma del catálogo del servidor, no de la copia del cliente
+    _, _, planes = await obtener_catalogo_planes()
+    plan = planes.get(pago.plan.name)
+    if not plan and await version_planes.revisar():
+        # Plan recién creado en otro worker: este aún no veía la versión nueva
+        _, _, planes = await obtener_catalogo_planes()
+        plan = planes.get(pago.plan.name)
+    if not plan:
+        raise HTTPException(404, "Plan no encontrado")
+
+    clave = (pasarela.env, pago.user_id, plan.name, plan.price)
+    try:
+        init_url = await preferencias_cache.obtener_o_cargar(
+            clave, lambda: crear_preferencia(pasarela, pago.user_id, plan)
+        )
+        return {"init_point": init_url}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error("❌ Error creando preferencia MP", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def crear_preferencia(pasarela, user_id: str, plan: PlanModel) -> str:
+    # 🔍 Busca al usuario (desde la caché de perfiles)
+    entrada = await perfiles.obtener(user_id)
+    email = entrada[0].get("email") if entrada else None
+    if not email:
         raise HTTPException(404, "Usuario no encontrado o sin email")
-    email = usuario["email"]
 
     # 🧪 En sandbox, sustituye el email real por uno de prueba
-    if env == "sandbox":
+    if pasarela.env == "sandbox":
         # Usa otro correo de test para evitar conflicto con la cuenta MP
         email = "test_user_918263@testuser.com"  # Puedes usar los que te da MP o crear uno nuevo
 
     # 🛒 Armar preferencia
+    ahora = datetime.now(timezone.utc)
     data = {
         "items": [{
-            "title":       pago.plan.name,
+            "title":       plan.name,
             "quantity":    1,
-            "unit_price":  pago.plan.price,
-            "description": f"{pago.plan.data_limit}, beneficios: {', '.join(pago.plan.benefits)}"
+            "unit_price":  plan.price,
+            "description": f"{plan.data_limit}, beneficios: {', '.join(plan.benefits)}"
         }],
         "payer": {
             "email": email
@@ -427,43 +661,75 @@ async def crear_preferencia_pago(pago: PaymentRequest):
             "failure": "https://coppermobile.com/fracaso",
             "pending": "https://coppermobile.com/pendiente"
         },
-        "external_reference": pago.user_id,
-        "auto_return": "approved"
+        "external_reference": user_id,
+        "auto_return": "approved",
+        "expires": True,
+        "expiration_date_from": ahora.isoformat(timespec="milliseconds"),
+        "expiration_date_to": (ahora + timedelta(minutes=MP_PREFERENCIA_MINUTOS)).isoformat(timespec="milliseconds")
     }
+    if os.getenv("MP_NOTIFICATION_URL"):
+        # MercadoPago avisará a /api/pago/webhook de cada cambio del pago
+        data["notification_url"] = os.getenv("MP_NOTIFICATION_URL")
 
     logging.info("▶️ Payload MP: %s", data)
 
+    resp = await pasarela.crear_preferencia(data)
+    init_url = resp.get("init_point") or resp.get("sandbox_init_point")
+    if not init_url:
+        raise HTTPException(500, detail="init_point no encontrado en la respuesta")
+    return init_url
+
+# 🧾 Estado de pagos alimentado por las notificaciones de MercadoPago (ver pagos.py)
+registro_pagos = RegistroPagos(payments_collection)
+
+@router.post("/webhook")
+async def webhook_mercadopago(request: Request):
+    # Sin secreto configurado no se aceptan notificaciones: cualquiera podría
+    # inventar ids de pago y provocar consultas a MercadoPago
+    if not MP_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook deshabilitado: falta MP_WEBHOOK_SECRET")
+
+    params = request.query_params
     try:
-        resultado = sdk.preference().create(data)
-        resp = resultado.get("response", {})
-        init_url = resp.get("init_point") or resp.get("sandbox_init_point")
-        if not init_url:
-            raise HTTPException(500, detail="init_point no encontrado en la respuesta")
-        return {"init_point": init_url}
+        cuerpo = await request.json()
+    except ValueError:
+        cuerpo = {}
+
+    # MercadoPago manda el id en el cuerpo (data.id) o en la query (data.id / id)
+    tipo = cuerpo.get("type") or params.get("type") or params.get("topic")
+    data_id = str((cuerpo.get("data") or {}).get("id") or params.get("data.id") or params.get("id") or "")
+
+    if tipo != "payment" or not data_id:
+        return {"message": "Notificación ignorada"}
+
+    if not firma_webhook_valida(request.headers.get("x-signature"), request.headers.get("x-request-id"), data_id):
+        raise HTTPException(status_code=401, detail="Firma inválida")
+
+    try:
+        await registro_pagos.notificar(data_id)
     except Exception as e:
-        logging.error("❌ Error creando preferencia MP", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+        # MercadoPago reintenta la notificación si no respondemos 2xx
+        logging.error("❌ Error procesando notificación MP %s: %s", data_id, e)
+        raise HTTPException(status_code=502, detail="No se pudo procesar la notificación")
+
+    return {"message": "Notificación recibida"}
 
 @app.get("/api/pago/validar")
-def validar_pago(request: Request):
+async def validar_pago(request: Request):
     try:
-        env = os.getenv("MP_ENV", "sandbox")
-        token = os.getenv("MP_ACCESS_TOKEN_PROD") if env == "production" else os.getenv("MP_ACCESS_TOKEN_SANDBOX")
-        sdk = mercadopago.SDK(token)
-
         params = dict(request.query_params)
         payment_id = params.get("payment_id")
 
         if not payment_id:
             return {"message": "Falta payment_id", "approved": False}
 
-        pago = sdk.payment().get(payment_id)["response"]
+        pago = await registro_pagos.estado(payment_id)
 
         return {
-            "payment_id": pago.get("id"),
+            "payment_id": pago.get("payment_id"),
             "status": pago.get("status"),
             "status_detail": pago.get("status_detail"),
-            "amount": pago.get("transaction_amount"),
+            "amount": pago.get("amount"),
             "approved": pago.get("status") == "approved"
         }
 
@@ -473,17 +739,17 @@ def validar_pago(request: Request):
 
 # Preguntas frecuentas (FAQ)
 @app.get("/api/faq", response_model=List[FAQModel])
-def obtener_faq():
+async def obtener_faq():
     try:
-        faq = list(faq_collection.find({}, {"_id": 0}))
+        faq = await faq_collection.find({}, {"_id": 0}).to_list(None)
         return faq
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener FAQs: {e}")
     
 @app.post("/api/faq")
-def crear_faq(pregunta: FAQModel):
+async def crear_faq(pregunta: FAQModel):
     try:
-        faq_collection.insert_one(pregunta.dict())
+        await faq_collection.insert_one(pregunta.dict())
         return {
             "message": "Pregunta agregada con éxito",
             "faq": pregunta
@@ -510,7 +776,7 @@ async def crear_ticket(ticket: dict = Body(...)):
             "createdAt": creado
         }
 
-        support_tickets_collection.insert_one(ticket_data)
+        await support_tickets_collection.insert_one(ticket_data)
 
         # Envolver respuesta en dict plano para evitar errores de serialización
         return {
@@ -530,18 +796,31 @@ async def crear_ticket(ticket: dict = Body(...)):
             "error": str(e)
         }
     
+# 📄 Historiales paginados por cursor (ver paginacion.py)
+CAMPOS_TICKET = {"userId", "issue", "status", "createdAt"}
+CAMPOS_CHIP = {"userId", "nombre", "direccion", "tipo", "telefono", "status", "createdAt"}
+
 @app.get("/api/soporte/{user_id}")
-def obtener_historial_tickets(user_id: str):
+async def obtener_historial_tickets(
+    user_id: str,
+    limit: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    campos: Optional[str] = None
+):
     try:
-        tickets = list(support_tickets_collection.find({"userId": user_id}, {"_id": 0}))
-        return {"tickets": tickets}
+        tickets, siguiente = await paginar(
+            support_tickets_collection, {"userId": user_id}, limit, cursor, campos, CAMPOS_TICKET
+        )
+        return {"tickets": tickets, "next_cursor": siguiente}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener tickets: {e}")
     
 @app.put("/api/soporte/{ticket_id}")
-def actualizar_estado_ticket(ticket_id: str, cambios: dict = Body(...)):
+async def actualizar_estado_ticket(ticket_id: str, cambios: dict = Body(...)):
     try:
-        resultado = support_tickets_collection.update_one(
+        resultado = await support_tickets_collection.update_one(
             {"_id": ObjectId(ticket_id)},
             {"$set": cambios}
         )
@@ -554,7 +833,7 @@ def actualizar_estado_ticket(ticket_id: str, cambios: dict = Body(...)):
 
 # Portabilidad
 @app.post("/api/chip/solicitud")
-def crear_solicitud_chip(data: dict = Body(...)):
+async def crear_solicitud_chip(data: dict = Body(...)):
     try:
         required = ["userId", "nombre", "direccion", "tipo"]
         if not all(k in data for k in required):
@@ -573,7 +852,7 @@ def crear_solicitud_chip(data: dict = Body(...)):
             "createdAt": datetime.utcnow()
         }
 
-        resultado = chip_requests_collection.insert_one(solicitud)
+        resultado = await chip_requests_collection.insert_one(solicitud)
 
         return {
             "message": "Solicitud recibida",
@@ -585,17 +864,26 @@ def crear_solicitud_chip(data: dict = Body(...)):
         raise HTTPException(status_code=500, detail="No se pudo registrar la solicitud")
     
 @app.get("/api/chips/{user_id}")
-def obtener_chips_usuario(user_id: str):
+async def obtener_chips_usuario(
+    user_id: str,
+    limit: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    campos: Optional[str] = None
+):
     try:
-        chips = list(chip_requests_collection.find({"userId": user_id}, {"_id": 0}))
-        return {"chips": chips}
+        chips, siguiente = await paginar(
+            chip_requests_collection, {"userId": user_id}, limit, cursor, campos, CAMPOS_CHIP
+        )
+        return {"chips": chips, "next_cursor": siguiente}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener historial de chips: {e}")
 
 @app.put("/api/chips/{chip_id}")
-def actualizar_chip(chip_id: str, cambios: dict = Body(...)):
+async def actualizar_chip(chip_id: str, cambios: dict = Body(...)):
     try:
-        resultado = chip_requests_collection.update_one(
+        resultado = await chip_requests_collection.update_one(
             {"_id": ObjectId(chip_id)},
             {"$set": cambios}
         )
@@ -607,7 +895,7 @@ def actualizar_chip(chip_id: str, cambios: dict = Body(...)):
     
 # Endpoint para depurar CORS
 @app.get("/api/debug")
-def debug_cors(request: Request):
+async def debug_cors(request: Request):
     return {
         "method": request.method,
         "url": str(request.url),
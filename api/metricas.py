@@ -0,0 +1,232 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Métricas en memoria con formato de exposición de Prometheus.
+# Cada combinación de etiquetas se crea una sola vez con .labels(...) y se
+# reutiliza, así registrar un valor no reserva memoria en cada petición.
+
+REGISTRO = []
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _formatear_etiquetas(nombres, valores, extra=""):
+    pares = [f'{n}="{str(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._hijos = {}
+        if not self.etiquetas:
+            self._hijos[()] = self._nuevo_hijo()
+        REGISTRO.append(self)
+
+    def labels(self, *valores):
+        hijo = self._hijos.get(valores)
+        if hijo is None:
+            hijo = self._hijos[valores] = self._nuevo_hijo()
+        return hijo
+
+    def __getattr__(self, attr):
+        # Métricas sin etiquetas: m.inc(), m.observe(...), etc.
+        return getattr(self._hijos[()], attr)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for valores, hijo in list(self._hijos.items()):
+            lineas.extend(hijo.lineas(self.nombre, self.etiquetas, valores))
+        return lineas
+
+
+class _Valor:
+    __slots__ = ("valor",)
+
+    def __init__(self):
+        self.valor = 0.0
+
+    def inc(self, n: float = 1.0):
+        self.valor += n
+
+    def dec(self, n: float = 1.0):
+        self.valor -= n
+
+    def set(self, valor: float):
+        self.valor = valor
+
+    def lineas(self, nombre, etiquetas, valores):
+        return [f"{nombre}{_formatear_etiquetas(etiquetas, valores)} {self.valor}"]
+
+
+class Counter(_Metrica):
+    tipo = "counter"
+
+    def _nuevo_hijo(self):
+        return _Valor()
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def _nuevo_hijo(self):
+        return _Valor()
+
+
+class _Distribucion:
+    __slots__ = ("buckets", "conteos", "suma", "total")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observe(self, valor: float):
+        self.conteos[bisect_left(self.buckets, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    @contextmanager
+    def tiempo(self):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio)
+
+    def lineas(self, nombre, etiquetas, valores):
+        lineas = []
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            le = _formatear_etiquetas(etiquetas, valores, f'le="{limite}"')
+            lineas.append(f"{nombre}_bucket{le} {acumulado}")
+        le = _formatear_etiquetas(etiquetas, valores, 'le="+Inf"')
+        lineas.append(f"{nombre}_bucket{le} {self.total}")
+        base = _formatear_etiquetas(etiquetas, valores)
+        lineas.append(f"{nombre}_sum{base} {self.suma}")
+        lineas.append(f"{nombre}_count{base} {self.total}")
+        return lineas
+
+
+class Histogram(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        self.buckets = tuple(buckets)
+        super().__init__(nombre, ayuda, etiquetas)
+
+    def _nuevo_hijo(self):
+        return _Distribucion(self.buckets)
+
+
+# 🌐 Llamadas a servicios externos (Pusher, Vonage, MercadoPago)
+llamadas_salida = Histogram(
+    "http_salida_segundos", "Duración de llamadas a servicios externos",
+    etiquetas=("servicio", "operacion"),
+)
+
+# 🚦 Peticiones entrantes
+peticiones_duracion = Histogram(
+    "http_peticion_segundos", "Latencia por ruta",
+    etiquetas=("metodo", "ruta", "codigo"),
+)
+peticiones_en_curso = Gauge("http_en_curso", "Peticiones atendiéndose en este momento")
+
+_CLASES_CODIGO = {1: "1xx", 2: "2xx", 3: "3xx", 4: "4xx", 5: "5xx"}
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mide latencia por ruta y peticiones en curso.
+
+    La ruta se etiqueta con su plantilla (``/api/soporte/{user_id}``), no con
+    la URL, para que el número de series no crezca con los ids.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._hijos = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        codigo = 500
+
+        async def send_con_codigo(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+            await send(mensaje)
+
+        peticiones_en_curso.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_codigo)
+        finally:
+            duracion = time.perf_counter() - inicio
+            peticiones_en_curso.dec()
+            ruta = scope.get("route")
+            clave = (scope["method"], ruta.path if ruta is not None else "sin_ruta", codigo // 100)
+            hijo = self._hijos.get(clave)
+            if hijo is None:
+                hijo = self._hijos[clave] = peticiones_duracion.labels(
+                    clave[0], clave[1], _CLASES_CODIGO.get(clave[2], str(codigo))
+                )
+            hijo.observe(duracion)
+
+
+# 🍃 Comandos de MongoDB (se registra en el cliente, ver database.py)
+mongo_comandos = Histogram(
+    "mongo_comando_segundos", "Duración de comandos de MongoDB por colección",
+    etiquetas=("coleccion", "comando"),
+)
+mongo_errores = Counter("mongo_comando_errores_total", "Comandos de MongoDB fallidos", etiquetas=("coleccion", "comando"))
+
+
+def crear_monitor_mongo():
+    """CommandListener de pymongo que alimenta ``mongo_comando_segundos``.
+
+    pymongo lo invoca desde los hilos de Motor, así que se protege con un lock.
+    """
+    from pymongo import monitoring
+
+    class MonitorComandos(monitoring.CommandListener):
+        def __init__(self):
+            self._colecciones = {}
+            self._lock = threading.Lock()
+
+        def started(self, event):
+            objetivo = event.command.get(event.command_name)
+            if not isinstance(objetivo, str):
+                objetivo = event.command.get("collection", "")
+            self._colecciones[(event.connection_id, event.request_id)] = objetivo
+
+        def succeeded(self, event):
+            coleccion = self._colecciones.pop((event.connection_id, event.request_id), "")
+            with self._lock:
+                mongo_comandos.labels(coleccion, event.command_name).observe(event.duration_micros / 1e6)
+
+        def failed(self, event):
+            coleccion = self._colecciones.pop((event.connection_id, event.request_id), "")
+            with self._lock:
+                mongo_comandos.labels(coleccion, event.command_name).observe(event.duration_micros / 1e6)
+                mongo_errores.labels(coleccion, event.command_name).inc()
+
+    return MonitorComandos()
+
+
+def exponer() -> str:
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
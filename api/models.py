@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Literal, List, Optional
+from typing import Annotated, Literal, List, Optional
 from datetime import datetime
     
 # Modelo de entrada
@@ -59,6 +59,18 @@ class DataUsageModel(BaseModel):
     userId: str
     daily_usage: List[dict]  # Lista de consumo diario, estructura: {"date": datetime, "dataUsed": float, "unit": "GB"}
 
+# Registro de consumo tal como lo envía la red (ver ingesta.py)
+class UsageRecord(BaseModel):
+    userId: str = Field(..., pattern=r"^[0-9a-fA-F]{24}$")
+    ts: datetime
+    bytes: int = Field(..., ge=0)
+
+# Mismo contenido en columnas: {"userId": [...], "ts": [...], "bytes": [...]}
+class UsageColumns(BaseModel):
+    userId: List[Annotated[str, Field(pattern=r"^[0-9a-fA-F]{24}$")]]
+    ts: List[datetime]
+    bytes: List[Annotated[int, Field(ge=0)]]
+
 # Modelo para Tickets de Soporte
 class SupportTicketModel(BaseModel):
     userId: str
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import otp_collection
+from metricas import Counter, Gauge, Histogram
+
+# 🔐 Códigos OTP
+# Un solo documento por teléfono: {phone, code, expiresAt, verified, verifiedAt}.
+# Emitir, verificar y consumir son cada uno una operación atómica, así que
+# peticiones simultáneas para el mismo número no se pisan.
+#
+# Mongo borra los códigos vencidos con el índice TTL de otp.expiresAt (ver
+# indices.py). El monitor TTL corre cada ~60 s, así que la validación sigue
+# comparando expiresAt con la hora actual. El barrido periódico es opcional
+# (OTP_REAPER_INTERVALO > 0) para despliegues sin índice TTL.
+
+OTP_REAPER_INTERVALO = float(os.getenv("OTP_REAPER_INTERVALO", "0"))
+OTP_VIGENCIA = timedelta(minutes=2)
+# Tiempo que se conserva un número verificado para terminar el registro
+OTP_VERIFICADO_VIGENCIA = timedelta(hours=float(os.getenv("OTP_VERIFICADO_HORAS", "24")))
+
+VALIDO = "valido"
+NO_ENCONTRADO = "no_encontrado"
+EXPIRADO = "expirado"
+INCORRECTO = "incorrecto"
+
+
+async def emitir_codigo(phone: str, code: str):
+    """Guarda un código nuevo para el número, reemplazando cualquier estado previo."""
+    filtro = {"phone": phone}
+    cambios = {
+        "$set": {"code": code, "expiresAt": datetime.utcnow() + OTP_VIGENCIA, "verified": False},
+        "$unset": {"verifiedAt": ""},
+    }
+    try:
+        await otp_collection.update_one(filtro, cambios, upsert=True)
+    except DuplicateKeyError:
+        # Dos upserts simultáneos: el otro insertó primero, ahora sí hay documento
+        await otp_collection.update_one(filtro, cambios)
+
+
+async def verificar_codigo(phone: str, code: str) -> str:
+    """Marca el número como verificado si el código coincide y sigue vigente.
+
+    En el caso exitoso es una sola operación; solo cuando falla se lee el
+    documento para saber por qué.
+    """
+    ahora = datetime.utcnow()
+    registro = await otp_collection.find_one_and_update(
+        {"phone": phone, "code": code, "verified": False, "expiresAt": {"$gt": ahora}},
+        {
+            "$set": {"verified": True, "verifiedAt": ahora, "expiresAt": ahora + OTP_VERIFICADO_VIGENCIA},
+            "$unset": {"code": ""},
+        },
+        projection={"_id": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if registro:
+        return VALIDO
+
+    registro = await otp_collection.find_one({"phone": phone, "code": {"$exists": True}})
+    if not registro:
+        return NO_ENCONTRADO
+    # El índice TTL puede tardar hasta un minuto en borrar el código
+    if registro["expiresAt"] <= ahora:
+        return EXPIRADO
+    return INCORRECTO
+
+
+async def consumir_verificacion(phone: str) -> bool:
+    """Borra la verificación del número; ``True`` si existía y seguía vigente."""
+    registro = await otp_collection.find_one_and_delete(
+        {"phone": phone, "verified": True, "expiresAt": {"$gt": datetime.utcnow()}},
+        projection={"_id": 1},
+    )
+    return registro is not None
+
+
+async def restaurar_verificacion(phone: str):
+    """Devuelve la verificación si el registro falla después de consumirla."""
+    ahora = datetime.utcnow()
+    try:
+        await otp_collection.update_one(
+            {"phone": phone},
+            {"$set": {"verified": True, "verifiedAt": ahora, "expiresAt": ahora + OTP_VERIFICADO_VIGENCIA},
+             "$unset": {"code": ""}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        pass
+
+otp_reaper_borrados = Counter("otp_reaper_borrados_total", "Códigos vencidos borrados por el barrido")
+otp_reaper_duracion = Histogram("otp_reaper_segundos", "Duración de cada barrido de OTP vencidos")
+otp_reaper_ultimo = Gauge("otp_reaper_ultimo_timestamp", "Hora (epoch) del último barrido exitoso")
+
+
+async def limpiar_codigos_expirados():
+    with otp_reaper_duracion.tiempo():
+        resultado = await otp_collection.delete_many({"expiresAt": {"$lt": datetime.utcnow()}})
+    otp_reaper_borrados.inc(resultado.deleted_count)
+    otp_reaper_ultimo.set(time.time())
+    return resultado.deleted_count
+
+
+class BarridoOTP:
+    def __init__(self, intervalo: float = OTP_REAPER_INTERVALO):
+        self.intervalo = intervalo
+        self._tarea = None
+
+    def iniciar(self):
+        if self.intervalo > 0:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                borrados = await limpiar_codigos_expirados()
+                if borrados:
+                    print(f"🧹 OTPs vencidos eliminados: {borrados}")
+            except Exception:
+                logging.exception("❌ Error en el barrido de OTP")
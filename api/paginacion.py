@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+
+# 📄 Paginación por cursor (keyset) para historiales por usuario
+# Orden estable (createdAt desc, _id desc) respaldado por el índice
+# (userId, createdAt, _id). El cursor lleva el createdAt y el _id del último
+# elemento entregado, así cada página cuesta lo mismo sin importar cuántos
+# documentos tenga el usuario.
+
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+
+ORDEN = [("createdAt", DESCENDING), ("_id", DESCENDING)]
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(doc: dict) -> str:
+    creado = doc.get("createdAt")
+    # Los tickets guardan createdAt como cadena ISO y los chips como fecha;
+    # el cursor conserva el tipo para comparar contra el mismo tipo BSON.
+    if isinstance(creado, datetime):
+        valor = {"d": creado.isoformat()}
+    else:
+        valor = {"s": creado}
+    datos = json.dumps({**valor, "i": str(doc["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    """Regresa ``(createdAt, _id)`` del cursor o lanza ``CursorInvalido``."""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        creado = datetime.fromisoformat(datos["d"]) if "d" in datos else datos["s"]
+        return creado, ObjectId(datos["i"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise CursorInvalido("Cursor inválido") from e
+
+
+def proyeccion(campos: str, permitidos: set) -> dict:
+    """Convierte ``"issue,status"`` en una proyección; ``None`` = todos los permitidos."""
+    if campos:
+        pedidos = {c.strip() for c in campos.split(",") if c.strip()}
+        desconocidos = pedidos - permitidos
+        if desconocidos:
+            raise ValueError(f"Campos no permitidos: {', '.join(sorted(desconocidos))}")
+    else:
+        pedidos = permitidos
+    # createdAt y _id se leen siempre porque forman el cursor
+    return {c: 1 for c in pedidos | {"createdAt"}}, pedidos
+
+
+async def paginar(coleccion, filtro: dict, limite: int, cursor: str = None,
+                  campos: str = None, permitidos: set = frozenset()):
+    """Una página del historial: ``(documentos, siguiente_cursor)``.
+
+    ``siguiente_cursor`` es ``None`` en la última página.
+    """
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    proyectar, pedidos = proyeccion(campos, set(permitidos))
+
+    consulta = dict(filtro)
+    if cursor:
+        creado, _id = decodificar_cursor(cursor)
+        consulta["$or"] = [
+            {"createdAt": {"$lt": creado}},
+            {"createdAt": creado, "_id": {"$lt": _id}},
+        ]
+
+    # Se pide uno de más para saber si hay otra página sin contar documentos
+    docs = await coleccion.find(consulta, proyectar).sort(ORDEN).limit(limite + 1).to_list(limite + 1)
+    siguiente = codificar_cursor(docs[limite - 1]) if len(docs) > limite else None
+
+    pagina = [{c: v for c, v in doc.items() if c in pedidos} for doc in docs[:limite]]
+    return pagina, siguiente
@@ -0,0 +1,214 @@
+import hashlib
+import hmac
+import os
+import uuid
+from datetime import datetime
+
+import httpx
+
+from cache import CacheTTL, VueloUnico
+from metricas import Counter, llamadas_salida
+
+# 💳 Pasarela de MercadoPago
+# Un cliente por proceso y por entorno (sandbox/production) con pool de
+# conexiones keep-alive, en lugar de construir mercadopago.SDK en cada
+# petición. Se habla directamente con la API REST usando httpx asíncrono.
+
+MP_API_URL = os.getenv("MP_API_URL", "https://api.mercadopago.com")
+MP_TIMEOUT = float(os.getenv("MP_TIMEOUT", "10"))
+MP_MAX_CONEXIONES = int(os.getenv("MP_MAX_CONEXIONES", "20"))
+
+_preferencias = llamadas_salida.labels("mercadopago", "preference")
+_pagos = llamadas_salida.labels("mercadopago", "payment")
+_salud = llamadas_salida.labels("mercadopago", "salud")
+
+
+class ErrorPasarela(Exception):
+    def __init__(self, status: int, respuesta):
+        super().__init__(f"MercadoPago respondió {status}: {respuesta}")
+        self.status = status
+        self.respuesta = respuesta
+
+
+def entorno_actual() -> str:
+    return os.getenv("MP_ENV", "sandbox").lower()
+
+
+class PasarelaMercadoPago:
+    def __init__(self, env: str, token: str, base_url: str = MP_API_URL,
+                 timeout: float = MP_TIMEOUT, max_conexiones: int = MP_MAX_CONEXIONES):
+        self.env = env
+        self._token = token
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_conexiones = max_conexiones
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self._token}"},
+                limits=httpx.Limits(
+                    max_connections=self.max_conexiones,
+                    max_keepalive_connections=self.max_conexiones,
+                ),
+            )
+        return self._client
+
+    async def _pedir(self, metrica, metodo, ruta, **kwargs):
+        with metrica.tiempo():
+            r = await self.client.request(metodo, ruta, **kwargs)
+        try:
+            cuerpo = r.json()
+        except ValueError:
+            cuerpo = r.text
+        if r.status_code >= 400:
+            raise ErrorPasarela(r.status_code, cuerpo)
+        return cuerpo
+
+    async def crear_preferencia(self, data: dict) -> dict:
+        return await self._pedir(
+            _preferencias, "POST", "/checkout/preferences", json=data,
+            headers={"X-Idempotency-Key": str(uuid.uuid4())},
+        )
+
+    async def obtener_pago(self, payment_id: str) -> dict:
+        return await self._pedir(_pagos, "GET", f"/v1/payments/{payment_id}")
+
+    async def verificar(self):
+        """Consulta ligera para el monitor de salud (ver salud.py)."""
+        await self._pedir(_salud, "GET", "/v1/payment_methods")
+
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_pasarelas = {}
+_pasarelas_pid = None
+
+
+def obtener_pasarela(env: str = None) -> PasarelaMercadoPago:
+    """Pasarela compartida del entorno indicado (por defecto MP_ENV)."""
+    global _pasarelas, _pasarelas_pid
+    if _pasarelas_pid != os.getpid():
+        # Tras un fork no se reutilizan las conexiones del proceso padre
+        _pasarelas, _pasarelas_pid = {}, os.getpid()
+
+    env = env or entorno_actual()
+    pasarela = _pasarelas.get(env)
+    if pasarela is None:
+        token = os.getenv("MP_ACCESS_TOKEN_PROD") if env == "production" else os.getenv("MP_ACCESS_TOKEN_SANDBOX")
+        pasarela = _pasarelas[env] = PasarelaMercadoPago(env, token)
+    return pasarela
+
+
+async def cerrar_pasarelas():
+    for pasarela in list(_pasarelas.values()):
+        await pasarela.cerrar()
+    _pasarelas.clear()
+
+
+# 🧾 Estado de pagos
+# Las notificaciones (webhook) de MercadoPago alimentan la colección payments;
+# /api/pago/validar responde desde ahí. Solo se consulta a MercadoPago si el
+# pago no se conoce o sigue en un estado que todavía puede cambiar.
+
+# Ya no cambian: se guardan en memoria y sus notificaciones se ignoran
+ESTADOS_DEFINITIVOS = {"rejected", "cancelled", "refunded", "charged_back"}
+# Se responden sin consultar a MercadoPago. approved todavía puede pasar a
+# refunded o charged_back; ese cambio llega por webhook y se lee de Mongo.
+ESTADOS_FINALES = ESTADOS_DEFINITIVOS | {"approved"}
+MP_WEBHOOK_SECRET = os.getenv("MP_WEBHOOK_SECRET")
+
+pagos_consultas = Counter("pagos_consultas_total", "Origen de la respuesta de /api/pago/validar", etiquetas=("origen",))
+_desde_memoria = pagos_consultas.labels("memoria")
+_desde_mongo = pagos_consultas.labels("mongo")
+_desde_mercadopago = pagos_consultas.labels("mercadopago")
+
+
+def firma_webhook_valida(x_signature: str, x_request_id: str, data_id: str, secreto: str = None) -> bool:
+    """Valida la cabecera ``x-signature`` de una notificación de MercadoPago.
+
+    Sin MP_WEBHOOK_SECRET configurado ninguna notificación pasa.
+    """
+    secreto = secreto or MP_WEBHOOK_SECRET
+    if not secreto:
+        return False
+    partes = dict(p.strip().split("=", 1) for p in (x_signature or "").split(",") if "=" in p)
+    if "ts" not in partes or "v1" not in partes:
+        return False
+    manifiesto = f"id:{data_id.lower()};request-id:{x_request_id or ''};ts:{partes['ts']};"
+    esperado = hmac.new(secreto.encode(), manifiesto.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperado, partes["v1"])
+
+
+def resumir_pago(pago: dict) -> dict:
+    return {
+        "payment_id": pago.get("id"),
+        "status": pago.get("status"),
+        "status_detail": pago.get("status_detail"),
+        "amount": pago.get("transaction_amount"),
+        "external_reference": pago.get("external_reference"),
+    }
+
+
+class RegistroPagos:
+    def __init__(self, coleccion, max_en_memoria: int = 10_000, ttl: float = 3600):
+        self.coleccion = coleccion
+        self._definitivos = CacheTTL(ttl=ttl, max_entradas=max_en_memoria)
+        self._consultas = VueloUnico()
+
+    async def guardar(self, resumen: dict):
+        payment_id = str(resumen["payment_id"])
+        await self.coleccion.update_one(
+            {"_id": payment_id},
+            {"$set": {**resumen, "updatedAt": datetime.utcnow()}},
+            upsert=True,
+        )
+        if resumen.get("status") in ESTADOS_DEFINITIVOS:
+            self._definitivos.set(payment_id, resumen)
+
+    async def refrescar(self, payment_id: str) -> dict:
+        """Consulta MercadoPago (una sola vez aunque lleguen varias peticiones)."""
+        async def consultar():
+            resumen = resumir_pago(await obtener_pasarela().obtener_pago(payment_id))
+            await self.guardar(resumen)
+            return resumen
+
+        return await self._consultas.hacer(str(payment_id), consultar)
+
+    async def estado(self, payment_id: str) -> dict:
+        payment_id = str(payment_id)
+        resumen = self._definitivos.get(payment_id)
+        if resumen is not None:
+            _desde_memoria.inc()
+            return resumen
+
+        guardado = await self.coleccion.find_one({"_id": payment_id}, {"_id": 0, "updatedAt": 0})
+        if guardado and guardado.get("status") in ESTADOS_FINALES:
+            if guardado["status"] in ESTADOS_DEFINITIVOS:
+                self._definitivos.set(payment_id, guardado)
+            _desde_mongo.inc()
+            return guardado
+
+        _desde_mercadopago.inc()
+        return await self.refrescar(payment_id)
+
+    async def notificar(self, payment_id: str):
+        """Procesa una notificación; se ignora si el pago ya no puede cambiar.
+
+        Un pago approved sí se vuelve a consultar: la notificación puede ser
+        un reembolso o un contracargo.
+        """
+        payment_id = str(payment_id)
+        if self._definitivos.get(payment_id) is not None:
+            return
+        guardado = await self.coleccion.find_one({"_id": payment_id}, {"status": 1})
+        if guardado and guardado.get("status") in ESTADOS_DEFINITIVOS:
+            return
+        await self.refrescar(payment_id)
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+from bson import ObjectId
+
+from cache import CacheTTL
+from database import users_collection
+from metricas import Counter
+
+# 👤 Caché de perfiles por worker
+# Guarda solo los campos que devuelve /api/auth/profile (sin password ni
+# transactions). Las escrituras de este worker la actualizan al momento; las
+# de otros workers llegan por change streams de MongoDB o, si el clúster no
+# los soporta, revisando users.updatedAt cada PERFIL_POLL_INTERVALO segundos.
+
+PERFIL_CACHE_TTL = float(os.getenv("PERFIL_CACHE_TTL", "300"))
+PERFIL_CACHE_MAX = int(os.getenv("PERFIL_CACHE_MAX", "10000"))
+PERFIL_POLL_INTERVALO = float(os.getenv("PERFIL_POLL_INTERVALO", "5"))
+
+PROYECCION_PERFIL = {"name": 1, "phone": 1, "email": 1, "balance": 1, "plan": 1, "updatedAt": 1, "createdAt": 1}
+
+perfil_invalidaciones = Counter(
+    "perfil_invalidaciones_total", "Perfiles invalidados por escrituras de otros workers",
+    etiquetas=("origen",),
+)
+_por_change_stream = perfil_invalidaciones.labels("change_stream")
+_por_sondeo = perfil_invalidaciones.labels("sondeo")
+
+
+def armar_perfil(doc: dict):
+    """Regresa ``(perfil, cuerpo_json, etag)`` a partir de un documento de users."""
+    perfil = {
+        "user_id": str(doc["_id"]),
+        "name": doc["name"],
+        "phone": doc["phone"],
+        "email": doc.get("email"),
+        "balance": doc["balance"],
+        "plan": doc["plan"],
+    }
+    cuerpo = json.dumps(perfil, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    version = doc.get("updatedAt") or doc.get("createdAt")
+    if version is not None:
+        etag = f'W/"{perfil["user_id"]}-{int(version.timestamp() * 1000)}"'
+    else:
+        # Usuarios anteriores a updatedAt: la versión es el propio contenido
+        etag = 'W/"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+    return perfil, cuerpo, etag
+
+
+class CachePerfiles:
+    def __init__(self, ttl: float = PERFIL_CACHE_TTL, max_entradas: int = PERFIL_CACHE_MAX,
+                 intervalo_sondeo: float = PERFIL_POLL_INTERVALO):
+        self.cache = CacheTTL(ttl=ttl, max_entradas=max_entradas)
+        self.intervalo_sondeo = intervalo_sondeo
+        self._tarea = None
+
+    async def obtener(self, user_id: str):
+        """``(perfil, cuerpo_json, etag)`` o ``None`` si el usuario no existe.
+
+        Los usuarios inexistentes no se cachean.
+        """
+        async def cargar():
+            doc = await users_collection.find_one({"_id": ObjectId(user_id)}, PROYECCION_PERFIL)
+            return armar_perfil(doc) if doc else None
+
+        return await self.cache.obtener_o_cargar(user_id, cargar)
+
+    def guardar(self, doc: dict):
+        """Escritura directa tras crear o actualizar un usuario en este worker."""
+        entrada = armar_perfil(doc)
+        # invalidar() descarta la lectura en curso de este usuario: no pisa este valor
+        self.cache.invalidar(entrada[0]["user_id"])
+        self.cache.set(entrada[0]["user_id"], entrada)
+        return entrada
+
+    def invalidar(self, user_id: str):
+        self.cache.invalidar(user_id)
+
+    # 🔄 Invalidación entre workers
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._vigilar())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    async def _vigilar(self):
+        try:
+            await self._escuchar_cambios()
+        except Exception as e:
+            # Sin replica set no hay change streams (p. ej. Mongo local standalone)
+            logging.info("ℹ️ Change streams no disponibles (%s); se usará sondeo de updatedAt", e)
+            await self._sondear()
+
+    async def _escuchar_cambios(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+        abierto = False
+        while True:
+            try:
+                async with users_collection.watch(pipeline) as cambios:
+                    abierto = True
+                    async for cambio in cambios:
+                        self.invalidar(str(cambio["documentKey"]["_id"]))
+                        _por_change_stream.inc()
+            except Exception:
+                if not abierto:
+                    raise
+                # Caída de red: no sabemos qué cambió mientras tanto
+                logging.exception("❌ Change stream de users interrumpido; se vacía la caché")
+                self.cache.invalidar()
+                await asyncio.sleep(1)
+
+    async def _sondear(self):
+        ultimo = datetime.utcnow()
+        while True:
+            await asyncio.sleep(self.intervalo_sondeo)
+            try:
+                cursor = users_collection.find(
+                    {"updatedAt": {"$gt": ultimo}}, {"_id": 1, "updatedAt": 1}
+                ).sort("updatedAt", 1)
+                async for doc in cursor:
+                    self.invalidar(str(doc["_id"]))
+                    _por_sondeo.inc()
+                    ultimo = max(ultimo, doc["updatedAt"])
+            except Exception:
+                logging.exception("❌ Error al sondear cambios de users")
@@ -0,0 +1,207 @@
+"""Pronóstico de agotamiento de datos para todos los usuarios en una pasada.
+
+Carga el consumo diario (data_usage_rollups, granularidad "dia") de los
+últimos CONSUMO_PRONOSTICO_DIAS días en una matriz usuarios × días, ajusta
+con NumPy una tendencia lineal por usuario sobre las últimas dos semanas y
+calcula cuándo se acabaría el data_limit de su plan dentro del ciclo
+actual (validity_days contados desde createdAt). El resultado se guarda en
+quota_forecasts, un documento pequeño por usuario que /api/consumo/{user_id}
+lee por _id.
+
+Uso:
+    python pronosticos.py          # pensado para un cron diario
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from database import forecasts_collection, plans_collection, usage_rollups_collection, users_collection
+
+CONSUMO_PRONOSTICO_DIAS = int(os.getenv("CONSUMO_PRONOSTICO_DIAS", "35"))
+DIAS_TENDENCIA = 14
+LOTE_ESCRITURA = 10_000
+LOTE_LECTURA = 100_000
+
+_UNIDADES = {"MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+_LIMITE = re.compile(r"([\d.]+)\s*(MB|GB|TB)", re.IGNORECASE)
+
+
+def limite_en_bytes(data_limit: str):
+    """``"10 GB"`` → bytes; ``None`` para planes ilimitados o sin formato reconocible."""
+    m = _LIMITE.search(data_limit or "")
+    return float(m.group(1)) * _UNIDADES[m.group(2).upper()] if m else None
+
+
+def pronosticar(consumo: np.ndarray, dia_ciclo: np.ndarray, limites: np.ndarray, dias_tendencia: int = DIAS_TENDENCIA):
+    """Días hasta agotar el límite para cada usuario (vectorizado).
+
+    ``consumo``: matriz float (usuarios × días), la última columna es ayer.
+    ``dia_ciclo``: columna de ``consumo`` donde empieza el ciclo actual de
+    cada usuario (puede ser 0 si empezó antes de la ventana).
+    ``limites``: bytes del plan de cada usuario.
+
+    Regresa ``(dias, usado, tasa)``; ``dias`` es ``inf`` si al ritmo actual
+    no se agota y 0 si ya se agotó.
+    """
+    usuarios, dias = consumo.shape
+
+    # Consumido en el ciclo: se recorre por columnas para no duplicar la matriz
+    usado = np.zeros(usuarios, dtype=np.float64)
+    for j in range(dias):
+        usado += np.where(dia_ciclo <= j, consumo[:, j], 0.0)
+    restante = limites - usado
+
+    # Mínimos cuadrados por renglón: pendiente = Σ(x-x̄)(y-ȳ) / Σ(x-x̄)²
+    k = min(dias_tendencia, dias)
+    reciente = consumo[:, -k:]
+    x = np.arange(k, dtype=np.float64)
+    xc = x - x.mean()
+    media = reciente.mean(axis=1)
+    pendiente = (reciente @ xc) / (xc @ xc) if k > 1 else np.zeros(usuarios)
+    # Consumo esperado mañana (x = k) y cómo cambia cada día
+    tasa = np.maximum(media + pendiente * (k - x.mean()), 0.0)
+    pendiente = np.where(tasa > 0, pendiente, 0.0)
+
+    # Σ_{j=1..D} (tasa + pendiente·(j-1)) = R  →  p/2·D² + (tasa - p/2)·D - R = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = tasa - pendiente / 2
+        cuadratica = (-b + np.sqrt(b * b + 2 * pendiente * restante)) / pendiente
+        # Con tendencia plana o a la baja se proyecta la tasa actual sin extrapolar la baja
+        lineal = np.where(tasa > 0, restante / tasa, np.inf)
+        dias_restantes = np.where(pendiente > 0, cuadratica, lineal)
+    # Ya agotado (aquí la raíz de la cuadrática puede no ser real)
+    dias_restantes = np.where(restante <= 0, 0.0, dias_restantes)
+    return dias_restantes, usado, tasa
+
+
+def _volcar(consumo, n_usuarios, filas, columnas, valores):
+    """Escribe un lote en la matriz; la agranda al doble si ya no caben los usuarios."""
+    if n_usuarios > len(consumo):
+        mayor = np.zeros((max(n_usuarios, 2 * len(consumo)), consumo.shape[1]), dtype=consumo.dtype)
+        mayor[:len(consumo)] = consumo
+        consumo = mayor
+    columnas = np.asarray(columnas)
+    validas = (columnas >= 0) & (columnas < consumo.shape[1])
+    consumo[np.asarray(filas)[validas], columnas[validas]] = np.asarray(valores, dtype=np.float32)[validas]
+    return consumo
+
+
+async def llenar_matriz(docs, desde: datetime, dias: int, lote: int = LOTE_LECTURA):
+    """Matriz usuarios × días a partir de rollups ``{userId, inicio, bytes}`` (iterable async).
+
+    Solo un lote de documentos vive como objetos de Python a la vez; la
+    matriz float32 se reserva de antemano y crece al doble cuando hace falta.
+    """
+    indice, filas, columnas, valores = {}, [], [], []
+    consumo = np.zeros((min(lote, 1024), dias), dtype=np.float32)
+    async for doc in docs:
+        filas.append(indice.setdefault(doc["userId"], len(indice)))
+        columnas.append((doc["inicio"] - desde).days)
+        valores.append(doc["bytes"])
+        if len(valores) == lote:
+            consumo = _volcar(consumo, len(indice), filas, columnas, valores)
+            filas, columnas, valores = [], [], []
+    if valores:
+        consumo = _volcar(consumo, len(indice), filas, columnas, valores)
+    return consumo[:len(indice)], indice
+
+
+async def _cargar_consumo(desde: datetime, dias: int):
+    """Matriz de consumo diario e índice de usuarios (ObjectId → renglón)."""
+    cursor = usage_rollups_collection.find(
+        {"granularidad": "dia", "inicio": {"$gte": desde}},
+        {"_id": 0, "userId": 1, "inicio": 1, "bytes": 1},
+        batch_size=10_000,
+    )
+    return await llenar_matriz(cursor, desde, dias)
+
+
+async def _cargar_planes():
+    planes = {}
+    async for p in plans_collection.find({}, {"name": 1, "data_limit": 1, "validity_days": 1}):
+        datos = (limite_en_bytes(p.get("data_limit")), int(p.get("validity_days") or 30))
+        # users.plan puede guardar el nombre o el _id del plan
+        planes[p["name"]] = planes[str(p["_id"])] = datos
+    return planes
+
+
+async def calcular_pronosticos(hoy: datetime = None) -> int:
+    hoy = (hoy or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    dias = CONSUMO_PRONOSTICO_DIAS
+    desde = hoy - timedelta(days=dias)
+
+    inicio = time.perf_counter()
+    consumo, indice = await _cargar_consumo(desde, dias)
+    planes = await _cargar_planes()
+
+    usuarios = list(indice)
+    limites = np.full(len(usuarios), np.nan)
+    dia_ciclo = np.zeros(len(usuarios), dtype=np.int64)
+    fin_ciclo = [None] * len(usuarios)
+    # $in por tramos: un millón de ids no cabe en un documento de 16 MB
+    for i in range(0, len(usuarios), LOTE_ESCRITURA):
+        tramo = usuarios[i:i + LOTE_ESCRITURA]
+        async for u in users_collection.find({"_id": {"$in": tramo}}, {"plan": 1, "createdAt": 1}):
+            plan = planes.get(str(u.get("plan")))
+            if not plan or plan[0] is None:
+                continue
+            fila = indice[u["_id"]]
+            limite, vigencia = plan
+            # El ciclo vigente empieza un múltiplo de validity_days después del alta
+            alta = u.get("createdAt") or desde
+            ciclos = max(0, (hoy - alta).days) // vigencia
+            comienzo = alta + timedelta(days=ciclos * vigencia)
+            limites[fila] = limite
+            dia_ciclo[fila] = min(max(0, (comienzo - desde).days), dias)
+            fin_ciclo[fila] = comienzo + timedelta(days=vigencia)
+    logging.info("📥 %d usuarios cargados en %.1fs", len(usuarios), time.perf_counter() - inicio)
+
+    con_plan = ~np.isnan(limites)
+    dias_restantes, usado, tasa = pronosticar(consumo[con_plan], dia_ciclo[con_plan], limites[con_plan])
+    del consumo
+
+    calculado = datetime.utcnow()
+    filas = np.flatnonzero(con_plan)
+    operaciones, escritos = [], 0
+    for fila, d, u, t in zip(filas.tolist(), dias_restantes.tolist(), usado.tolist(), tasa.tolist()):
+        # Si el ciclo termina antes (o nunca se agota) no hay fecha que avisar
+        agota = hoy + timedelta(days=d) if d < (fin_ciclo[fila] - hoy).days else None
+        operaciones.append(ReplaceOne({"_id": usuarios[fila]}, {
+            "agotaEn": agota,
+            "usado": int(u),
+            "limite": int(limites[fila]),
+            "consumoDiario": int(t),
+            "finCiclo": fin_ciclo[fila],
+            "calculadoEn": calculado,
+        }, upsert=True))
+        if len(operaciones) == LOTE_ESCRITURA:
+            await forecasts_collection.bulk_write(operaciones, ordered=False)
+            escritos += len(operaciones)
+            operaciones = []
+    if operaciones:
+        await forecasts_collection.bulk_write(operaciones, ordered=False)
+        escritos += len(operaciones)
+    logging.info("🔮 %d pronósticos guardados en %.1fs", escritos, time.perf_counter() - inicio)
+    return escritos
+
+
+async def obtener_pronostico(user_id: ObjectId):
+    return await forecasts_collection.find_one({"_id": user_id}, {"_id": 0})
+
+
+async def _main():
+    logging.basicConfig(level=logging.INFO)
+    print(f"✅ {await calcular_pronosticos()} pronósticos calculados")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
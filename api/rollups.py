@@ -0,0 +1,312 @@
+"""Acumulados de consumo por hora, día y mes, mantenidos de forma incremental.
+
+Una tarea por worker (solo una a la vez gracias a un bloqueo en Mongo) lee
+los registros de data_usage_events que llegaron desde la última marca de
+agua, los agrupa por usuario y hora, y suma esos deltas a las horas, días y
+meses correspondientes en data_usage_rollups. La marca de agua avanza sobre
+el orden de llegada (recibidoEn, que pone ingesta.py al escribir), no sobre
+el tiempo del evento: un lote de la red con registros de hace horas entra
+completo en la siguiente pasada. CONSUMO_ROLLUP_RETRASO solo cubre las
+escrituras que siguen en vuelo. Los registros anteriores a recibidoEn se
+ubican por su ts.
+
+Cada pasada tiene un número de corrida y cada acumulado guarda la última que
+lo tocó, así repetir una pasada interrumpida no suma dos veces.
+
+Uso:
+    python rollups.py                          # procesa lo pendiente y termina
+    python rollups.py --backfill               # reconstruye todo desde los registros crudos
+    python rollups.py --backfill --desde 2026-01-15   # reconstruye desde el mes de esa fecha
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+from datetime import date, datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import rollup_marks_collection, usage_events_collection, usage_rollups_collection
+from metricas import Counter, Gauge
+
+CONSUMO_ROLLUP_INTERVALO = float(os.getenv("CONSUMO_ROLLUP_INTERVALO", "60"))
+CONSUMO_ROLLUP_RETRASO = float(os.getenv("CONSUMO_ROLLUP_RETRASO", "300"))
+VENTANA_MAXIMA = timedelta(hours=6)
+BLOQUEO = timedelta(minutes=5)
+MARCA = "data_usage_events"
+GRANULARIDADES = ("hora", "dia", "mes")
+
+rollup_ventanas = Counter("consumo_rollup_ventanas_total", "Ventanas de registros acumuladas")
+rollup_retraso = Gauge("consumo_rollup_retraso_segundos", "Distancia entre ahora y la marca de agua")
+
+
+class RollupOcupado(Exception):
+    pass
+
+
+def _inicios(hora: datetime):
+    """Inicio de la hora, el día y el mes a los que pertenece ``hora``."""
+    return (
+        ("hora", hora),
+        ("dia", hora.replace(hour=0)),
+        ("mes", hora.replace(day=1, hour=0)),
+    )
+
+
+def _llegados(desde, hasta) -> dict:
+    """Registros que llegaron en ``(desde, hasta]``; sin recibidoEn cuenta su ts."""
+    rango = {"$lte": hasta} if desde is None else {"$gt": desde, "$lte": hasta}
+    return {"$or": [{"recibidoEn": rango}, {"recibidoEn": {"$exists": False}, "ts": rango}]}
+
+
+def _filtro(ventana: dict) -> dict:
+    if "ts" in ventana:
+        # Ventana de una reconstrucción: por tiempo del evento, solo lo que
+        # ya había llegado al empezarla
+        return {"$and": [
+            {"ts": {"$gte": ventana["ts"], "$lt": ventana["ts"] + VENTANA_MAXIMA}},
+            _llegados(None, ventana["hasta"]),
+        ]}
+    return _llegados(ventana["desde"], ventana["hasta"])
+
+
+async def _primera_llegada():
+    llegadas = []
+    for campo in ("recibidoEn", "ts"):
+        # Sin recibidoEn, el registro "llegó" en su ts
+        doc = await usage_events_collection.find_one(
+            {"recibidoEn": {"$exists": campo == "recibidoEn"}}, {campo: 1}, sort=[(campo, ASCENDING)]
+        )
+        if doc is not None:
+            llegadas.append(doc[campo])
+    return min(llegadas, default=None)
+
+
+async def _agregar_crudos(ventana: dict) -> dict:
+    pipeline = [
+        {"$match": _filtro(ventana)},
+        {"$group": {
+            "_id": {
+                "u": "$userId",
+                "y": {"$year": "$ts"}, "m": {"$month": "$ts"},
+                "d": {"$dayOfMonth": "$ts"}, "h": {"$hour": "$ts"},
+            },
+            "bytes": {"$sum": "$bytes"},
+            "eventos": {"$sum": 1},
+        }},
+    ]
+    deltas = {}
+    async for grupo in usage_events_collection.aggregate(pipeline, allowDiskUse=True):
+        k = grupo["_id"]
+        hora = datetime(k["y"], k["m"], k["d"], k["h"])
+        for granularidad, inicio in _inicios(hora):
+            delta = deltas.setdefault((k["u"], granularidad, inicio), [0, 0])
+            delta[0] += grupo["bytes"]
+            delta[1] += grupo["eventos"]
+    return deltas
+
+
+async def _aplicar(deltas: dict, corrida: int):
+    if not deltas:
+        return
+    operaciones = [
+        # Si el acumulado ya tiene esta corrida el filtro no coincide, el upsert
+        # choca con el índice único y el delta se ignora: no se suma dos veces.
+        UpdateOne(
+            {"userId": u, "granularidad": g, "inicio": inicio, "corrida": {"$lt": corrida}},
+            {"$inc": {"bytes": b, "eventos": e}, "$set": {"corrida": corrida}},
+            upsert=True,
+        )
+        for (u, g, inicio), (b, e) in deltas.items()
+    ]
+    try:
+        await usage_rollups_collection.bulk_write(operaciones, ordered=False)
+    except BulkWriteError as e:
+        otros = [w for w in e.details.get("writeErrors", []) if w.get("code") != 11000]
+        if otros:
+            raise
+
+
+async def _reclamar(dueno: str):
+    ahora = datetime.utcnow()
+    await rollup_marks_collection.update_one(
+        {"_id": MARCA},
+        {"$setOnInsert": {"hasta": None, "corrida": 0, "pendiente": None, "reconstruccion": None}},
+        upsert=True,
+    )
+    return await rollup_marks_collection.find_one_and_update(
+        {"_id": MARCA, "$or": [
+            {"bloqueadoHasta": {"$exists": False}},
+            {"bloqueadoHasta": {"$lt": ahora}},
+            {"dueno": dueno},
+        ]},
+        {"$set": {"bloqueadoHasta": ahora + BLOQUEO, "dueno": dueno}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _liberar(dueno: str):
+    await rollup_marks_collection.update_one(
+        {"_id": MARCA, "dueno": dueno}, {"$unset": {"bloqueadoHasta": "", "dueno": ""}}
+    )
+
+
+async def _siguiente_ventana(marca: dict, limite: datetime):
+    """La reconstrucción pendiente va primero; luego lo llegado tras la marca de agua."""
+    reconstruccion = marca.get("reconstruccion")
+    if reconstruccion:
+        return {"ts": reconstruccion["ts"], "hasta": marca["hasta"]}
+    desde = marca["hasta"]
+    inicio = desde if desde is not None else await _primera_llegada()
+    if inicio is None or inicio >= limite:
+        return None
+    return {"desde": desde, "hasta": min(limite, inicio + VENTANA_MAXIMA)}
+
+
+async def procesar_pendientes(dueno: str) -> int:
+    """Acumula todo lo que llegó entre la marca de agua y ahora menos el margen.
+
+    Regresa las ventanas procesadas; 0 si otro proceso tiene el bloqueo.
+    """
+    marca = await _reclamar(dueno)
+    if marca is None:
+        return 0
+
+    procesadas = 0
+    limite = datetime.utcnow() - timedelta(seconds=CONSUMO_ROLLUP_RETRASO)
+    # Mongo guarda milisegundos: con microsegundos la marca leída nunca alcanzaría el límite
+    limite = limite.replace(microsecond=limite.microsecond // 1000 * 1000)
+    try:
+        while True:
+            if marca.get("pendiente"):
+                # Una pasada anterior se interrumpió: se repite igual (las
+                # marcas anteriores a recibidoEn solo guardaban "hasta")
+                pendiente = marca["pendiente"]
+                corrida = pendiente["corrida"]
+                ventana = pendiente.get("ventana") or {"desde": marca["hasta"], "hasta": pendiente["hasta"]}
+            else:
+                ventana = await _siguiente_ventana(marca, limite)
+                if ventana is None:
+                    break
+                corrida = marca["corrida"] + 1
+                await rollup_marks_collection.update_one(
+                    {"_id": MARCA}, {"$set": {"pendiente": {"corrida": corrida, "ventana": ventana}}}
+                )
+
+            await _aplicar(await _agregar_crudos(ventana), corrida)
+            cambios = {"corrida": corrida, "pendiente": None, "bloqueadoHasta": datetime.utcnow() + BLOQUEO}
+            if "ts" in ventana:
+                siguiente = ventana["ts"] + VENTANA_MAXIMA
+                reconstruccion = marca["reconstruccion"]
+                cambios["reconstruccion"] = (
+                    {**reconstruccion, "ts": siguiente} if siguiente <= reconstruccion["tope"] else None
+                )
+            else:
+                cambios["hasta"] = ventana["hasta"]
+            marca = await rollup_marks_collection.find_one_and_update(
+                {"_id": MARCA}, {"$set": cambios}, return_document=ReturnDocument.AFTER,
+            )
+            procesadas += 1
+            rollup_ventanas.inc()
+    finally:
+        await _liberar(dueno)
+
+    if marca.get("hasta") is not None:
+        rollup_retraso.set((datetime.utcnow() - marca["hasta"]).total_seconds())
+    return procesadas
+
+
+async def reconstruir(dueno: str, desde: date = None) -> int:
+    """Borra los acumulados (todos, o desde el mes de ``desde``) y los recalcula.
+
+    Se recorren por ts los registros que llegaron hasta la marca de agua
+    actual; lo que llegue después lo suman las pasadas normales.
+    """
+    marca = await _reclamar(dueno)
+    if marca is None:
+        raise RollupOcupado("Otro proceso está acumulando; intenta más tarde")
+    try:
+        if desde is None:
+            await usage_rollups_collection.delete_many({})
+            primero = await usage_events_collection.find_one({}, {"ts": 1}, sort=[("ts", ASCENDING)])
+            inicio = primero["ts"] if primero else None
+        else:
+            inicio = datetime(desde.year, desde.month, 1)
+            await usage_rollups_collection.delete_many({"inicio": {"$gte": inicio}})
+        ultimo = await usage_events_collection.find_one({}, {"ts": 1}, sort=[("ts", DESCENDING)])
+        reconstruccion = None
+        if marca["hasta"] is not None and inicio is not None and ultimo is not None:
+            reconstruccion = {"ts": inicio, "tope": ultimo["ts"]}
+        # La corrida no se reinicia: debe seguir creciendo
+        await rollup_marks_collection.update_one(
+            {"_id": MARCA}, {"$set": {"pendiente": None, "reconstruccion": reconstruccion}}
+        )
+    except Exception:
+        await _liberar(dueno)
+        raise
+    # Se conserva el bloqueo: procesar_pendientes lo vuelve a tomar como dueño
+    return await procesar_pendientes(dueno)
+
+
+async def consultar(user_id, granularidad: str, desde: datetime, hasta: datetime):
+    """Acumulados del usuario con ``desde <= inicio < hasta`` y la marca de agua."""
+    puntos = await usage_rollups_collection.find(
+        {"userId": user_id, "granularidad": granularidad, "inicio": {"$gte": desde, "$lt": hasta}},
+        {"_id": 0, "inicio": 1, "bytes": 1, "eventos": 1},
+    ).sort("inicio", ASCENDING).to_list(None)
+    marca = await rollup_marks_collection.find_one({"_id": MARCA}, {"hasta": 1})
+    return puntos, (marca or {}).get("hasta")
+
+
+class MotorRollups:
+    def __init__(self, intervalo: float = CONSUMO_ROLLUP_INTERVALO):
+        self.intervalo = intervalo
+        self.dueno = f"{socket.gethostname()}:{os.getpid()}"
+        self._tarea = None
+
+    def iniciar(self):
+        if self.intervalo > 0:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await procesar_pendientes(self.dueno)
+            except Exception:
+                logging.exception("❌ Error al acumular el consumo")
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Acumulados de consumo de Copper Mobil")
+    parser.add_argument("--backfill", action="store_true", help="Reconstruye desde los registros crudos")
+    parser.add_argument("--desde", type=date.fromisoformat, help="Con --backfill: solo desde el mes de esta fecha")
+    args = parser.parse_args()
+
+    from indices import asegurar_indices
+    await asegurar_indices()
+
+    dueno = f"cli:{socket.gethostname()}:{os.getpid()}"
+    try:
+        if args.backfill:
+            ventanas = await reconstruir(dueno, args.desde)
+        else:
+            ventanas = await procesar_pendientes(dueno)
+    except RollupOcupado as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {ventanas} ventanas acumuladas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
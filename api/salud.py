@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+import orjson
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from metricas import Gauge
+
+# 🩺 Estado de salud en caché
+# Una tarea por worker revisa cada SALUD_INTERVALO segundos las dependencias
+# (Mongo, Pusher, MercadoPago) en paralelo y deja listos los cuerpos de
+# /api/ping y /api/ready ya serializados: los latidos de la app nunca tocan
+# la base. Solo las dependencias críticas (SALUD_CRITICAS) deciden si la API
+# está en línea; el estado cambia a offline tras SALUD_FALLOS revisiones
+# fallidas seguidas y vuelve a online con la primera exitosa.
+# La primera revisión de cada worker es solo la línea base: arrancar o
+# reciclar un worker no avisa nada. Los cambios se comparan contra el último
+# estado guardado en Mongo (RegistroEstado) y solo el worker que lo cambia
+# llama a ``al_cambiar``; así cada transición se avisa una vez aunque haya
+# N workers. Si Mongo no responde, cada worker avisa su propia transición.
+
+SALUD_INTERVALO = float(os.getenv("SALUD_INTERVALO", "5"))
+SALUD_TIMEOUT = float(os.getenv("SALUD_TIMEOUT", "2"))
+SALUD_FALLOS = int(os.getenv("SALUD_FALLOS", "2"))
+SALUD_CRITICAS = tuple(c.strip() for c in os.getenv("SALUD_CRITICAS", "mongo").split(",") if c.strip())
+
+salud_dependencia = Gauge("salud_dependencia", "1 si la dependencia respondió en la última revisión",
+                          etiquetas=("dependencia",))
+salud_latencia = Gauge("salud_latencia_segundos", "Latencia de la última revisión", etiquetas=("dependencia",))
+salud_en_linea = Gauge("salud_en_linea", "1 si la API se considera en línea")
+
+ONLINE = "online"
+OFFLINE = "offline"
+INICIANDO = "iniciando"
+
+
+def _cuerpo(datos: dict) -> bytes:
+    return orjson.dumps(datos)
+
+
+class RegistroEstado:
+    """Último estado de la API compartido por todos los workers (un documento)."""
+
+    def __init__(self, coleccion, clave: str = "api"):
+        self.coleccion = coleccion
+        self.clave = clave
+
+    async def reclamar(self, estado: str, primera: bool = False) -> bool:
+        """Guarda ``estado``; True si este worker lo cambió y le toca avisar.
+
+        Con ``primera`` (línea base de un worker) solo se avisa si el estado
+        guardado era otro, p. ej. la API se cayó y volvió mientras se reiniciaba.
+        """
+        try:
+            anterior = await self.coleccion.find_one_and_update(
+                {"_id": self.clave, "estado": {"$ne": estado}},
+                {"$set": {"estado": estado, "cambiadoEn": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            return False  # ya estaba guardado ese estado: otro worker avisó
+        # Sin documento previo no hay a quién avisar de la línea base
+        return anterior is not None or not primera
+
+
+class MonitorSalud:
+    def __init__(self, verificaciones: dict, al_cambiar=None, intervalo: float = SALUD_INTERVALO,
+                 timeout: float = SALUD_TIMEOUT, fallos: int = SALUD_FALLOS, criticas=SALUD_CRITICAS,
+                 registro: RegistroEstado = None):
+        """``verificaciones``: nombre → función async que lanza una excepción si falla."""
+        self.verificaciones = verificaciones
+        self.al_cambiar = al_cambiar
+        self.registro = registro
+        self.intervalo = intervalo
+        self.timeout = timeout
+        self.fallos = fallos
+        self.criticas = criticas
+        self.estado = None  # None hasta la primera revisión
+        self._fallos_seguidos = 0
+        self._pronto = asyncio.Event()
+        self._tarea = None
+        self._avisado_sin_registro = False
+        # Hasta la primera revisión el worker responde (ping 200) pero aún no está listo
+        self.ping = self.ready = _cuerpo({"status": INICIANDO, "timestamp": datetime.utcnow().isoformat()})
+        self.ready_ok = False
+
+    def iniciar(self):
+        self._tarea = asyncio.create_task(self._bucle())
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    def revisar_pronto(self):
+        """Adelanta la siguiente revisión (p. ej. tras un error en una ruta)."""
+        self._pronto.set()
+
+    async def _bucle(self):
+        while True:
+            try:
+                await self.revisar()
+            except Exception:
+                logging.exception("❌ Error al revisar la salud de la API")
+            try:
+                await asyncio.wait_for(self._pronto.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._pronto.clear()
+
+    async def _verificar(self, nombre, funcion):
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(funcion(), self.timeout)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"Sin respuesta en {self.timeout:g}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        latencia = time.perf_counter() - inicio
+        salud_dependencia.labels(nombre).set(0 if error else 1)
+        salud_latencia.labels(nombre).set(latencia)
+        return nombre, {"ok": error is None, "latencia_ms": round(latencia * 1000, 1), "error": error}
+
+    async def revisar(self):
+        resultados = dict(await asyncio.gather(
+            *(self._verificar(n, f) for n, f in self.verificaciones.items())
+        ))
+        ahora = datetime.utcnow().isoformat()
+
+        caidas = [n for n in self.criticas if n in resultados and not resultados[n]["ok"]]
+        self._fallos_seguidos = self._fallos_seguidos + 1 if caidas else 0
+        if not caidas:
+            nuevo = ONLINE
+        elif self._fallos_seguidos >= self.fallos or self.estado is None:
+            nuevo = OFFLINE
+        else:
+            nuevo = self.estado  # un fallo aislado no cambia el estado
+        error = "; ".join(f"{n}: {resultados[n]['error']}" for n in caidas)
+
+        status = "ok" if nuevo == ONLINE else "fail"
+        self.ping = _cuerpo({"status": status, "timestamp": ahora})
+        self.ready = _cuerpo({"status": status, "timestamp": ahora, "dependencias": resultados})
+        self.ready_ok = not caidas
+        salud_en_linea.set(1 if nuevo == ONLINE else 0)
+
+        if nuevo != self.estado:
+            anterior, self.estado = self.estado, nuevo
+            logging.info("🩺 Estado de la API: %s → %s %s", anterior, nuevo, error)
+            if await self._toca_avisar(nuevo, primera=anterior is None) and self.al_cambiar is not None:
+                self.al_cambiar(nuevo, error)
+        return resultados
+
+    async def _toca_avisar(self, estado: str, primera: bool) -> bool:
+        if self.registro is None:
+            return not primera
+        try:
+            avisar = await asyncio.wait_for(self.registro.reclamar(estado, primera), self.timeout)
+        except Exception as e:
+            # Sin estado compartido (p. ej. Mongo caído) este worker avisa por su cuenta
+            # y lo recuerda, porque el registro no sabrá de este aviso
+            logging.warning("⚠️ No se pudo registrar el estado de la API: %s", e)
+            self._avisado_sin_registro = not primera
+            return not primera
+        if self._avisado_sin_registro:
+            avisar, self._avisado_sin_registro = True, False
+        return avisar
@@ -0,0 +1,115 @@
+"""Arranque de producción: N workers de uvicorn supervisados.
+
+El proceso padre abre el socket y lanza SERVIDOR_WORKERS procesos (por
+defecto uno por núcleo disponible, respetando el límite de CPU del
+contenedor). Cada worker corre su propio event loop con uvloop y httptools
+si están instalados. Un worker que termina (por llegar a
+SERVIDOR_MAX_PETICIONES o por un fallo) se reemplaza con uno nuevo; el
+límite lleva un margen aleatorio para que no se reinicien todos a la vez.
+
+Uso:
+    python servidor.py                    # configuración desde el entorno
+    python servidor.py --workers 4 --puerto 8000
+"""
+import argparse
+import functools
+import logging
+import math
+import os
+import random
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+
+def nucleos_disponibles() -> int:
+    """Núcleos que este proceso puede usar (afinidad y cuota de cgroup v2)."""
+    try:
+        nucleos = len(os.sched_getaffinity(0))
+    except AttributeError:
+        nucleos = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            cuota, periodo = f.read().split()
+        if cuota != "max":
+            nucleos = min(nucleos, math.ceil(int(cuota) / int(periodo)))
+    except (OSError, ValueError):
+        pass
+    return max(1, nucleos)
+
+
+SERVIDOR_HOST = os.getenv("SERVIDOR_HOST", "0.0.0.0")
+SERVIDOR_PUERTO = int(os.getenv("PORT", os.getenv("SERVIDOR_PUERTO", "10000")))
+SERVIDOR_WORKERS = int(os.getenv("SERVIDOR_WORKERS", "0"))  # 0 = uno por núcleo
+SERVIDOR_KEEPALIVE = int(os.getenv("SERVIDOR_KEEPALIVE", "75"))
+SERVIDOR_BACKLOG = int(os.getenv("SERVIDOR_BACKLOG", "2048"))
+SERVIDOR_GRACIA = int(os.getenv("SERVIDOR_GRACIA", "30"))
+SERVIDOR_MAX_PETICIONES = int(os.getenv("SERVIDOR_MAX_PETICIONES", "0"))  # 0 = sin reinicio
+SERVIDOR_MAX_PETICIONES_MARGEN = int(os.getenv("SERVIDOR_MAX_PETICIONES_MARGEN", "0"))
+SERVIDOR_ACCESS_LOG = os.getenv("SERVIDOR_ACCESS_LOG", "1") == "1"
+
+
+def _disponible(modulo: str) -> bool:
+    try:
+        __import__(modulo)
+        return True
+    except ImportError:
+        return False
+
+
+def _servir(config: uvicorn.Config, margen: int, sockets=None):
+    """Cuerpo de cada worker: aplica su propio margen y sirve en el socket del padre."""
+    if config.limit_max_requests and margen:
+        config.limit_max_requests += random.randint(0, margen)
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def crear_configuracion(args) -> uvicorn.Config:
+    return uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.puerto,
+        workers=args.workers,
+        loop="uvloop" if _disponible("uvloop") else "asyncio",
+        http="httptools" if _disponible("httptools") else "h11",
+        timeout_keep_alive=args.keepalive,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=args.gracia,
+        limit_max_requests=args.max_peticiones or None,
+        access_log=args.access_log,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de producción de Copper Mobil")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--puerto", type=int, default=SERVIDOR_PUERTO)
+    parser.add_argument("--workers", type=int, default=SERVIDOR_WORKERS, help="0 = uno por núcleo")
+    parser.add_argument("--keepalive", type=int, default=SERVIDOR_KEEPALIVE, help="Segundos de keep-alive")
+    parser.add_argument("--backlog", type=int, default=SERVIDOR_BACKLOG)
+    parser.add_argument("--gracia", type=int, default=SERVIDOR_GRACIA,
+                        help="Segundos para terminar peticiones en curso al apagar")
+    parser.add_argument("--max-peticiones", type=int, default=SERVIDOR_MAX_PETICIONES,
+                        help="Reinicia cada worker tras N peticiones (0 = nunca)")
+    parser.add_argument("--max-peticiones-margen", type=int, default=SERVIDOR_MAX_PETICIONES_MARGEN,
+                        help="Margen aleatorio sumado al límite de cada worker")
+    parser.add_argument("--sin-access-log", dest="access_log", action="store_false", default=SERVIDOR_ACCESS_LOG)
+    args = parser.parse_args(argv)
+    args.workers = args.workers or nucleos_disponibles()
+
+    config = crear_configuracion(args)
+    logging.getLogger("uvicorn.error").info(
+        "🚀 %d workers, loop=%s, http=%s, keep-alive=%ss, max peticiones=%s",
+        args.workers, config.loop, config.http, args.keepalive, args.max_peticiones or "∞",
+    )
+
+    if args.workers == 1 and not args.max_peticiones:
+        uvicorn.Server(config).run()
+        return
+    # Con un solo worker también se supervisa: así el reinicio por límite no apaga el servicio
+    objetivo = functools.partial(_servir, config, args.max_peticiones_margen)
+    Multiprocess(config, target=objetivo, sockets=[config.bind_socket()]).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from pymongo import ReturnDocument
+
+from metricas import Counter, Gauge, llamadas_salida
+
+# 📤 Envío de SMS con bandeja de salida (outbox) en MongoDB
+# enviar_otp solo inserta el mensaje en la outbox y responde; unos workers en
+# segundo plano lo envían a Vonage con un cliente HTTP keep-alive compartido,
+# reintentando con backoff exponencial y jitter. Si Mongo falla a medio ciclo
+# el worker espera y sigue; el mensaje que tenía reclamado vuelve a estar
+# disponible cuando vence su bloqueo.
+
+VONAGE_SMS_URL = os.getenv("VONAGE_SMS_URL", "https://rest.nexmo.com/sms/json")
+SMS_REMITENTE = "CopperMobil"
+SMS_WORKERS = int(os.getenv("SMS_WORKERS", "4"))
+SMS_MAX_OUTBOX = int(os.getenv("SMS_MAX_OUTBOX", "1000"))
+SMS_MAX_INTENTOS = int(os.getenv("SMS_MAX_INTENTOS", "5"))
+SMS_TIMEOUT = float(os.getenv("SMS_TIMEOUT", "10"))
+SMS_ESPERA_MAXIMA = float(os.getenv("SMS_ESPERA_MAXIMA", "30"))
+
+# Estados de Vonage que vale la pena reintentar (1 = throttled, 5 = error interno)
+ESTADOS_REINTENTABLES = {"1", "5"}
+
+sms_resultados = Counter("sms_total", "Mensajes procesados por resultado", etiquetas=("resultado",))
+sms_pendientes = Gauge("sms_outbox_pendientes", "Mensajes pendientes en la outbox (último conteo, hasta SMS_MAX_OUTBOX)")
+sms_latencia = llamadas_salida.labels("vonage", "sms")
+
+_enviados = sms_resultados.labels("enviado")
+_reintentos = sms_resultados.labels("reintento")
+_fallidos = sms_resultados.labels("fallido")
+_errores_outbox = sms_resultados.labels("error_outbox")
+
+# Mensajes que todavía cuentan contra SMS_MAX_OUTBOX (los fallidos no)
+_PENDIENTES = {"status": {"$in": ["pendiente", "enviando"]}}
+
+
+class OutboxLlena(Exception):
+    """La outbox alcanzó SMS_MAX_OUTBOX mensajes pendientes."""
+
+
+class ErrorReintentable(Exception):
+    pass
+
+
+class DespachadorSMS:
+    def __init__(self, outbox, url: str = VONAGE_SMS_URL, workers: int = SMS_WORKERS,
+                 max_outbox: int = SMS_MAX_OUTBOX, max_intentos: int = SMS_MAX_INTENTOS,
+                 timeout: float = SMS_TIMEOUT, bloqueo: float = 60.0,
+                 espera_maxima: float = SMS_ESPERA_MAXIMA):
+        self.outbox = outbox
+        self.url = url
+        self.workers = workers
+        self.max_outbox = max_outbox
+        self.max_intentos = max_intentos
+        self.timeout = timeout
+        self.bloqueo = bloqueo
+        self.espera_maxima = espera_maxima
+        self._silencio_hasta = 0.0
+        self._client = None
+        self._tareas = []
+        self._despertar = asyncio.Event()
+
+    async def iniciar(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+        )
+        self._tareas = [asyncio.create_task(self._trabajador()) for _ in range(self.workers)]
+
+    async def cerrar(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def contar_pendientes(self, limite: int = 0) -> int:
+        """Mensajes por enviar en la outbox (de todos los workers); ``limite`` acota el conteo."""
+        opciones = {"limit": limite} if limite else {}
+        n = await self.outbox.count_documents(_PENDIENTES, **opciones)
+        sms_pendientes.set(n)
+        return n
+
+    async def encolar(self, destino: str, mensaje: str):
+        """Guarda el mensaje en la outbox; regresa cuando ya es durable."""
+        if await self.contar_pendientes(self.max_outbox) >= self.max_outbox:
+            raise OutboxLlena()
+        ahora = datetime.utcnow()
+        resultado = await self.outbox.insert_one({
+            "to": destino,
+            "text": mensaje,
+            "status": "pendiente",
+            "intentos": 0,
+            "proximoIntento": ahora,
+            "createdAt": ahora,
+        })
+        self._despertar.set()
+        return resultado.inserted_id
+
+    async def _reclamar(self):
+        # Toma un mensaje listo, o uno que otro worker dejó "enviando" y
+        # cuyo bloqueo ya venció (p. ej. el proceso murió a medio envío).
+        ahora = datetime.utcnow()
+        return await self.outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pendiente", "proximoIntento": {"$lte": ahora}},
+                {"status": "enviando", "bloqueadoHasta": {"$lt": ahora}},
+            ]},
+            {"$set": {"status": "enviando", "bloqueadoHasta": ahora + timedelta(seconds=self.bloqueo)}},
+            sort=[("proximoIntento", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _trabajador(self):
+        fallos = 0
+        while True:
+            try:
+                doc = await self._reclamar()
+                if doc is not None:
+                    await self._procesar(doc)
+                fallos = 0
+            except Exception:
+                # El mensaje reclamado (si lo hay) queda "enviando" hasta que
+                # vence su bloqueo y otro worker lo vuelve a tomar
+                fallos += 1
+                _errores_outbox.inc()
+                espera = min(self.espera_maxima, 2 ** fallos) * random.uniform(0.5, 1.5)
+                self._registrar_fallo(espera)
+                await asyncio.sleep(espera)
+                continue
+
+            if doc is None:
+                self._despertar.clear()
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _registrar_fallo(self, espera: float):
+        # Una sola traza por ventana de espera entre todos los workers de este proceso
+        ahora = time.monotonic()
+        if ahora < self._silencio_hasta:
+            return
+        self._silencio_hasta = ahora + espera
+        logging.exception("❌ Error en la outbox de SMS; reintentando en %.1fs", espera)
+
+    async def _procesar(self, doc):
+        intentos = doc.get("intentos", 0) + 1
+        try:
+            await self._enviar(doc["to"], doc["text"])
+        except ErrorReintentable as e:
+            if intentos < self.max_intentos:
+                _reintentos.inc()
+                espera = min(60.0, 2 ** intentos) * random.uniform(0.5, 1.5)
+                await self.outbox.update_one({"_id": doc["_id"]}, {"$set": {
+                    "status": "pendiente",
+                    "intentos": intentos,
+                    "ultimoError": str(e),
+                    "proximoIntento": datetime.utcnow() + timedelta(seconds=espera),
+                }})
+                return
+            await self._terminar(doc, intentos, "fallido", str(e))
+        except Exception as e:
+            await self._terminar(doc, intentos, "fallido", str(e))
+        else:
+            await self._terminar(doc, intentos, "enviado")
+
+    async def _terminar(self, doc, intentos, status, error=None):
+        # Los enviados se borran; los fallidos se quedan para revisión
+        if error:
+            _fallidos.inc()
+            print(f"❌ SMS a {doc['to']} descartado tras {intentos} intentos: {error}")
+            await self.outbox.update_one({"_id": doc["_id"]}, {
+                "$set": {"status": status, "intentos": intentos, "ultimoError": error,
+                         "finalizadoEn": datetime.utcnow()},
+                "$unset": {"bloqueadoHasta": ""},
+            })
+        else:
+            _enviados.inc()
+            await self.outbox.delete_one({"_id": doc["_id"]})
+
+    async def _enviar(self, destino: str, mensaje: str):
+        inicio = time.perf_counter()
+        try:
+            r = await self._client.post(self.url, data={
+                "api_key": os.getenv("VONAGE_API_KEY"),
+                "api_secret": os.getenv("VONAGE_API_SECRET"),
+                "to": destino,
+                "from": SMS_REMITENTE,
+                "text": mensaje,
+            })
+        except httpx.TransportError as e:
+            raise ErrorReintentable(f"Error de red: {e}")
+        finally:
+            sms_latencia.observe(time.perf_counter() - inicio)
+
+        if r.status_code == 429 or r.status_code >= 500:
+            raise ErrorReintentable(f"HTTP {r.status_code}")
+        if r.status_code != 200:
+            raise RuntimeError(f"HTTP {r.status_code}: {r.text}")
+
+        for m in r.json().get("messages", []):
+            estado = str(m.get("status"))
+            if estado in ESTADOS_REINTENTABLES:
+                raise ErrorReintentable(m.get("error-text", f"status {estado}"))
+            if estado != "0":
+                raise RuntimeError(m.get("error-text", f"status {estado}"))
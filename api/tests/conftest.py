@@ -0,0 +1,80 @@
+"""Fixtures compartidas por las pruebas de la API.
+
+Las pruebas corren contra ``crear_base_de_datos_falsa`` (mongomock-motor) y
+los proveedores locales de ``bench/fakes.py``; no salen a internet ni
+necesitan un Mongo real.
+
+Uso (desde api/):
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+"""
+import os
+import sys
+from urllib.parse import urlparse
+
+import pytest
+
+API = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [API, os.path.join(API, "bench")]
+
+try:
+    import mongomock_motor  # noqa: F401
+except ImportError as e:
+    # Sin esto las pruebas no pueden correr: mejor fallar que saltarlas todas
+    raise ImportError("Faltan las dependencias de prueba: pip install -r requirements-dev.txt") from e
+
+
+def _sin_sort(metodo):
+    def envoltura(*args, sort=None, **kwargs):
+        return metodo(*args, **kwargs)
+    return envoltura
+
+
+# pymongo >= 4.11 manda ``sort`` en UpdateOne/ReplaceOne de bulk_write y
+# mongomock todavía no lo acepta; la API nunca lo usa
+from mongomock.collection import BulkOperationBuilder  # noqa: E402
+
+BulkOperationBuilder.add_update = _sin_sort(BulkOperationBuilder.add_update)
+BulkOperationBuilder.add_replace = _sin_sort(BulkOperationBuilder.add_replace)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """Base de datos en memoria instalada como la del proceso."""
+    from database import crear_base_de_datos_falsa, usar_base_de_datos
+
+    falsa = crear_base_de_datos_falsa()
+    usar_base_de_datos(falsa)
+    yield falsa
+    usar_base_de_datos(None)
+
+
+@pytest.fixture
+async def cliente(db):
+    """Cliente HTTP contra la app en proceso (sin correr el ciclo de vida)."""
+    import httpx
+    import main
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://pruebas") as c:
+        yield c
+
+
+@pytest.fixture
+async def pusher(monkeypatch):
+    """Fake de Pusher levantado y las variables PUSHER_* apuntando a él."""
+    from fakes import crear_fake_pusher, servidor_local
+
+    fake = crear_fake_pusher()
+    async with servidor_local(fake) as url:
+        direccion = urlparse(url)
+        for nombre, valor in {"PUSHER_APP_ID": "1", "PUSHER_KEY": "pruebas", "PUSHER_SECRET": "pruebas",
+                              "PUSHER_HOST": direccion.hostname, "PUSHER_PORT": str(direccion.port),
+                              "PUSHER_SSL": "0"}.items():
+            monkeypatch.setenv(nombre, valor)
+        yield fake
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from cache import CacheTTL, VersionCompartida
+
+pytestmark = pytest.mark.anyio
+
+
+def worker(db):
+    """Caché de catálogo de un worker con su vigilante de versión."""
+    cache = CacheTTL(ttl=60, max_entradas=1)
+    return cache, VersionCompartida(db["cache_versions"], "planes", cache.invalidar, intervalo=0.05)
+
+
+async def test_subir_invalida_a_los_demas_workers(db):
+    (cache_a, version_a), (cache_b, version_b) = worker(db), worker(db)
+    for version in (version_a, version_b):
+        await version.revisar()
+    cache_a.set("catalogo", "viejo")
+    cache_b.set("catalogo", "viejo")
+
+    await version_a.subir()
+    assert cache_a.get("catalogo") is None
+    # B se entera en su siguiente revisión, sin recibir nada de A
+    assert cache_b.get("catalogo") == "viejo"
+    assert await version_b.revisar()
+    assert cache_b.get("catalogo") is None
+    assert not await version_b.revisar()
+
+
+async def test_revision_periodica(db):
+    (cache_a, version_a), (cache_b, version_b) = worker(db), worker(db)
+    version_b.iniciar()
+    try:
+        await asyncio.sleep(0.1)
+        cache_b.set("catalogo", "viejo")
+        await version_a.subir()
+        await asyncio.sleep(0.2)
+        assert cache_b.get("catalogo") is None
+    finally:
+        await version_b.cerrar()
+
+
+async def test_primera_revision_siempre_invalida(db):
+    cache, version = worker(db)
+    cache.set("catalogo", "cargado antes de conocer la versión")
+
+    assert await version.revisar()
+    assert cache.get("catalogo") is None
+
+
+async def test_invalidar_una_clave_no_descarta_las_cargas_de_otras():
+    cache = CacheTTL(ttl=60)
+    listo = asyncio.Event()
+
+    async def cargar(valor):
+        await listo.wait()
+        return valor
+
+    a = asyncio.ensure_future(cache.obtener_o_cargar("a", lambda: cargar("a-viejo")))
+    b = asyncio.ensure_future(cache.obtener_o_cargar("b", lambda: cargar("b")))
+    await asyncio.sleep(0)
+    cache.invalidar("a")
+    # Quien llega después de invalidar no se une a la carga vieja
+    a2 = asyncio.ensure_future(cache.obtener_o_cargar("a", lambda: cargar("a-nuevo")))
+    await asyncio.sleep(0)
+    listo.set()
+
+    assert await asyncio.gather(a, b, a2) == ["a-viejo", "b", "a-nuevo"]
+    assert (cache.get("a"), cache.get("b")) == ("a-nuevo", "b")
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from eventos import PublicadorPusher, crear_cliente_pusher
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_fusiona_eventos_de_la_misma_ventana(pusher):
+    publicador = PublicadorPusher(crear_cliente_pusher(), ventana=0.05)
+    await publicador.iniciar()
+    try:
+        for n in range(5):
+            publicador.publicar("planes", "actualizado", {"n": n})
+        publicador.publicar("estado-api", "online", {})
+        await asyncio.sleep(0.3)
+    finally:
+        await publicador.cerrar()
+
+    assert pusher.state.peticiones == 1
+    eventos = {(e["channel"], e["name"]): e["data"] for e in pusher.state.eventos}
+    assert eventos == {("planes", "actualizado"): '{"n": 4}', ("estado-api", "online"): "{}"}
+
+
+async def test_cerrar_publica_lo_pendiente_en_lotes_de_diez(pusher):
+    publicador = PublicadorPusher(crear_cliente_pusher(), ventana=60)
+    await publicador.iniciar()
+    for n in range(25):
+        publicador.publicar(f"canal-{n}", "evento", {"n": n})
+    assert pusher.state.peticiones == 0
+    await publicador.cerrar()
+
+    # El fake rechaza lotes de más de 10 eventos
+    assert pusher.state.peticiones == 3
+    assert sorted(e["channel"] for e in pusher.state.eventos) == sorted(f"canal-{n}" for n in range(25))
+
+
+async def test_descarta_eventos_cuando_el_buffer_esta_lleno(pusher):
+    publicador = PublicadorPusher(crear_cliente_pusher(), ventana=60, max_pendientes=2)
+    await publicador.iniciar()
+    publicador.publicar("a", "evento", {})
+    publicador.publicar("b", "evento", {})
+    publicador.publicar("c", "evento", {})
+    # Uno ya pendiente se sigue actualizando aunque el buffer esté lleno
+    publicador.publicar("a", "evento", {"ultimo": True})
+    await publicador.cerrar()
+
+    assert {e["channel"]: e["data"] for e in pusher.state.eventos} == {"a": '{"ultimo": true}', "b": "{}"}
@@ -0,0 +1,128 @@
+import pytest
+
+import limites
+from limites import LimiteExcedido, Limitador, LimitadorMongo, Regla
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Hora controlada para Limitador.revisar_local (que usa time.time())."""
+    class Reloj:
+        ahora = 1_020_000.0  # Inicio exacto de una ventana de 100 y de 600 segundos
+
+    monkeypatch.setattr(limites.time, "time", lambda: Reloj.ahora)
+    return Reloj
+
+
+def test_conteo_pondera_la_ventana_anterior():
+    regla = Regla("pruebas", limite=10, ventana=100)
+
+    # A un cuarto de la ventana actual aún cuentan 3/4 de la anterior
+    assert regla.conteo(actual=2, anterior=10, ahora=125) == pytest.approx(9.5)
+    assert regla.conteo(actual=2, anterior=10, ahora=100) == pytest.approx(12)
+    assert regla.conteo(actual=2, anterior=10, ahora=199.999) == pytest.approx(2, abs=0.01)
+
+
+@pytest.mark.parametrize("anterior", [1, 4, 10, 25])
+@pytest.mark.parametrize("actual", [0, 3, 9])
+def test_espera_es_justa(actual, anterior):
+    regla = Regla("pruebas", limite=10, ventana=100)
+    for transcurrido in range(0, 100, 7):
+        ahora = 1000 + transcurrido
+        if regla.conteo(actual, anterior, ahora) + 1 <= regla.limite:
+            continue
+        espera = regla.espera(actual, anterior, ahora)
+        if transcurrido + espera < regla.ventana:
+            # Tras esperar, el intento pasa; un segundo antes todavía no
+            assert regla.conteo(actual, anterior, ahora + espera) + 1 <= regla.limite
+            assert espera == 1 or regla.conteo(actual, anterior, ahora + espera - 1) + 1 > regla.limite
+        else:
+            assert espera == max(1, regla.ventana - transcurrido)
+
+
+def test_espera_con_la_ventana_actual_llena():
+    regla = Regla("pruebas", limite=3, ventana=600)
+
+    assert regla.espera(actual=3, anterior=0, ahora=600 + 100) == 500
+    assert regla.espera(actual=3, anterior=5, ahora=600 + 599.5) == 1
+
+
+def test_ventana_deslizante(reloj):
+    regla = Regla("pruebas", limite=3, ventana=600)
+    limitador = Limitador(backend="memoria")
+
+    for _ in range(3):
+        limitador.revisar_local([(regla, "+525500000000")])
+    with pytest.raises(LimiteExcedido) as e:
+        limitador.revisar_local([(regla, "+525500000000")])
+    assert e.value.retry_after == 600
+
+    # Al empezar la siguiente ventana los 3 intentos aún pesan completos
+    reloj.ahora += 600
+    with pytest.raises(LimiteExcedido):
+        limitador.revisar_local([(regla, "+525500000000")])
+    # A la mitad pesan 1.5: cabe uno más
+    reloj.ahora += 300
+    limitador.revisar_local([(regla, "+525500000000")])
+    with pytest.raises(LimiteExcedido):
+        limitador.revisar_local([(regla, "+525500000000")])
+    # Dos ventanas después ya no queda nada de la primera
+    reloj.ahora += 900
+    for _ in range(3):
+        limitador.revisar_local([(regla, "+525500000000")])
+
+
+def test_solo_cuenta_si_todas_las_reglas_lo_permiten(reloj):
+    por_telefono = Regla("telefono", limite=3, ventana=600)
+    por_ip = Regla("ip", limite=2, ventana=600)
+    limitador = Limitador(backend="memoria")
+
+    limitador.revisar_local([(por_telefono, "+525511111111"), (por_ip, "10.0.0.1")])
+    limitador.revisar_local([(por_telefono, "+525522222222"), (por_ip, "10.0.0.1")])
+    with pytest.raises(LimiteExcedido) as e:
+        limitador.revisar_local([(por_telefono, "+525533333333"), (por_ip, "10.0.0.1")])
+    assert e.value.regla == "ip"
+    # El intento rechazado por IP no gastó el cupo del teléfono
+    assert por_telefono._claves["+525533333333"][1] == 0
+
+    # Ni uno rechazado por teléfono el de otra IP
+    for _ in range(3):
+        limitador.revisar_local([(por_telefono, "+525544444444"), (por_ip, f"10.0.1.{_}")])
+    with pytest.raises(LimiteExcedido):
+        limitador.revisar_local([(por_telefono, "+525544444444"), (por_ip, "10.0.2.1")])
+    assert por_ip._claves.get("10.0.2.1", [0, 0, 0])[1] == 0
+
+    # Las claves vacías (p. ej. sin IP) no se cuentan
+    limitador.revisar_local([(por_ip, "")])
+    assert "" not in por_ip._claves
+
+
+def test_claves_acotadas_con_lru():
+    regla = Regla("lru", limite=100, ventana=600, max_claves=50_000)
+    limitador = Limitador(backend="memoria")
+
+    limitador.revisar_local([(regla, "frecuente")])
+    for n in range(80_000):
+        limitador.revisar_local([(regla, f"+52{n:010d}")])
+        if n % 10_000 == 0:
+            # Una clave usada seguido no se expulsa
+            limitador.revisar_local([(regla, "frecuente")])
+
+    assert len(regla._claves) == 50_000
+    assert limites.limites_claves.labels("lru").valor == 50_000
+    assert "+520000000000" not in regla._claves
+    assert "+520000079999" in regla._claves
+    assert regla._claves["frecuente"][1] == 9
+
+
+@pytest.mark.anyio
+async def test_conteo_compartido_entre_workers(db, reloj):
+    regla = Regla("compartida", limite=3, ventana=600)
+    # Cada worker tiene sus propias reglas en memoria; rate_limits es común
+    workers = [LimitadorMongo(db["rate_limits"]) for _ in range(2)]
+
+    await workers[0].revisar([(regla, "+525500000000")], reloj.ahora)
+    await workers[1].revisar([(regla, "+525500000000")], reloj.ahora)
+    await workers[0].revisar([(regla, "+525500000000")], reloj.ahora)
+    with pytest.raises(LimiteExcedido):
+        await workers[1].revisar([(regla, "+525500000000")], reloj.ahora)
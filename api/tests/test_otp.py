@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from otp import (
+    EXPIRADO, INCORRECTO, NO_ENCONTRADO, VALIDO,
+    consumir_verificacion, emitir_codigo, restaurar_verificacion, verificar_codigo,
+)
+
+pytestmark = pytest.mark.anyio
+
+PHONE = "+525512345678"
+
+
+async def test_validaciones_simultaneas_solo_una_gana(cliente, db):
+    await emitir_codigo(PHONE, "123456")
+
+    respuestas = await asyncio.gather(*(
+        cliente.post("/api/auth/validate-otp", json={"phone": PHONE, "code": "123456"})
+        for _ in range(50)
+    ))
+
+    estados = sorted(r.status_code for r in respuestas)
+    # Las demás ya no encuentran código pendiente
+    assert estados == [200] + [404] * 49
+    assert await db["otp"].count_documents({"phone": PHONE}) == 1
+
+
+async def test_emisiones_simultaneas_dejan_un_solo_documento(db):
+    await asyncio.gather(*(emitir_codigo(PHONE, f"{n:06d}") for n in range(20)))
+
+    assert await db["otp"].count_documents({"phone": PHONE}) == 1
+
+
+async def test_verificacion_se_consume_una_sola_vez(db):
+    await emitir_codigo(PHONE, "123456")
+    assert await verificar_codigo(PHONE, "123456") == VALIDO
+
+    consumos = await asyncio.gather(*(consumir_verificacion(PHONE) for _ in range(20)))
+    assert consumos.count(True) == 1
+
+    # Si el registro falla después de consumirla, se puede devolver
+    await restaurar_verificacion(PHONE)
+    assert await consumir_verificacion(PHONE)
+
+
+async def test_motivos_de_rechazo(db):
+    assert await verificar_codigo(PHONE, "123456") == NO_ENCONTRADO
+
+    await emitir_codigo(PHONE, "123456")
+    assert await verificar_codigo(PHONE, "654321") == INCORRECTO
+
+    # El índice TTL puede tardar en borrar un código vencido
+    await db["otp"].update_one({"phone": PHONE}, {"$set": {"expiresAt": datetime.utcnow() - timedelta(seconds=1)}})
+    assert await verificar_codigo(PHONE, "123456") == EXPIRADO
+
+    # Un código nuevo reemplaza al anterior
+    await emitir_codigo(PHONE, "111111")
+    assert await verificar_codigo(PHONE, "123456") == INCORRECTO
+    assert await verificar_codigo(PHONE, "111111") == VALIDO
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import hmac
+
+import pytest
+
+import pagos
+from cache import VueloUnico
+from fakes import crear_fake_mercadopago, servidor_local
+from pagos import PasarelaMercadoPago, RegistroPagos, firma_webhook_valida
+
+pytestmark = pytest.mark.anyio
+
+SECRETO = "secreto-de-pruebas"
+
+
+def firmar(payment_id, request_id="req-1", ts="1700000000"):
+    manifiesto = f"id:{payment_id};request-id:{request_id};ts:{ts};"
+    v1 = hmac.new(SECRETO.encode(), manifiesto.encode(), hashlib.sha256).hexdigest()
+    return {"x-signature": f"ts={ts},v1={v1}", "x-request-id": request_id}
+
+
+@pytest.fixture
+async def mercadopago(db, monkeypatch):
+    """Fake de MercadoPago detrás de la pasarela y un registro de pagos limpio."""
+    import main
+
+    fake = crear_fake_mercadopago(latencia=0.05, status_pago="pending")
+    async with servidor_local(fake) as url:
+        pasarela = PasarelaMercadoPago("sandbox", "pruebas", base_url=url)
+        for modulo in (pagos, main):
+            monkeypatch.setattr(modulo, "obtener_pasarela", lambda env=None: pasarela)
+        monkeypatch.setattr(main, "registro_pagos", RegistroPagos(db["payments"]))
+        for modulo in (pagos, main):
+            monkeypatch.setattr(modulo, "MP_WEBHOOK_SECRET", SECRETO)
+        yield fake
+        await pasarela.cerrar()
+
+
+async def notificar(cliente, payment_id, cabeceras=None):
+    return await cliente.post(
+        "/api/pago/webhook", json={"type": "payment", "data": {"id": payment_id}},
+        headers=firmar(payment_id) if cabeceras is None else cabeceras,
+    )
+
+
+async def validar(cliente, payment_id):
+    r = await cliente.get("/api/pago/validar", params={"payment_id": payment_id})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+async def test_webhook_sigue_las_transiciones_del_pago(cliente, mercadopago):
+    llamadas = mercadopago.state.llamadas
+
+    assert (await notificar(cliente, "1001")).status_code == 200
+    assert (await validar(cliente, "1001"))["status"] == "pending"
+    # pending todavía puede cambiar: cada validación consulta a MercadoPago
+    assert llamadas["pagos"] == 2
+
+    mercadopago.state.status_pago = "approved"
+    assert (await notificar(cliente, "1001")).status_code == 200
+    assert (await validar(cliente, "1001"))["approved"] is True
+    assert llamadas["pagos"] == 3
+
+    # approved se responde desde Mongo, pero un reembolso sí se procesa
+    mercadopago.state.status_pago = "refunded"
+    assert (await notificar(cliente, "1001")).status_code == 200
+    pago = await validar(cliente, "1001")
+    assert (pago["status"], pago["approved"]) == ("refunded", False)
+    assert llamadas["pagos"] == 4
+
+    # refunded es definitivo: las notificaciones siguientes se ignoran
+    assert (await notificar(cliente, "1001")).status_code == 200
+    assert (await validar(cliente, "1001"))["status"] == "refunded"
+    assert llamadas["pagos"] == 4
+
+
+async def test_webhook_sin_firma_valida_no_consulta(cliente, mercadopago, monkeypatch):
+    import main
+
+    assert (await notificar(cliente, "3003", cabeceras={})).status_code == 401
+    otra = firmar("3003")
+    otra["x-request-id"] = "req-2"
+    assert (await notificar(cliente, "3003", cabeceras=otra)).status_code == 401
+
+    # Sin secreto configurado el webhook queda cerrado
+    for modulo in (pagos, main):
+        monkeypatch.setattr(modulo, "MP_WEBHOOK_SECRET", None)
+    assert (await notificar(cliente, "3003")).status_code == 503
+    assert mercadopago.state.llamadas["pagos"] == 0
+
+
+async def test_validaciones_simultaneas_consultan_una_vez(cliente, mercadopago):
+    mercadopago.state.status_pago = "approved"
+
+    respuestas = await asyncio.gather(*(validar(cliente, "2002") for _ in range(20)))
+
+    assert all(r["approved"] for r in respuestas)
+    assert mercadopago.state.llamadas["pagos"] == 1
+
+
+async def test_vuelo_unico_comparte_la_carga_y_reintenta_tras_un_error():
+    vuelos = VueloUnico()
+    cargas = []
+
+    async def cargar(resultado):
+        cargas.append(resultado)
+        await asyncio.sleep(0.01)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+    valores = await asyncio.gather(*(vuelos.hacer("k", lambda: cargar("v")) for _ in range(10)))
+    assert valores == ["v"] * 10
+    assert cargas == ["v"]
+
+    errores = await asyncio.gather(
+        *(vuelos.hacer("k", lambda: cargar(ValueError("falló"))) for _ in range(5)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(e, ValueError) for e in errores)
+    # Terminado el vuelo (con error) la siguiente llamada vuelve a cargar
+    assert await vuelos.hacer("k", lambda: cargar("otra")) == "otra"
+    assert len(cargas) == 3
+
+
+async def test_pasarela_compartida_por_entorno(monkeypatch):
+    monkeypatch.setenv("MP_ENV", "sandbox")
+    try:
+        sandbox = pagos.obtener_pasarela()
+        assert pagos.obtener_pasarela("sandbox") is sandbox
+        assert pagos.obtener_pasarela("production") is not sandbox
+        assert sandbox.client is sandbox.client
+    finally:
+        await pagos.cerrar_pasarelas()
+
+
+async def test_preferencia_por_la_pasarela(mercadopago):
+    pasarela = pagos.obtener_pasarela()
+    preferencia = await pasarela.crear_preferencia({"external_reference": "usuario-1"})
+
+    assert preferencia["external_reference"] == "usuario-1"
+    assert preferencia["id"] == "pref-1"
+
+
+async def test_preferencia_sin_email_es_404(cliente, db, mercadopago):
+    import main
+
+    plan = {"name": "P100", "price": 100.0, "data_limit": "10 GB", "validity_days": 30, "benefits": []}
+    await db["plans"].insert_one(dict(plan))
+    main.catalogo_planes_cache.invalidar()
+    usuario = await db["users"].insert_one({"phone": "+525500000009", "password": "x", "name": "Sin correo",
+                                            "balance": 0.0, "plan": "P100"})
+
+    r = await cliente.post("/api/pago/mercadopago", json={"user_id": str(usuario.inserted_id), "plan": plan})
+
+    assert r.status_code == 404, r.text
+    assert mercadopago.state.llamadas["preferencias"] == 0
+
+
+async def test_checkout_ve_un_plan_creado_en_otro_worker(cliente, db, mercadopago):
+    import main
+
+    await main.version_planes.revisar()
+    _, _, planes = await main.obtener_catalogo_planes()
+    assert "P200" not in planes
+
+    # Otro worker crea el plan y sube la versión; este aún no la revisa
+    plan = {"name": "P200", "price": 200.0, "data_limit": "20 GB", "validity_days": 30, "benefits": []}
+    await db["plans"].insert_one(dict(plan))
+    await db["cache_versions"].update_one({"_id": "planes"}, {"$inc": {"version": 1}}, upsert=True)
+    usuario = await db["users"].insert_one({"phone": "+525500000010", "password": "x", "name": "Con correo",
+                                            "email": "a@b.com", "balance": 0.0, "plan": "P200"})
+
+    r = await cliente.post("/api/pago/mercadopago", json={"user_id": str(usuario.inserted_id), "plan": plan})
+
+    assert r.status_code == 200, r.text
+    assert mercadopago.state.llamadas["preferencias"] == 1
+
+
+def test_firma_webhook(monkeypatch):
+    firma = firmar("1001")["x-signature"]
+
+    assert firma_webhook_valida(firma, "req-1", "1001", secreto=SECRETO)
+    assert not firma_webhook_valida(firma.replace("ts=1700000000", "ts=1700000001"), "req-1", "1001", secreto=SECRETO)
+    assert not firma_webhook_valida(None, "req-1", "1001", secreto=SECRETO)
+    monkeypatch.setattr(pagos, "MP_WEBHOOK_SECRET", None)
+    assert not firma_webhook_valida(firma, "req-1", "1001")
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import rollups
+
+pytestmark = pytest.mark.anyio
+
+USUARIO = ObjectId()
+
+
+def hora(horas_atras: int) -> datetime:
+    return (datetime.utcnow() - timedelta(hours=horas_atras)).replace(minute=0, second=0, microsecond=0)
+
+
+async def acumulado(db, inicio):
+    doc = await db["data_usage_rollups"].find_one(
+        {"userId": USUARIO, "granularidad": "hora", "inicio": inicio}
+    )
+    return doc["bytes"] if doc else 0
+
+
+@pytest.fixture(autouse=True)
+def sin_margen(monkeypatch):
+    monkeypatch.setattr(rollups, "CONSUMO_ROLLUP_RETRASO", 0)
+
+
+async def registrar(db, ts, cantidad: int):
+    """Inserta un registro como lo hace ingesta.py: llega ahora."""
+    await db["data_usage_events"].insert_one({
+        "userId": USUARIO, "ts": ts, "bytes": cantidad, "recibidoEn": datetime.utcnow(),
+    })
+    await asyncio.sleep(0.002)
+
+
+async def test_registros_que_llegan_tarde_se_acumulan(db, monkeypatch):
+    await registrar(db, hora(1), 100)
+    assert await rollups.procesar_pendientes("pruebas") == 1
+    assert await acumulado(db, hora(1)) == 100
+
+    # Un lote de la red trae consumo de hace horas, ya detrás de la marca en ts
+    await registrar(db, hora(5) + timedelta(minutes=10), 40)
+    await registrar(db, hora(1) + timedelta(minutes=5), 2)
+    assert await rollups.procesar_pendientes("pruebas") == 1
+    assert await acumulado(db, hora(5)) == 40
+    assert await acumulado(db, hora(1)) == 102
+
+    # Lo que sigue dentro del margen espera a la siguiente pasada
+    monkeypatch.setattr(rollups, "CONSUMO_ROLLUP_RETRASO", 60)
+    await registrar(db, hora(3), 7)
+    assert await rollups.procesar_pendientes("pruebas") == 0
+    assert await acumulado(db, hora(3)) == 0
+
+
+async def test_registros_sin_recibido_en_se_ubican_por_ts(db):
+    await db["data_usage_events"].insert_one({"userId": USUARIO, "ts": hora(2), "bytes": 9})
+    await rollups.procesar_pendientes("pruebas")
+
+    assert await acumulado(db, hora(2)) == 9
+
+
+async def test_pasada_interrumpida_no_suma_dos_veces(db):
+    await registrar(db, hora(2), 10)
+    await rollups.procesar_pendientes("pruebas")
+
+    # Se simula una pasada que aplicó sus deltas pero no movió la marca
+    marca = await db["rollup_marks"].find_one({"_id": rollups.MARCA})
+    ventana = {"desde": None, "hasta": marca["hasta"]}
+    await db["rollup_marks"].update_one(
+        {"_id": rollups.MARCA},
+        {"$set": {"hasta": None, "pendiente": {"corrida": marca["corrida"], "ventana": ventana}}},
+    )
+    await rollups.procesar_pendientes("pruebas")
+
+    assert await acumulado(db, hora(2)) == 10
+
+
+async def test_reconstruir_respeta_lo_llegado_despues(db):
+    await registrar(db, hora(30), 5)
+    await registrar(db, hora(2), 10)
+    await rollups.procesar_pendientes("pruebas")
+
+    # Llega después de la marca de agua: la reconstrucción no lo cuenta,
+    # la pasada normal sí, y solo una vez
+    await registrar(db, hora(2), 1)
+    await rollups.reconstruir("pruebas")
+
+    assert await acumulado(db, hora(30)) == 5
+    assert await acumulado(db, hora(2)) == 11
+    marca = await db["rollup_marks"].find_one({"_id": rollups.MARCA})
+    assert marca["reconstruccion"] is None and marca["pendiente"] is None
+
+
+async def test_ingesta_marca_la_llegada(db):
+    from ingesta import Ingesta
+
+    async def cuerpo():
+        yield f'{{"userId": "{USUARIO}", "ts": "{hora(8).isoformat()}Z", "bytes": 3}}\n'.encode()
+
+    ingesta = Ingesta()
+    await ingesta.ndjson(cuerpo())
+    assert (await ingesta.terminar())["insertados"] == 1
+    # La marca se trunca al milisegundo; que no caiga en el mismo que la llegada
+    await asyncio.sleep(0.002)
+    assert (await db["data_usage_events"].find_one({}))["recibidoEn"] is not None
+
+    await rollups.procesar_pendientes("pruebas")
+    assert await acumulado(db, hora(8)) == 3
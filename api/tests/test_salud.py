@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from eventos import PublicadorPusher, crear_cliente_pusher
+from salud import OFFLINE, ONLINE, MonitorSalud, RegistroEstado
+
+pytestmark = pytest.mark.anyio
+
+WORKERS = 4
+
+
+class Mongo:
+    """Verificación de Mongo que se puede tirar y levantar."""
+
+    def __init__(self):
+        self.arriba = True
+
+    async def __call__(self):
+        if not self.arriba:
+            raise ConnectionError("Mongo no disponible")
+
+
+@pytest.fixture
+async def workers(db, pusher):
+    """Monitores de varios workers, cada uno con su publicador, y un registro común."""
+    mongo = Mongo()
+    publicadores, monitores = [], []
+    for _ in range(WORKERS):
+        publicador = PublicadorPusher(crear_cliente_pusher(), ventana=0.01)
+        await publicador.iniciar()
+        publicadores.append(publicador)
+        monitores.append(MonitorSalud(
+            {"mongo": mongo}, fallos=1, registro=RegistroEstado(db["api_status"]),
+            al_cambiar=lambda estado, error, p=publicador: p.publicar("estado-api", estado, {"error": error}),
+        ))
+    yield mongo, monitores
+
+    for publicador in publicadores:
+        await publicador.cerrar()
+
+
+async def revisar_todos(monitores):
+    await asyncio.gather(*(m.revisar() for m in monitores))
+    await asyncio.sleep(0.1)
+
+
+def avisos(pusher):
+    return [e["name"] for e in pusher.state.eventos if e["channel"] == "estado-api"]
+
+
+async def test_cada_transicion_se_publica_una_vez(pusher, workers):
+    mongo, monitores = workers
+
+    # Arrancar los workers es solo la línea base
+    await revisar_todos(monitores)
+    assert avisos(pusher) == []
+
+    mongo.arriba = False
+    await revisar_todos(monitores)
+    assert avisos(pusher) == [OFFLINE]
+
+    # Seguir caído no vuelve a avisar
+    await revisar_todos(monitores)
+    mongo.arriba = True
+    await revisar_todos(monitores)
+    assert avisos(pusher) == [OFFLINE, ONLINE]
+    assert all(m.estado == ONLINE for m in monitores)
+
+
+async def test_worker_reciclado_no_avisa(pusher, db, workers):
+    _, monitores = workers
+    await revisar_todos(monitores)
+
+    nuevo = MonitorSalud({"mongo": Mongo()}, registro=RegistroEstado(db["api_status"]),
+                         al_cambiar=lambda *_: pytest.fail("un worker nuevo no debe avisar"))
+    await nuevo.revisar()
+    assert avisos(pusher) == []
+
+
+async def test_cambio_durante_un_reinicio_se_avisa_una_vez(pusher, db, workers):
+    _, monitores = workers
+    # Todos los workers se cayeron con la API offline guardada
+    await db["api_status"].insert_one({"_id": "api", "estado": OFFLINE})
+
+    await revisar_todos(monitores)
+    assert avisos(pusher) == [ONLINE]
+
+
+async def test_listo_solo_despues_de_la_primera_revision(workers):
+    _, monitores = workers
+    assert not monitores[0].ready_ok
+    assert b"iniciando" in monitores[0].ping
+
+    await monitores[0].revisar()
+    assert monitores[0].ready_ok
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from fakes import crear_fake_vonage, servidor_local
+from sms import DespachadorSMS, OutboxLlena
+
+pytestmark = pytest.mark.anyio
+
+
+async def esperar(condicion, limite: float = 5.0):
+    """Reintenta ``condicion`` (async) hasta que sea verdadera o venza ``limite``."""
+    fin = asyncio.get_running_loop().time() + limite
+    while not await condicion():
+        assert asyncio.get_running_loop().time() < fin, "la condición no se cumplió a tiempo"
+        await asyncio.sleep(0.02)
+
+
+async def _sin_pendientes(despachador):
+    return await despachador.contar_pendientes() == 0
+
+
+class OutboxInestable:
+    """Envuelve la outbox y hace fallar las primeras llamadas de ciertos métodos."""
+
+    def __init__(self, outbox, fallas: dict):
+        self._outbox = outbox
+        self.fallas = dict(fallas)
+
+    def __getattr__(self, nombre):
+        metodo = getattr(self._outbox, nombre)
+        if not self.fallas.get(nombre):
+            return metodo
+
+        async def falla(*args, **kwargs):
+            self.fallas[nombre] -= 1
+            raise ConnectionError("Mongo no disponible")
+
+        return falla
+
+
+async def test_send_otp_entrega_el_codigo_por_la_outbox(cliente, db, monkeypatch):
+    import main
+
+    vonage = crear_fake_vonage()
+    async with servidor_local(vonage) as url:
+        despachador = DespachadorSMS(db["sms_outbox"], url=f"{url}/sms/json", workers=2)
+        monkeypatch.setattr(main, "despachador_sms", despachador)
+        await despachador.iniciar()
+        try:
+            r = await cliente.post("/api/auth/send-otp", json={"phone": "+525511112222"})
+            assert r.status_code == 200, r.text
+
+            await esperar(lambda: _sin_pendientes(despachador))
+        finally:
+            await despachador.cerrar()
+
+    codigo = (await db["otp"].find_one({"phone": "+525511112222"}))["code"]
+    assert [(m["to"], m["text"]) for m in vonage.state.recibidos] == [
+        ("+525511112222", f"Tu código Copper Mobil es: {codigo}"),
+    ]
+    # Los enviados se borran de la outbox
+    assert await db["sms_outbox"].count_documents({}) == 0
+
+
+async def test_trabajador_sobrevive_a_errores_de_mongo(db):
+    vonage = crear_fake_vonage()
+    outbox = OutboxInestable(db["sms_outbox"], {"find_one_and_update": 1, "delete_one": 2})
+    async with servidor_local(vonage) as url:
+        despachador = DespachadorSMS(outbox, url=f"{url}/sms/json", workers=1,
+                                     bloqueo=0.2, espera_maxima=0.05)
+        await despachador.iniciar()
+        try:
+            await despachador.encolar("+525533334444", "Tu código Copper Mobil es: 123456")
+            await esperar(lambda: _sin_pendientes(despachador))
+            assert not despachador._tareas[0].done()
+        finally:
+            await despachador.cerrar()
+
+    assert outbox.fallas == {"find_one_and_update": 0, "delete_one": 0}
+    # Al fallar el borrado el mensaje vuelve a enviarse cuando vence su bloqueo
+    assert {m["to"] for m in vonage.state.recibidos} == {"+525533334444"}
+    assert await db["sms_outbox"].count_documents({}) == 0
+
+
+async def test_outbox_llena_cuenta_solo_pendientes(db):
+    despachador = DespachadorSMS(db["sms_outbox"], max_outbox=2)
+    await despachador.encolar("+525500000001", "a")
+    await despachador.encolar("+525500000002", "b")
+    with pytest.raises(OutboxLlena):
+        await despachador.encolar("+525500000003", "c")
+
+    # Los fallidos se quedan para revisión pero ya no ocupan lugar
+    await db["sms_outbox"].update_one({"to": "+525500000001"}, {"$set": {"status": "fallido"}})
+    await despachador.encolar("+525500000003", "c")
+    assert await despachador.contar_pendientes() == 2
@@ -0,0 +1,41 @@
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+EMAIL = "carrera@coppermobile.com"
+
+
+def usuario(phone: str) -> dict:
+    return {"phone": phone, "password": "secreto", "name": "Prueba", "email": EMAIL, "plan": "basico"}
+
+
+@pytest.fixture
+async def carrera(db, monkeypatch):
+    """Otra petición registra el mismo correo entre la validación y el insert."""
+    # mongomock ignora partialFilterExpression; aquí todos los usuarios traen email
+    await db["users"].create_index("email", unique=True)
+    await db["users"].create_index("phone", unique=True)
+    restaurados = []
+
+    async def consumir(phone):
+        await db["users"].insert_one({"phone": "+525599999999", "email": EMAIL})
+        return True
+
+    async def restaurar(phone):
+        restaurados.append(phone)
+
+    monkeypatch.setattr(main, "consumir_verificacion", consumir)
+    monkeypatch.setattr(main, "restaurar_verificacion", restaurar)
+    return restaurados
+
+
+async def test_correo_duplicado_en_carrera_no_crea_otro_usuario(cliente, db, carrera):
+    respuesta = await cliente.post("/api/users/", json=usuario("+525511111111"))
+
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Correo ya registrado"
+    assert await db["users"].count_documents({"email": EMAIL}) == 1
+    # La verificación se devuelve para reintentar con otro correo
+    assert carrera == ["+525511111111"]
@@ -13,6 +13,8 @@ import { NavController } from '@ionic/angular';
 export class HistorialChipsPage implements OnInit {
   // Array de objetos solicitud de chip
   chips: any[] = [];
+  // Cursor de la siguiente página (null cuando ya no hay más)
+  siguienteCursor: string | null = null;
 
   // Estado de filtros y búsqueda
   filtroEstado: string = 'todos';
@@ -54,21 +56,35 @@ export class HistorialChipsPage implements OnInit {
     return filtrados;
   }
 
-  // Llama al endpoint GET /chips/{userId}
+  // Llama al endpoint GET /chips/{userId}: primera página
   async obtenerChips() {
+    this.chips = await this.cargarPagina();
+  }
+
+  // Scroll infinito: agrega la página de next_cursor
+  async cargarMas(event: any) {
+    if (this.siguienteCursor) {
+      this.chips = [...this.chips, ...await this.cargarPagina(this.siguienteCursor)];
+    }
+    event.target.complete();
+  }
+
+  private async cargarPagina(cursor?: string): Promise<any[]> {
     const userId = localStorage.getItem('user_id');
-    if (!userId) return;
+    if (!userId) return [];
 
     try {
       const res = await Http.get({
         url: `${environment.apiUrl}/chips/${userId}`,
         headers: {},
-        params: {}
+        params: cursor ? { cursor } : {}
       });
-      this.chips = res.data?.chips || [];
+      this.siguienteCursor = res.data?.next_cursor || null;
+      return res.data?.chips || [];
     } catch (error) {
       console.error('❌ Error al obtener historial de chips:', error);
-      this.chips = [];
+      this.siguienteCursor = null;
+      return [];
     }
   }
 
@@ -12,6 +12,7 @@ import { NavController } from '@ionic/angular';
 })
 export class HistorialTicketsPage implements OnInit {
   tickets: any[] = [];
+  siguienteCursor: string | null = null;
   filtroEstado: string = 'todos';
   ordenTicket:  string = 'recientes';
   busqueda:      string = '';
@@ -59,20 +60,34 @@ export class HistorialTicketsPage implements OnInit {
     return filtrados;
   }
 
+  // Primera página; las siguientes llegan con el scroll infinito (next_cursor)
   async obtenerTickets() {
+    this.tickets = await this.cargarPagina();
+  }
+
+  async cargarMas(event: any) {
+    if (this.siguienteCursor) {
+      this.tickets = [...this.tickets, ...await this.cargarPagina(this.siguienteCursor)];
+    }
+    event.target.complete();
+  }
+
+  private async cargarPagina(cursor?: string): Promise<any[]> {
     const userId = localStorage.getItem('user_id');
-    if (!userId) return;
+    if (!userId) return [];
 
     try {
       const res = await Http.get({
         url: `${environment.apiUrl}/soporte/${userId}`,
         headers: {},
-        params: {}
+        params: cursor ? { cursor } : {}
       });
-      this.tickets = res.data?.tickets || [];
+      this.siguienteCursor = res.data?.next_cursor || null;
+      return res.data?.tickets || [];
     } catch (error) {
       console.error('❌ Error al obtener historial de tickets:', error);
-      this.tickets = [];
+      this.siguienteCursor = null;
+      return [];
     }
   }
 